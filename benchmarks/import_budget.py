@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+""" Import time budget for the common ``galaxyctl`` commands.
+
+Each command's module is imported (along with ``gravity.cli``) in a fresh interpreter with ``python -X importtime``, and
+the total time spent importing modules, excluding interpreter startup, is compared to the command's budget in
+``BUDGETS`` (or ``--budget``, if given). The budgets are about twice the measured import times, so that a change that
+makes a command noticeably slower to start fails the check. The fastest of ``--repeat`` runs is used, since import time
+only varies upward with the load on the host.
+
+Libraries that only some code paths need (the HTTP stack for readiness checks, ``jsonref`` for sample generation,
+supervisor's RPC client, Galaxy itself) must not be imported by any of these commands, regardless of the budget.
+
+Exits non-zero if any command is over budget or imports one of these libraries.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = ("exec", "list", "status", "start", "stop", "restart", "graceful", "update", "show")
+
+# import time budgets in ms, commands that load the config and process managers import pydantic and more of gravity
+DEFAULT_BUDGET = 120
+BUDGETS = {
+    "list": 550,
+    "update": 450,
+}
+
+# imported by the interpreter before the command is run
+STARTUP_MODULES = ("site", "encodings", "_frozen_importlib_external", "zipimport", "codecs", "io", "abc")
+
+LAZY_MODULES = ("requests", "requests_unixsocket", "jsonref", "supervisor.supervisorctl", "galaxy.config")
+
+
+def importtime(command):
+    """Return the import time in seconds of ``command`` and the names of the modules it imported."""
+    code = f"import gravity.cli, gravity.commands.cmd_{command}"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(BENCHMARKS_DIR), os.environ.get("PYTHONPATH", "")]))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    total = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules.add(name.strip())
+        if not name.startswith("  ") and name.strip() not in STARTUP_MODULES:
+            total += int(cumulative)
+    return total / 1000000, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, help="Maximum import time of each command in ms (default: per command)")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times to import each command")
+    parser.add_argument("--output", "-o", help="Write JSON results to this file")
+    parser.add_argument("commands", nargs="*", default=COMMANDS, help="Commands to check (default: the common commands)")
+    args = parser.parse_args(argv)
+
+    results = []
+    failed = False
+    for command in args.commands:
+        runs = [importtime(command) for _ in range(args.repeat)]
+        seconds = min(t for t, _ in runs)
+        lazy = sorted(m for m in LAZY_MODULES if m in runs[0][1])
+        budget = args.budget or BUDGETS.get(command, DEFAULT_BUDGET)
+        over = seconds * 1000 > budget
+        failed = failed or over or bool(lazy)
+        results.append({"command": command, "min": seconds, "budget": budget / 1000, "lazy_imported": lazy})
+        status = "OVER BUDGET" if over else "ok"
+        print(f"{command:<12} {seconds * 1000:8.1f} ms  (budget {budget:.0f} ms)  {status}", file=sys.stderr)
+        if lazy:
+            print(f"{command:<12} imports {', '.join(lazy)}, which should only be imported when needed", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump({"results": results}, fh, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+""" Benchmarks for Gravity's configuration loading, rendering and update hot paths.
+
+Synthetic Galaxy roots and Gravity configs are generated at scale in a temporary directory, so no Galaxy clone is needed.
+supervisord is never started and ``systemctl`` is replaced with a stub, so ``update`` only writes process manager
+configs into the temporary directory.
+
+Results are written as JSON. Pass a previous result file to ``--compare`` to exit non-zero if any benchmark's median
+time has regressed beyond ``--threshold``.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+import gravity  # noqa: E402
+from gravity.config_manager import ConfigManager  # noqa: E402
+from gravity.process_manager import ProcessExecutor, ProcessManagerRouter  # noqa: E402
+from gravity.settings import Settings  # noqa: E402
+
+RESULTS_SCHEMA_VERSION = 1
+IS_ROOT = os.geteuid() == 0
+
+GALAXY_VERSION_PY = """VERSION_MAJOR = "24.1"
+VERSION_MINOR = "dev0"
+VERSION = VERSION_MAJOR + (f".{VERSION_MINOR}" if VERSION_MINOR else "")
+"""
+
+SYSTEMCTL_STUB = """#!/bin/sh
+for arg in "$@"; do
+    [ "$arg" = "show-environment" ] && echo "PATH=/usr/bin:/bin"
+done
+exit 0
+"""
+
+
+class Fixtures:
+    """Generates synthetic Galaxy roots, Gravity configs and job configs."""
+
+    def __init__(self, root):
+        self.root = root
+        self.bin_dir = os.path.join(root, "bin")
+        os.makedirs(self.bin_dir)
+        systemctl = os.path.join(self.bin_dir, "systemctl")
+        with open(systemctl, "w") as fh:
+            fh.write(SYSTEMCTL_STUB)
+        os.chmod(systemctl, 0o755)
+        self.virtualenv = os.path.join(root, "venv")
+        os.makedirs(os.path.join(self.virtualenv, "bin"))
+        self._count = 0
+
+    def _path(self, *parts):
+        path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def job_conf(self, fmt, destinations, handlers=0):
+        """A job config with many destinations and tool mappings, as found at large sites."""
+        self._count += 1
+        path = self._path("job_conf", f"job_conf_{self._count}.{fmt}")
+        with open(path, "w") as fh:
+            if fmt == "xml":
+                fh.write("<job_conf>\n  <plugins>\n")
+                fh.write("    <plugin id=\"local\" type=\"runner\" load=\"galaxy.jobs.runners.local:LocalJobRunner\"/>\n  </plugins>\n")
+                fh.write("  <handlers assign_with=\"db-skip-locked\">\n")
+                for i in range(handlers):
+                    fh.write(f"    <handler id=\"handler{i}\"/>\n")
+                fh.write("  </handlers>\n  <destinations default=\"dest0\">\n")
+                for i in range(destinations):
+                    fh.write(f"    <destination id=\"dest{i}\" runner=\"local\">\n")
+                    fh.write(f"      <param id=\"nativeSpecification\">--ntasks={i % 64 + 1} --mem={i % 128 + 1}G</param>\n")
+                    fh.write(f"      <env id=\"DEST_{i}\">value{i}</env>\n    </destination>\n")
+                fh.write("  </destinations>\n  <tools>\n")
+                for i in range(destinations):
+                    fh.write(f"    <tool id=\"toolshed/repos/owner/tool{i}/tool{i}/1.0.{i}\" destination=\"dest{i}\"/>\n")
+                fh.write("  </tools>\n</job_conf>\n")
+            else:
+                fh.write("runners:\n  local:\n    load: galaxy.jobs.runners.local:LocalJobRunner\n")
+                fh.write("handling:\n  assign: [db-skip-locked]\n")
+                if handlers:
+                    fh.write("  processes:\n")
+                    for i in range(handlers):
+                        fh.write(f"    handler{i}:\n      environment:\n        HANDLER: '{i}'\n")
+                fh.write("execution:\n  default: dest0\n  environments:\n")
+                for i in range(destinations):
+                    fh.write(f"    dest{i}:\n      runner: local\n      native_specification: --ntasks={i % 64 + 1} --mem={i % 128 + 1}G\n")
+                    fh.write(f"      env:\n        - name: DEST_{i}\n          value: value{i}\n")
+                fh.write("tools:\n")
+                for i in range(destinations):
+                    fh.write(f"  - id: toolshed/repos/owner/tool{i}/tool{i}/1.0.{i}\n    environment: dest{i}\n")
+        return path
+
+    def instance(self, name, process_manager, handlers, job_conf=None, style="gravity", gunicorns=1):
+        """A Galaxy root and combined Galaxy/Gravity config for one instance."""
+        galaxy_root = os.path.join(self.root, "galaxy", name)
+        with open(self._path("galaxy", name, "lib", "galaxy", "version.py"), "w") as fh:
+            fh.write(GALAXY_VERSION_PY)
+        gravity_config = {
+            "instance_name": name,
+            "process_manager": process_manager,
+            "service_command_style": style,
+            "virtualenv": self.virtualenv,
+            "galaxy_root": galaxy_root,
+            "gunicorn": [{"bind": f"unix:{galaxy_root}/gunicorn{i}.sock"} for i in range(gunicorns)] if gunicorns > 1 else {},
+            "tusd": {"enable": True, "upload_dir": os.path.join(galaxy_root, "tus")},
+            "handlers": {"handler": {"processes": handlers, "pools": ["job-handlers", "workflow-schedulers"]}} if handlers else {},
+        }
+        if IS_ROOT:
+            gravity_config["galaxy_user"] = "root"
+        galaxy_config = {"galaxy_infrastructure_url": "http://localhost:8080", "data_dir": os.path.join(galaxy_root, "database")}
+        if job_conf:
+            galaxy_config["job_config_file"] = job_conf
+        else:
+            galaxy_config["job_config"] = {"handling": {"assign": ["db-skip-locked"]}}
+        path = self._path("galaxy", name, "config", "galaxy.yml")
+        with open(path, "w") as fh:
+            json.dump({"gravity": gravity_config, "galaxy": galaxy_config}, fh)
+        return path
+
+    def instances(self, count, process_manager, handlers, **kwargs):
+        self._count += 1
+        return [self.instance(f"bench{self._count}_{i}", process_manager, handlers, **kwargs) for i in range(count)]
+
+    def state_dir(self):
+        return tempfile.mkdtemp(dir=self.root, prefix="state")
+
+
+def _quiet():
+    stack = contextlib.ExitStack()
+    stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+    stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+    return stack
+
+
+def timeit(func, setup=None, repeat=5):
+    times = []
+    for _ in range(repeat):
+        with _quiet():
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+class Runner:
+    def __init__(self, fixtures, repeat, name_filter=None):
+        self.fixtures = fixtures
+        self.repeat = repeat
+        self.name_filter = name_filter
+        self.results = []
+
+    def run(self, name, func, setup=None, repeat=None, **params):
+        if self.name_filter and self.name_filter not in name:
+            return
+        times = timeit(func, setup=setup, repeat=repeat or self.repeat)
+        result = {
+            "name": name,
+            "params": params,
+            "repeat": len(times),
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.mean(times),
+            "max": max(times),
+        }
+        self.results.append(result)
+        param_str = ", ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{name:<28} {param_str:<52} median {result['median'] * 1000:10.2f} ms", file=sys.stderr)
+
+    def skip(self, name, reason, **params):
+        if self.name_filter and self.name_filter not in name:
+            return
+        self.results.append({"name": name, "params": params, "skipped": reason})
+        print(f"{name:<28} skipped: {reason}", file=sys.stderr)
+
+
+def bench_job_config(runner, scale, process_manager):
+    for fmt in ("xml", "yml"):
+        for destinations in scale["destinations"]:
+            job_conf = runner.fixtures.job_conf(fmt, destinations, handlers=10)
+            runner.run("job_config_parse", ConfigManager.get_job_config, setup=lambda: (job_conf,),
+                       format=fmt, destinations=destinations)
+
+
+def bench_config_load(runner, scale, process_manager):
+    fixtures = runner.fixtures
+    for instances in scale["instances"]:
+        for handlers in scale["handlers"]:
+            for fmt in ("xml", "yml"):
+                job_conf = fixtures.job_conf(fmt, scale["destinations"][-1])
+                configs = fixtures.instances(instances, process_manager, handlers, job_conf=job_conf)
+                state_dir = fixtures.state_dir()
+                runner.run("config_load", lambda: ConfigManager(config_file=configs, state_dir=state_dir),
+                           instances=instances, handlers=handlers, job_conf=fmt)
+
+
+def bench_expand_handlers(runner, scale, process_manager):
+    for handlers in scale["handlers"]:
+        config_file = runner.fixtures.instance(f"expand{handlers}", process_manager, handlers)
+        with _quiet():
+            cm = ConfigManager(config_file=[config_file], state_dir=runner.fixtures.state_dir())
+        config = cm.get_config()
+        with open(config_file) as fh:
+            gravity_config = json.load(fh)["gravity"]
+
+        def setup():
+            return (Settings(**gravity_config), config)
+
+        for use_service_instances in (True, False):
+            gravity_config["use_service_instances"] = use_service_instances
+            runner.run("expand_handlers", ConfigManager.expand_handlers, setup=setup,
+                       handlers=handlers, use_service_instances=use_service_instances)
+
+
+def bench_format_vars(runner, scale, process_manager):
+    for style in ("gravity", "direct"):
+        for handlers in scale["handlers"]:
+            config_file = runner.fixtures.instance(f"render{style}{handlers}", process_manager, handlers, style=style)
+            with _quiet():
+                cm = ConfigManager(config_file=[config_file], state_dir=runner.fixtures.state_dir())
+            executor = ProcessExecutor(config_manager=cm)
+            config = cm.get_config()
+            pm_format_vars = {"instance_number": "%i"}
+
+            def render():
+                for service in config.services:
+                    executor._service_format_vars(config, service, pm_format_vars)
+
+            runner.run("service_format_vars", render, service_command_style=style, handlers=handlers,
+                       services=len(config.services))
+
+
+def bench_update(runner, scale, process_manager):
+    fixtures = runner.fixtures
+    if process_manager == "supervisor" and IS_ROOT:
+        runner.skip("update", "Gravity cannot use supervisor as root", process_manager=process_manager)
+        return
+    for instances in scale["instances"]:
+        for handlers in scale["handlers"]:
+            for use_service_instances in (True, False):
+                configs = fixtures.instances(instances, process_manager, handlers)
+
+                def setup():
+                    state_dir = fixtures.state_dir()
+                    os.environ["GRAVITY_SYSTEMD_UNIT_PATH"] = os.path.join(state_dir, "systemd")
+                    os.makedirs(os.environ["GRAVITY_SYSTEMD_UNIT_PATH"])
+                    return (ConfigManager(config_file=configs, state_dir=state_dir, user_mode=True),)
+
+                def update(cm):
+                    ProcessManagerRouter(config_manager=cm).update()
+
+                if not use_service_instances:
+                    for config_file in configs:
+                        with open(config_file) as fh:
+                            config = json.load(fh)
+                        config["gravity"]["use_service_instances"] = False
+                        with open(config_file, "w") as fh:
+                            json.dump(config, fh)
+                runner.run("update", update, setup=setup, process_manager=process_manager, instances=instances,
+                           handlers=handlers, use_service_instances=use_service_instances)
+
+
+def bench_cli_cold_start(runner, scale, process_manager):
+    fixtures = runner.fixtures
+    config_file = fixtures.instance("cli", process_manager, scale["handlers"][-1])
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(BENCHMARKS_DIR)}
+    for args in (["--help"], ["--config-file", config_file, "list"]):
+        cmd = [sys.executable, "-c", "import sys; from gravity.cli import galaxyctl; galaxyctl(sys.argv[1:])", *args]
+        runner.run("cli_cold_start", lambda: subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True),
+                   args=" ".join(args if args[0] != "--config-file" else args[2:]))
+
+
+BENCHMARKS = {
+    "job_config": bench_job_config,
+    "config_load": bench_config_load,
+    "expand_handlers": bench_expand_handlers,
+    "format_vars": bench_format_vars,
+    "update": bench_update,
+    "cli_cold_start": bench_cli_cold_start,
+}
+
+SCALES = {
+    "quick": {"instances": [1, 5], "handlers": [1, 20], "destinations": [100]},
+    "full": {"instances": [1, 10, 50], "handlers": [1, 50, 200], "destinations": [100, 5000]},
+}
+
+
+def compare(results, baseline_path, threshold):
+    """Return the benchmarks whose median time regressed relative to the baseline."""
+    with open(baseline_path) as fh:
+        baseline = json.load(fh)
+
+    def key(result):
+        return (result["name"], json.dumps(result["params"], sort_keys=True))
+
+    baseline_medians = {key(r): r["median"] for r in baseline["results"] if "median" in r}
+    regressions = []
+    for result in results:
+        baseline_median = baseline_medians.get(key(result))
+        if baseline_median and "median" in result and result["median"] > baseline_median * threshold:
+            regressions.append((result, baseline_median))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="quick", help="Size of the synthetic configurations")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times to run each benchmark")
+    parser.add_argument("--process-manager", choices=("supervisor", "systemd"), default="systemd" if IS_ROOT else "supervisor")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--output", "-o", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="Compare against a previous JSON result file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Allowed slowdown relative to --compare")
+    args = parser.parse_args(argv)
+
+    # galaxyctl is used to determine the exec command in the gravity service command style
+    sys.argv[0] = os.path.join(os.path.dirname(sys.executable), "galaxyctl")
+    root = tempfile.mkdtemp(prefix="gravity_bench")
+    saved_environ = dict(os.environ)
+    try:
+        fixtures = Fixtures(root)
+        os.environ["PATH"] = os.pathsep.join([fixtures.bin_dir, os.environ.get("PATH", "")])
+        os.environ.pop("GALAXY_CONFIG_FILE", None)
+        os.environ.pop("GRAVITY_CONFIG_FILE", None)
+        runner = Runner(fixtures, args.repeat, name_filter=args.filter)
+        for func in BENCHMARKS.values():
+            func(runner, SCALES[args.scale], args.process_manager)
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        shutil.rmtree(root, ignore_errors=True)
+
+    output = {
+        "schema_version": RESULTS_SCHEMA_VERSION,
+        "gravity_version": gravity.__version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "scale": args.scale,
+        "process_manager": args.process_manager,
+        "results": runner.results,
+    }
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(output, fh, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        regressions = compare(runner.results, args.compare, args.threshold)
+        for result, baseline_median in regressions:
+            print(f"REGRESSION: {result['name']} {result['params']}: median {result['median'] * 1000:.2f} ms, "
+                  f"baseline {baseline_median * 1000:.2f} ms", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+""" Atomic writes (and removals) of process manager config files.
+
+Files are written to a temporary file in the destination directory and renamed into place, so supervisord and systemd
+never read a partially written config, even if they reread or reload during ``galaxyctl update``. Writes are grouped
+into a :class:`FileTransaction`: all files are staged first and then renamed into place (or removed) together on commit,
+after which each affected directory is fsynced once. If anything fails before the transaction is committed, staged files
+are discarded and files that were already replaced or removed are restored.
+
+Individual files are not fsynced before they are renamed: all of these files are generated, and are rewritten by the
+next ``galaxyctl update`` if they are lost in a crash.
+"""
+import errno
+import os
+import tempfile
+
+import gravity.io
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError as exc:
+        gravity.io.debug(f"Unable to open directory for fsync: {path}: {exc}")
+        return
+    try:
+        os.fsync(fd)
+    except OSError as exc:
+        # not supported on all platforms and filesystems
+        gravity.io.debug(f"Unable to fsync directory: {path}: {exc}")
+    finally:
+        os.close(fd)
+
+
+def _write_temp(path, contents, mode=None):
+    directory = os.path.dirname(path) or os.curdir
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            fh.write(contents)
+        if mode is not None:
+            os.chmod(temp_path, mode)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return temp_path
+
+
+def write_file(path, contents):
+    """Atomically write a single file."""
+    with FileTransaction() as transaction:
+        transaction.write(path, contents)
+
+
+class FileTransaction:
+    """A set of file writes and removals that are committed together.
+
+    Use as a context manager: the transaction is committed when the block exits normally and rolled back if it raises.
+    """
+
+    def __init__(self):
+        self._staged = {}
+        self._removals = set()
+        self._originals = {}
+        self._committed = []
+        self._created_dirs = set()
+        umask = os.umask(0)
+        os.umask(umask)
+        self._default_mode = 0o666 & ~umask
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def _read_original(self, path):
+        if path not in self._originals:
+            try:
+                with open(path) as fh:
+                    self._originals[path] = (fh.read(), os.stat(path).st_mode & 0o7777)
+            except FileNotFoundError:
+                self._originals[path] = None
+
+    def write(self, path, contents):
+        """Stage ``contents`` to be written to ``path`` when the transaction is committed."""
+        directory = os.path.dirname(path) or os.curdir
+        if directory not in self._created_dirs:
+            _makedirs(directory)
+            self._created_dirs.add(directory)
+        self._read_original(path)
+        self._removals.discard(path)
+        if path in self._staged:
+            os.unlink(self._staged.pop(path))
+        # mkstemp creates files with mode 0600, so preserve the mode of the file being replaced or use the default
+        mode = self._originals[path][1] if self._originals[path] is not None else self._default_mode
+        self._staged[path] = _write_temp(path, contents, mode=mode)
+
+    def remove(self, path):
+        """Stage the removal of ``path`` when the transaction is committed."""
+        self._read_original(path)
+        if path in self._staged:
+            os.unlink(self._staged.pop(path))
+        if self._originals[path] is not None:
+            self._removals.add(path)
+
+    def commit(self):
+        """Rename all staged files into place, remove the files staged for removal and fsync their directories."""
+        try:
+            while self._staged:
+                path, temp_path = next(iter(self._staged.items()))
+                os.replace(temp_path, path)
+                del self._staged[path]
+                self._committed.append(path)
+            for path in sorted(self._removals):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                self._removals.discard(path)
+                self._committed.append(path)
+        except BaseException:
+            self.rollback()
+            raise
+        for directory in sorted(set(os.path.dirname(path) or os.curdir for path in self._committed)):
+            _fsync_dir(directory)
+
+    def rollback(self):
+        """Discard staged files and restore the original contents of any files that have already been replaced."""
+        for temp_path in self._staged.values():
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+        self._staged.clear()
+        self._removals.clear()
+        for path in reversed(self._committed):
+            original = self._originals[path]
+            gravity.io.warn(f"Rolling back changes to: {path}")
+            if original is None:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            else:
+                os.replace(_write_temp(path, original[0], mode=original[1]), path)
+        self._committed.clear()
@@ -1,13 +1,16 @@
 """ Command line utilities for managing Galaxy servers
 """
 
+# first, so that the time spent importing everything else is recorded
+from gravity import trace
+
 import os
+import time
 
 import click
 
 from gravity import io
 from gravity import options
-from gravity.settings import ProcessManager
 
 
 CONTEXT_SETTINGS = {
@@ -31,6 +34,13 @@ def set_debug(debug_opt):
         io.DEBUG = True
 
 
+def set_profile(profile, trace_file):
+    if not profile and not trace_file:
+        return
+    trace.enable(report=profile, trace_file=trace_file)
+    trace.record("import gravity.cli", trace.IMPORT_START, CLI_IMPORTED)
+
+
 def list_cmds():
     rv = []
     for filename in os.listdir(cmd_folder):
@@ -57,7 +67,17 @@ class GravityCLI(click.MultiCommand):
     def get_command(self, ctx, name):
         if name in COMMAND_ALIASES:
             name = COMMAND_ALIASES[name]
-        return name_to_command(name)
+        with trace.span("import command", command=name):
+            return name_to_command(name)
+
+    def invoke(self, ctx):
+        # the span starts before --profile is parsed, so spans are recorded provisionally until then
+        trace.begin()
+        try:
+            with trace.span("galaxyctl"):
+                return super().invoke(ctx)
+        finally:
+            trace.finish()
 
 
 # Shortcut for running Galaxy in the foreground
@@ -71,6 +91,8 @@ class GravityCLI(click.MultiCommand):
 @click.pass_context
 def galaxy(ctx, debug, config_file, state_dir, quiet, single_user):
     """Run Galaxy server in the foreground"""
+    from gravity.settings import ProcessManager
+
     set_debug(debug)
     ctx.cm_kwargs = {
         "config_file": config_file,
@@ -90,12 +112,18 @@ def galaxy(ctx, debug, config_file, state_dir, quiet, single_user):
 @options.config_file_option()
 @options.state_dir_option()
 @options.user_mode_option()
+@options.profile_option()
+@options.trace_file_option()
 @click.pass_context
-def galaxyctl(ctx, debug, config_file, state_dir, user):
+def galaxyctl(ctx, debug, config_file, state_dir, user, profile, trace_file):
     """Manage Galaxy server configurations and processes."""
     set_debug(debug)
+    set_profile(profile, trace_file)
     ctx.cm_kwargs = {
         "config_file": config_file,
         "state_dir": state_dir,
         "user_mode": user,
     }
+
+
+CLI_IMPORTED = time.perf_counter()
@@ -1,7 +1,6 @@
 import click
 
 from gravity import options
-from gravity import process_manager
 
 
 @click.command("exec")
@@ -17,5 +16,7 @@ def cli(ctx, instances_services, no_exec, service_instance):
 
     Exactly one service name is required in SERVICES.
     """
+    from gravity import process_manager
+
     with process_manager.process_manager(**ctx.parent.cm_kwargs) as pm:
         pm.exec(instance_names=instances_services, service_instance_number=service_instance, no_exec=no_exec)
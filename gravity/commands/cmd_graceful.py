@@ -1,19 +1,25 @@
 import click
 
 from gravity import options
-from gravity import process_manager
 
 
 @click.command("graceful")
 @options.instances_services_arg()
+@click.option("--changed", is_flag=True, help="Only reload services whose configuration changed since they were last (re)started")
 @click.pass_context
-def cli(ctx, instances_services):
+def cli(ctx, instances_services, changed):
     """Gracefully reload configured services.
 
     If no INSTANCES or SERVICES are provided, all configured services of all configured instances are gracefully
     reloaded.
 
     Specifying INSTANCES and SERVICES limits the operation to only the provided instance name(s) and/or service(s).
+
+    With --changed, only services whose effective configuration (their settings, command and environment, and the
+    Galaxy and job configuration that they load) differs from that with which they were last started, restarted, or
+    gracefully reloaded by galaxyctl are reloaded.
     """
+    from gravity import process_manager
+
     with process_manager.process_manager(**ctx.parent.cm_kwargs) as pm:
-        pm.graceful(instance_names=instances_services)
+        pm.graceful(instance_names=instances_services, changed=changed)
@@ -1,33 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import click
 
 from gravity import config_manager
 
 
+def _live_versions(configs):
+    """Query every gunicorn instance of every config concurrently for its running Galaxy version."""
+    checks = []
+    for config in configs:
+        for service in config.services:
+            if service.service_type != "gunicorn":
+                continue
+            for service_instance in getattr(service, "services", [service]):
+                checks.append((config, service_instance))
+    live_versions = {config.instance_name: [] for config, _ in checks}
+
+    def live_version(service_instance):
+        try:
+            return service_instance.live_version()
+        except Exception:
+            return None
+
+    if checks:
+        with ThreadPoolExecutor(max_workers=min(len(checks), 16)) as executor:
+            for (config, _), version in zip(checks, executor.map(live_version, [c[1] for c in checks])):
+                live_versions[config.instance_name].append(version)
+    return live_versions
+
+
 @click.command("list")
 @click.option("--version", "-v", is_flag=True, default=False, help="Include Galaxy version in output")
+@click.option("--drift", "-d", is_flag=True, default=False,
+              help="Include the running Galaxy version in output and indicate instances running a different version than is on disk")
 @click.pass_context
-def cli(ctx, version):
+def cli(ctx, version, drift):
     """List configured instances.
 
+    With --drift, the running version of Galaxy is read from each instance's gunicorn service(s). Instances with a
+    running version that differs from the version on disk are marked as needing a restart.
+
     aliases: configs
     """
     cols = ["{:<18}", "{}"]
     head = ["INSTANCE NAME", "CONFIG PATH"]
-    if version:
+    if version or drift:
         cols.insert(1, "{:<12}")
         head.insert(1, "VERSION")
+    if drift:
+        cols[2:2] = ["{:<12}", "{:<14}"]
+        head[2:2] = ["LIVE VERSION", "STATUS"]
     cols_str = "  ".join(cols)
     with config_manager.config_manager(**ctx.parent.cm_kwargs) as cm:
         configs = cm.get_configs()
         if configs:
+            live_versions = _live_versions(configs) if drift else {}
             click.echo(cols_str.format(*head))
             for config in configs:
                 row = [
                     config.instance_name,
                     config.gravity_config_file,
                 ]
-                if version:
+                if version or drift:
                     row.insert(1, config.galaxy_version)
+                if drift:
+                    running = [v for v in live_versions.get(config.instance_name, []) if v is not None]
+                    if config.instance_name not in live_versions:
+                        # no gunicorn to ask
+                        status = "unknown"
+                    elif not running:
+                        status = "not running"
+                    elif any(v != row[1] for v in running):
+                        status = "restart needed"
+                    else:
+                        status = "current"
+                    row[2:2] = [",".join(sorted(set(running))) or "-", status]
                 click.echo(cols_str.format(*row))
         else:
             click.echo("No configured instances")
@@ -1,20 +1,29 @@
 import json
+import sys
 
 import click
 
-from gravity import config_manager
+from gravity import completion
 
 
 @click.command("show")
-@click.argument("instance", required=False)
+@click.option("--compiled", "compile_", is_flag=True,
+              help="Output the compiled config (including rendered commands and process manager configs) of all (or the given) instances as JSON Lines")
+@click.argument("instance", required=False, shell_complete=completion.complete_instances)
 @click.pass_context
-def cli(ctx, instance):
+def cli(ctx, compile_, instance):
     """Show details of instance config.
 
     INSTANCE is optional unless there is more than one Galaxy instance configured.
 
     aliases: get
     """
+    from gravity import compiled, config_manager, process_manager
+
+    if compile_:
+        with process_manager.process_manager(**ctx.parent.cm_kwargs) as pm:
+            compiled.dump(pm.compile(instance_names=[instance] if instance else None), sys.stdout)
+        return
     with config_manager.config_manager(**ctx.parent.cm_kwargs) as cm:
         config_data = cm.get_config(instance_name=instance)
         click.echo(json.dumps(config_data.dict(), indent=4))
@@ -1,7 +1,6 @@
 import click
 
 from gravity import options
-from gravity import process_manager
 from gravity.io import info
 
 
@@ -17,6 +16,8 @@ def cli(ctx, instances_services, foreground, quiet=False):
 
     Specifying INSTANCES and SERVICES limits the operation to only the provided instance name(s) and/or service(s).
     """
+    from gravity import process_manager
+
     with process_manager.process_manager(foreground=foreground, **ctx.parent.cm_kwargs) as pm:
         pm.update()
         pm.start(instance_names=instances_services)
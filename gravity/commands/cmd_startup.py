@@ -0,0 +1,49 @@
+import click
+
+from gravity import options
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+@click.command("startup")
+@options.instances_services_arg()
+@click.pass_context
+def cli(ctx, instances_services):
+    """Show recorded service startup times.
+
+    Startup times are only recorded when the `startup_profiler` Gravity option is set. Times are the median over all
+    recorded starts of a service for each Galaxy version, a version whose time to ready is significantly slower than the
+    previous version's is flagged as a regression.
+
+    Specifying INSTANCES and SERVICES limits the output to only the provided instance name(s) and/or service(s).
+    """
+    from gravity import config_manager
+    from gravity.startup_profiler import read_history, summarize_history
+
+    cols = ["{:<18}", "{:<24}", "{:<12}", "{:>6}", "{:>12}", "{:>10}", "{:>10}", "{}"]
+    head = ["INSTANCE NAME", "SERVICE", "VERSION", "STARTS", "FIRST OUTPUT", "PORT BIND", "READY", ""]
+    cols_str = "  ".join(cols)
+    with config_manager.config_manager(**ctx.parent.cm_kwargs) as cm:
+        instance_names = [n for n in instances_services if n in cm.get_configured_instance_names()]
+        service_names = [n for n in instances_services if n not in instance_names]
+        rows = []
+        for config in cm.get_configs(instances=instance_names or None):
+            for summary in summarize_history(read_history(config, service_names=service_names)):
+                rows.append([
+                    config.instance_name,
+                    summary["service_name"],
+                    summary["galaxy_version"] or "unknown",
+                    summary["starts"],
+                    _seconds(summary["first_output"]),
+                    _seconds(summary["port_bind"]),
+                    _seconds(summary["ready"]),
+                    "REGRESSION" if summary["regression"] else "",
+                ])
+        if rows:
+            click.echo(cols_str.format(*head).rstrip())
+            for row in rows:
+                click.echo(cols_str.format(*row).rstrip())
+        else:
+            click.echo("No recorded service startups (hint: set the `startup_profiler` Gravity option)")
@@ -1,7 +1,6 @@
 import click
 
 from gravity import options
-from gravity import process_manager
 
 
 @click.command("stop")
@@ -14,5 +13,7 @@ def cli(ctx, instances_services):
 
     Specifying INSTANCES and SERVICES limits the operation to only the provided instance name(s) and/or service(s).
     """
+    from gravity import process_manager
+
     with process_manager.process_manager(**ctx.parent.cm_kwargs) as pm:
         pm.stop(instance_names=instances_services)
@@ -0,0 +1,127 @@
+""" Compiled configs, as output by ``galaxyctl show --compiled``.
+
+A compiled config is a JSON Lines artifact containing everything Gravity resolves from the Gravity and Galaxy configs:
+instance configs, expanded services with the exact commands, environments and working directories they are executed
+with, and the contents of the process manager config files. It can be loaded with :func:`load` without Gravity or
+Galaxy configs (or pydantic), and because records are written in a stable order with sorted keys, compiled configs
+from different deployments can be compared with ``diff``.
+
+Each line is a JSON object with a ``type``:
+
+``header``
+    Always the first record: the artifact ``format`` (:data:`COMPILED_FORMAT`), ``gravity_version``, and the list of
+    ``instances`` in the artifact.
+``instance``
+    An instance's resolved Gravity config (``config``, without services) and ``process_manager``.
+``service``
+    A service of ``instance_name``: ``service_name``, ``service_type``, ``settings`` (or for services with multiple
+    instances, ``services``, as in ``galaxyctl show``), and ``exec_specs``, the ``command``, ``argv``, ``env``,
+    ``cwd`` and ``umask`` of each of its service instances.
+``pm_file``
+    A process manager config file (or exec spec) of ``instance_name``: ``path``, ``name``, ``file_type`` and
+    ``contents``.
+
+The format is incremented when records or fields are changed or removed, adding fields does not change it.
+"""
+import json
+
+import gravity.io
+from gravity import __version__, placement
+
+COMPILED_FORMAT = 1
+
+
+def _exec_specs(process_executor, config, service):
+    if service.count > 1:
+        service_instances = [service.get_service_instance(i) for i in range(0, service.count)]
+    else:
+        service_instances = [service]
+    apply_placement = not placement.in_systemd_unit(config, service)
+    return [process_executor.exec_spec(config, service_instance, apply_placement=apply_placement) for service_instance in service_instances]
+
+
+def compile_configs(configs, process_executor, process_managers):
+    """Yield the compiled config records for ``configs``.
+
+    :param process_executor: :class:`gravity.process_manager.ProcessExecutor` used to render exec specs
+    :param process_managers: dict of process manager name to process manager, used to render process manager files
+    """
+    yield {
+        "type": "header",
+        "format": COMPILED_FORMAT,
+        "gravity_version": __version__,
+        "instances": [config.instance_name for config in configs],
+    }
+    for config in configs:
+        instance_name = config.instance_name
+        yield {
+            "type": "instance",
+            "instance_name": instance_name,
+            "process_manager": config.process_manager,
+            "config": config.dict(exclude={"services"}),
+        }
+        for service in config.services:
+            yield {
+                "type": "service",
+                "instance_name": instance_name,
+                "service_type": service.service_type,
+                **service.dict(),
+                "exec_specs": _exec_specs(process_executor, config, service),
+            }
+        for path, contents, name, file_type in process_managers[config.process_manager].render_pm_files(config):
+            yield {
+                "type": "pm_file",
+                "instance_name": instance_name,
+                "path": path,
+                "name": name,
+                "file_type": file_type,
+                "contents": contents,
+            }
+
+
+def dump(records, fh):
+    for record in records:
+        fh.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def load(fh):
+    """Load a compiled config from the file-like object ``fh``.
+
+    Returns a dict with the ``format`` and ``gravity_version`` of the artifact and ``instances``, a dict of instance
+    name to the instance record, with the instance's ``services`` (a dict of service name to service record) and
+    ``pm_files`` (a list of pm_file records) added.
+    """
+    header = None
+    instances = {}
+    for line_number, line in enumerate(fh, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            gravity.io.exception(f"Invalid compiled config record on line {line_number}: {exc}")
+        record_type = record.get("type")
+        if header is None:
+            if record_type != "header":
+                gravity.io.exception("Compiled config does not begin with a header record")
+            if record.get("format") != COMPILED_FORMAT:
+                gravity.io.exception(
+                    f"Unsupported compiled config format {record.get('format')}, this version of Gravity supports format "
+                    f"{COMPILED_FORMAT}")
+            header = record
+        elif record_type == "instance":
+            instances[record["instance_name"]] = dict(record, services={}, pm_files=[])
+        elif record_type in ("service", "pm_file"):
+            try:
+                instance = instances[record["instance_name"]]
+            except KeyError:
+                gravity.io.exception(f"Compiled config record on line {line_number} precedes its instance record")
+            if record_type == "service":
+                instance["services"][record["service_name"]] = record
+            else:
+                instance["pm_files"].append(record)
+        else:
+            gravity.io.exception(f"Unknown compiled config record type on line {line_number}: {record_type}")
+    if header is None:
+        gravity.io.exception("Compiled config is empty")
+    return {"format": header["format"], "gravity_version": header["gravity_version"], "instances": instances}
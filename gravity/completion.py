@@ -0,0 +1,133 @@
+""" Shell completion of instance, service and process manager program names.
+
+Completing these names from the configuration would require loading it, which takes far longer than completion should,
+so ``galaxyctl update`` writes an index of the names of each instance to the Gravity state directory (``--state-dir``,
+or ``~/.config/galaxy-gravity`` if unset), along with the signature (modification time and size) of the Gravity, Galaxy
+and job config files that they were loaded from. Completion only reads the index, and ignores the instances whose
+config files have changed since it was written, until the next ``galaxyctl update``.
+
+Completion is enabled in the usual way for click programs, e.g. for bash::
+
+    eval "$(_GALAXYCTL_COMPLETE=bash_source galaxyctl)"
+
+This module is imported when completing, so it must not import any of the modules used to load the configuration.
+"""
+import json
+import os
+
+import gravity.io
+from gravity.atomic import write_file
+from gravity.locks import lock
+
+INDEX_FILE_NAME = "completion.json"
+INDEX_VERSION = 1
+
+# the same as the default supervisor state dir, which is shared by all instances
+DEFAULT_INDEX_DIR = os.path.join(
+    os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser(os.path.join("~", ".config")), "galaxy-gravity")
+
+
+def index_path(state_dir=None):
+    return os.path.join(state_dir or DEFAULT_INDEX_DIR, INDEX_FILE_NAME)
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def read_index(state_dir=None):
+    try:
+        with open(index_path(state_dir)) as fh:
+            index = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("instances") or {}
+
+
+def _instance_entry(config, program_names):
+    config_files = {config.gravity_config_file, config.galaxy_config_file, config.job_config_file} - {None}
+    return {
+        "config_file": config.gravity_config_file,
+        "signature": {path: _signature(path) for path in sorted(config_files)},
+        "services": sorted(s.service_name for s in config.services),
+        "programs": program_names,
+    }
+
+
+def update_index(state_dir, configs, program_names, remove=False):
+    """Write the names of the instances in ``configs`` to the completion index (or remove them if ``remove`` is set).
+
+    ``program_names`` is called with each config to get the names of its process manager programs or units. The other
+    instances loaded from the same config files are replaced, so instances removed from a config file are removed from
+    the index, as are instances whose config files no longer exist.
+    """
+    if not configs:
+        return
+    path = index_path(state_dir)
+    loaded = {c.gravity_config_file for c in configs}
+    try:
+        with lock(f"{path}.lock", "completion index"):
+            instances = {
+                name: entry for name, entry in read_index(state_dir).items()
+                if entry["config_file"] not in loaded and os.path.exists(entry["config_file"])
+            }
+            if not remove:
+                for config in configs:
+                    instances[config.instance_name] = _instance_entry(config, program_names(config))
+            write_file(path, json.dumps({"version": INDEX_VERSION, "instances": instances}, indent=1, sort_keys=True))
+    except OSError as exc:
+        gravity.io.debug(f"Unable to update completion index {path}: {exc}")
+
+
+def _config_files(params):
+    # in the same order as the config manager: --config-file, $GRAVITY_CONFIG_FILE, then $GALAXY_CONFIG_FILE
+    if params.get("config_file"):
+        return list(params["config_file"])
+    if os.environ.get("GRAVITY_CONFIG_FILE"):
+        return [os.path.abspath(p) for p in os.environ["GRAVITY_CONFIG_FILE"].split(os.pathsep) if p]
+    if os.environ.get("GALAXY_CONFIG_FILE"):
+        return [os.path.abspath(os.environ["GALAXY_CONFIG_FILE"])]
+    return None
+
+
+def _indexed_instances(ctx):
+    """Return the index entries of the instances that the command being completed would operate on."""
+    params = ctx.find_root().params
+    config_files = _config_files(params)
+    entries = {}
+    for name, entry in read_index(params.get("state_dir")).items():
+        if config_files and entry["config_file"] not in config_files:
+            continue
+        if any(_signature(path) != signature for path, signature in entry["signature"].items()):
+            continue
+        entries[name] = entry
+    return entries
+
+
+def _matching(names, incomplete, exclude=()):
+    return sorted(n for n in set(names) if n.startswith(incomplete) and n not in exclude)
+
+
+def complete_instances(ctx, param, incomplete):
+    return _matching(_indexed_instances(ctx), incomplete)
+
+
+def complete_instances_services(ctx, param, incomplete):
+    names = []
+    for name, entry in _indexed_instances(ctx).items():
+        names.append(name)
+        names.extend(entry["services"])
+    return _matching(names, incomplete, exclude=ctx.params.get(param.name) or ())
+
+
+def complete_programs(ctx, param, incomplete):
+    names = []
+    for entry in _indexed_instances(ctx).values():
+        names.extend(entry["programs"])
+    return _matching(names, incomplete, exclude=ctx.params.get(param.name) or ())
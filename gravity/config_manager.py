@@ -1,19 +1,26 @@
 """ Galaxy Process Management superclass and utilities
 """
+import concurrent.futures
 import contextlib
 import glob
 import logging
 import os
-import xml.etree.ElementTree as elementtree
 from typing import Union
 
 try:
     from pydantic.v1 import ValidationError
 except ImportError:
     from pydantic import ValidationError
-from yaml import safe_load
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore
 
 import gravity.io
+from gravity import placement, trace
+from gravity.job_config import handlers_from_dict, handlers_from_file
 from gravity.settings import (
     ProcessManager,
     Settings,
@@ -40,6 +47,37 @@ OPTIONAL_APP_KEYS = (
     "galaxy_url_prefix",
 )
 
+# Config files are parsed concurrently when loading at least this many (e.g. from gravity.d), below this the cost of
+# starting worker processes outweighs the gain
+PARALLEL_LOAD_MIN_FILES = 4
+
+
+def _read_yaml(path):
+    with open(path) as fh:
+        return yaml.load(fh, Loader=SafeLoader)
+
+
+def _parse_config_file(config_file):
+    """Parse a Gravity or Galaxy config file and the Galaxy config file(s) it references, returning a dict of path to
+    parsed contents.
+
+    Called in a worker process. Errors are ignored so that the file is parsed again and the error reported (in order)
+    when the config is loaded.
+    """
+    parsed = {}
+    try:
+        config_dict = parsed[config_file] = _read_yaml(config_file)
+        gravity_config = config_dict.get(ConfigManager.gravity_config_section)
+        for gravity_config_dict in gravity_config if isinstance(gravity_config, list) else [gravity_config]:
+            app_config_file = (gravity_config_dict or {}).get(ConfigManager.app_config_file_option)
+            if app_config_file:
+                # join() returns app_config_file if it is absolute, matching __load_app_config_file()
+                app_config_file = os.path.join(os.path.dirname(config_file), app_config_file)
+                parsed[app_config_file] = _read_yaml(app_config_file)
+    except Exception:
+        pass
+    return parsed
+
 
 @contextlib.contextmanager
 def config_manager(config_file=None, state_dir=None, user_mode=None, process_manager=None):
@@ -58,6 +96,7 @@ class ConfigManager(object):
 
     def __init__(self, config_file=None, state_dir=None, user_mode=None, process_manager=None):
         self.__configs = {}
+        self.__parsed = {}
         self.state_dir = None
         if state_dir is not None:
             # convert from pathlib.Path
@@ -68,8 +107,7 @@ class ConfigManager(object):
         gravity.io.debug(f"Gravity state dir: {state_dir}")
 
         if config_file:
-            for cf in config_file:
-                self.load_config_file(cf)
+            self.load_config_files(config_file)
         else:
             self.auto_load()
 
@@ -77,14 +115,56 @@ class ConfigManager(object):
     def is_root(self):
         return os.geteuid() == 0
 
+    def load_config_files(self, config_files):
+        """Load multiple config files.
+
+        If there are enough of them, the files are parsed concurrently, but they are always loaded in the order given,
+        so the resulting instance order, duplicate instance name detection, and error reporting are the same as when
+        loading each with :meth:`load_config_file`.
+        """
+        config_files = list(config_files)
+        if len(config_files) >= PARALLEL_LOAD_MIN_FILES:
+            with trace.span("parse config files", count=len(config_files)):
+                self.__parse_config_files(config_files)
+        try:
+            for config_file in config_files:
+                self.load_config_file(config_file)
+        finally:
+            self.__parsed.clear()
+
+    def __parse_config_files(self, config_files):
+        # YAML parsing is CPU bound and holds the GIL, so it's done in processes rather than threads
+        max_workers = min(len(config_files), os.cpu_count() or 1)
+        if max_workers < 2:
+            return
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for parsed in executor.map(_parse_config_file, config_files):
+                    self.__parsed.update(parsed)
+        except (OSError, NotImplementedError, concurrent.futures.BrokenExecutor) as exc:
+            # e.g. no /dev/shm, fall back to parsing files as they are loaded
+            gravity.io.debug(f"Unable to parse config files concurrently: {exc}")
+
+    def __read_config_file(self, path):
+        # each parsed config is used once since loading modifies it
+        if path in self.__parsed:
+            return self.__parsed.pop(path)
+        return _read_yaml(path)
+
     def load_config_file(self, config_file):
-        with open(config_file) as config_fh:
-            try:
-                config_dict = safe_load(config_fh)
-            except Exception as exc:
-                # this should always be a parse error, access errors will be caught by click
-                gravity.io.error(f"Failed to parse config: {config_file}")
-                gravity.io.exception(exc)
+        with trace.span("load config file", path=config_file):
+            self.__load_config_file(config_file)
+
+    def __load_config_file(self, config_file):
+        try:
+            config_dict = self.__read_config_file(config_file)
+        except OSError:
+            # access errors will be caught by click
+            raise
+        except Exception as exc:
+            # this should always be a parse error
+            gravity.io.error(f"Failed to parse config: {config_file}")
+            gravity.io.exception(exc)
 
         if type(config_dict) is not dict:
             gravity.io.exception(f"Config file does not look like valid Galaxy or Gravity configuration file: {config_file}")
@@ -121,12 +201,11 @@ class ConfigManager(object):
         if not os.path.isabs(app_config_file):
             app_config_file = os.path.join(os.path.dirname(gravity_config_file), app_config_file)
         try:
-            with open(app_config_file) as config_fh:
-                _app_config_dict = safe_load(config_fh)
-                if server_section not in _app_config_dict:
-                    # we let a missing galaxy config slide in other scenarios but if you set the option to something
-                    # that doesn't contain a galaxy section that's almost surely a mistake
-                    gravity.io.exception(f"Galaxy config file does not contain a {server_section} section: {app_config_file}")
+            _app_config_dict = self.__read_config_file(app_config_file)
+            if server_section not in _app_config_dict:
+                # we let a missing galaxy config slide in other scenarios but if you set the option to something
+                # that doesn't contain a galaxy section that's almost surely a mistake
+                gravity.io.exception(f"Galaxy config file does not contain a {server_section} section: {app_config_file}")
             app_config = _app_config_dict[server_section] or {}
             app_config["__file__"] = app_config_file
             return app_config
@@ -184,6 +263,10 @@ class ConfigManager(object):
             if app_key in app_config:
                 app_config_dict[app_key] = app_config[app_key]
 
+        systemd_slices = None
+        if gravity_settings.systemd_slices is not None:
+            systemd_slices = {k: v.dict() for k, v in gravity_settings.systemd_slices.items()}
+
         config = ConfigFile(
             app_config=app_config_dict,
             gravity_config_file=gravity_config_file,
@@ -198,6 +281,11 @@ class ConfigManager(object):
             galaxy_group=gravity_settings.galaxy_group,
             umask=gravity_settings.umask,
             memory_limit=gravity_settings.memory_limit,
+            restart=gravity_settings.restart.dict(),
+            startup_profiler=gravity_settings.startup_profiler,
+            systemd_notify=gravity_settings.systemd_notify,
+            systemd_slices=systemd_slices,
+            load_balancer=gravity_settings.load_balancer.dict() if gravity_settings.load_balancer else None,
             gravity_data_dir=gravity_data_dir,
             log_dir=log_dir,
         )
@@ -207,10 +295,12 @@ class ConfigManager(object):
             config.services.extend(service_for_service_type(service_type).services_if_enabled(config, gravity_settings))
 
         # load any static handlers defined in the galaxy job config
-        assign_with = self.create_static_handler_services(config, app_config)
+        with trace.span("create static handler services"):
+            assign_with = self.create_static_handler_services(config, app_config)
 
         # load any dynamic handlers defined in the gravity config
-        self.create_dynamic_handler_services(gravity_settings, config, assign_with)
+        with trace.span("create dynamic handler services"):
+            self.create_dynamic_handler_services(gravity_settings, config, assign_with)
 
         for service in config.services:
             gravity.io.debug(f"Configured {service.service_type} type service: {service.service_name}")
@@ -219,8 +309,11 @@ class ConfigManager(object):
         self.__configs[config.instance_name] = config
         return config
 
-    def create_static_handler_services(self, config: ConfigFile, app_config: dict):
-        assign_with = None
+    @staticmethod
+    def find_job_config(config: ConfigFile, app_config: dict):
+        """Return the Galaxy job config of an instance: the path to the job config file, the job config itself if it is
+        embedded in the Galaxy config, or ``None`` if there is no job config.
+        """
         if not app_config.get("job_config_file") and app_config.get("job_config"):
             # config embedded directly in Galaxy config
             job_config = app_config["job_config"]
@@ -238,9 +331,16 @@ class ConfigManager(object):
                 job_config = os.path.abspath(os.path.join(config_dir, job_config))
                 if not os.path.exists(job_config):
                     job_config = None
+        return job_config
+
+    def create_static_handler_services(self, config: ConfigFile, app_config: dict):
+        assign_with = None
+        job_config = self.find_job_config(config, app_config)
+        if isinstance(job_config, str):
+            config.job_config_file = job_config
         if job_config:
             # parse job conf for any *static* standalone handlers
-            assign_with, handler_settings_list = ConfigManager.get_job_config(job_config)
+            assign_with, handler_settings_list = ConfigManager.get_job_config(job_config, cache_dir=config.gravity_data_dir)
             for handler_settings in handler_settings_list:
                 config.services.append(service_for_service_type("standalone")(
                     config=config,
@@ -254,15 +354,23 @@ class ConfigManager(object):
         # settings directly. this can be a bit confusing but is probably ok since there are 3 ways to configure
         # handlers, and gravity is only 1 of them.
         assign_with = assign_with or []
-        expanded_handlers = self.expand_handlers(gravity_settings, config)
+        with trace.span("expand handlers"):
+            expanded_handlers = self.expand_handlers(gravity_settings, config)
         if expanded_handlers and "db-skip-locked" not in assign_with and "db-transaction-isolation" not in assign_with:
             gravity.io.warn(
                 "Dynamic handlers are configured in Gravity but Galaxy is not configured to assign jobs to handlers "
                 "dynamically, so these handlers will not handle jobs. Set the job handler assignment method in the "
                 "Galaxy job configuration to `db-skip-locked` or `db-transaction-isolation` to fix this.")
+        standalone_service = service_for_service_type("standalone")
+        # handlers expanded from the same handler config share the same settings, which only need to be validated once
+        validated_settings = {}
         for service_name, handler_settings in expanded_handlers.items():
+            if not isinstance(handler_settings, list):
+                if id(handler_settings) not in validated_settings:
+                    validated_settings[id(handler_settings)] = standalone_service.validate_settings(config, handler_settings)
+                handler_settings = validated_settings[id(handler_settings)]
             config.services.extend(
-                service_for_service_type("standalone").services_if_enabled(
+                standalone_service.services_if_enabled(
                     config,
                     gravity_settings=gravity_settings,
                     settings=handler_settings,
@@ -295,7 +403,7 @@ class ConfigManager(object):
                     instance["server_name"] = expanded_service_name
                     instances.append(instance)
                 elif expanded_service_name not in expanded_handlers:
-                    expanded_handlers[expanded_service_name] = handler_config
+                    expanded_handlers[expanded_service_name] = placement.assign_numa_node(handler_config, index)
                 else:
                     gravity.io.warn(f"Duplicate handler name after expansion: {expanded_service_name}")
             if use_list:
@@ -303,35 +411,13 @@ class ConfigManager(object):
         return expanded_handlers
 
     @staticmethod
-    def get_job_config(conf: Union[str, dict]):
+    def get_job_config(conf: Union[str, dict], cache_dir=None):
         """Extract handler names from job_conf.xml"""
         # TODO: use galaxy job conf parsing
-        assign_with = None
-        rval = []
-        if isinstance(conf, str):
-            if conf.endswith('.xml'):
-                root = elementtree.parse(conf).getroot()
-                handlers = root.find("handlers")
-                assign_with = (handlers or {}).get("assign_with")
-                if assign_with:
-                    assign_with = [a.strip() for a in assign_with.split(",")]
-                for handler in (handlers or []):
-                    rval.append({"service_name": handler.attrib["id"]})
-            elif conf.endswith(('.yml', '.yaml')):
-                with open(conf) as job_conf_fh:
-                    conf = safe_load(job_conf_fh.read())
-            else:
-                gravity.io.exception(f"Unknown job config file type: {conf}")
-        if isinstance(conf, dict):
-            handling = conf.get('handling') or {}
-            assign_with = handling.get('assign', [])
-            processes = handling.get('processes') or {}
-            for handler_name, handler_options in processes.items():
-                rval.append({
-                    "service_name": handler_name,
-                    "environment": (handler_options or {}).get("environment", None)
-                })
-        return (assign_with, rval)
+        with trace.span("parse job config", path=conf if isinstance(conf, str) else "(embedded)"):
+            if isinstance(conf, str):
+                return handlers_from_file(conf, cache_dir=cache_dir)
+            return handlers_from_dict(conf)
 
     @property
     def instance_count(self):
@@ -405,7 +491,6 @@ class ConfigManager(object):
                 "default config. Use -c / --config-file or set $GALAXY_CONFIG_FILE to specify a config file."
             )
             self.__load_config({}, {})
-        for config in configs:
-            self.load_config_file(os.path.abspath(config))
-            if not load_all:
-                return
+        if not load_all:
+            configs = configs[:1]
+        self.load_config_files(os.path.abspath(config) for config in configs)
@@ -0,0 +1,155 @@
+""" Fingerprints of the effective configuration of services, used by ``galaxyctl graceful --changed``.
+
+The fingerprint of a service is a hash of its settings, its exec specs (command, environment, working directory, etc.
+of each of its instances) and, for services that load the Galaxy configuration, the Galaxy configuration and the job
+configuration. The fingerprints of services are recorded when they are started, restarted or gracefully reloaded by
+galaxyctl, and forgotten when they are stopped, so that ``graceful --changed`` can reload only those services whose
+fingerprint differs from the one recorded for the generation that is running.
+
+The exec specs are hashed separately from the rest, since services that are reloaded with SIGHUP (e.g. a single gunicorn)
+keep the command line and environment that they were started with: their fingerprint is only recorded on reload if their
+exec specs are unchanged.
+"""
+import hashlib
+import json
+import os
+
+import gravity.io
+from gravity import placement
+from gravity.atomic import write_file
+from gravity.config_manager import _read_yaml, ConfigManager
+
+FINGERPRINT_DIR_NAME = "fingerprints"
+
+
+def fingerprints_path(config):
+    return os.path.join(config.gravity_data_dir, FINGERPRINT_DIR_NAME, f"{config.instance_name}.json")
+
+
+def _hash(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _file_hash(path):
+    try:
+        with open(path, "rb") as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _galaxy_config_hashes(config):
+    # only the galaxy section is hashed, since changes to the gravity section of the same file only affect the services
+    # whose settings changed
+    try:
+        app_config = (_read_yaml(config.galaxy_config_file) or {}).get(ConfigManager.galaxy_server_config_section) or {}
+    except Exception as exc:
+        gravity.io.debug(f"Unable to read Galaxy config file {config.galaxy_config_file}: {exc}")
+        return {"galaxy_config": _file_hash(config.galaxy_config_file), "job_config": None}
+    job_config = ConfigManager.find_job_config(config, app_config)
+    return {
+        "galaxy_config": _hash(app_config),
+        # an embedded job config is part of the galaxy config
+        "job_config": _file_hash(job_config) if isinstance(job_config, str) else None,
+    }
+
+
+def _loads_galaxy_config(service):
+    return "{galaxy_conf}" in service.command_template or "GALAXY_CONFIG_FILE" in service.default_environment
+
+
+def service_fingerprint(process_executor, config, service, galaxy_config_hashes=None):
+    """Return the fingerprint of a service (or list of service instances)."""
+    instances = getattr(service, "services", [service])
+    apply_placement = not placement.in_systemd_unit(config, service)
+    exec_specs = [process_executor.exec_spec(config, i, apply_placement=apply_placement) for i in instances]
+    data = {"service": service.dict()}
+    if _loads_galaxy_config(service):
+        data.update(galaxy_config_hashes or _galaxy_config_hashes(config))
+    if service.settings.get("config_file"):
+        # e.g. the reports config
+        data["config_file"] = _file_hash(service.settings["config_file"])
+    return {"exec_specs": _hash(exec_specs), "config": _hash(data)}
+
+
+def service_fingerprints(process_executor, config, services):
+    """Return a dict of the fingerprints of ``services`` by service name."""
+    galaxy_config_hashes = _galaxy_config_hashes(config)
+    return {s.service_name: service_fingerprint(process_executor, config, s, galaxy_config_hashes) for s in services}
+
+
+def read_fingerprints(config):
+    """Return the recorded fingerprints of the services of an instance, unreadable fingerprints are treated as absent."""
+    path = fingerprints_path(config)
+    try:
+        with open(path) as fh:
+            fingerprints = json.load(fh)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        gravity.io.warn(f"Ignoring unreadable service fingerprints {path}: {exc}")
+        return {}
+    if not isinstance(fingerprints, dict):
+        gravity.io.warn(f"Ignoring unreadable service fingerprints {path}")
+        return {}
+    return {k: v for k, v in fingerprints.items() if isinstance(v, dict) and "exec_specs" in v}
+
+
+def _write_fingerprints(config, fingerprints):
+    # services that are no longer configured are not recorded
+    configured = set(s.service_name for s in config.services)
+    fingerprints = {k: v for k, v in fingerprints.items() if k in configured}
+    try:
+        write_file(fingerprints_path(config), json.dumps(fingerprints, indent=1, sort_keys=True) + "\n")
+    except OSError as exc:
+        gravity.io.warn(f"Unable to record service fingerprints, `graceful --changed` will reload all services: {exc}")
+
+
+def record(process_executor, config, services, only_missing=False):
+    """Record the current fingerprints of ``services``, or if ``only_missing`` is set, of those that have none."""
+    fingerprints = read_fingerprints(config)
+    if only_missing:
+        services = [s for s in services if s.service_name not in fingerprints]
+    if not services:
+        return
+    fingerprints.update(service_fingerprints(process_executor, config, services))
+    _write_fingerprints(config, fingerprints)
+
+
+def record_reloaded(process_executor, config, services):
+    """Record the current fingerprints of ``services`` once they have been reloaded in place (with SIGHUP).
+
+    Reloading does not change the command line or environment of a service, so those whose exec specs differ from the
+    recorded ones keep their recorded fingerprint, and are returned.
+    """
+    fingerprints = read_fingerprints(config)
+    current = service_fingerprints(process_executor, config, services)
+    stale = []
+    for service in services:
+        recorded = fingerprints.get(service.service_name)
+        if recorded is None:
+            continue
+        if recorded["exec_specs"] == current[service.service_name]["exec_specs"]:
+            fingerprints[service.service_name] = current[service.service_name]
+        else:
+            stale.append(service)
+    _write_fingerprints(config, fingerprints)
+    return stale
+
+
+def forget(config, services=None):
+    """Forget the recorded fingerprints of ``services`` (or all services) of an instance, e.g. once they are stopped."""
+    if services is None:
+        fingerprints = {}
+    else:
+        names = set(s.service_name for s in services)
+        fingerprints = {k: v for k, v in read_fingerprints(config).items() if k not in names}
+    if fingerprints or os.path.exists(fingerprints_path(config)):
+        _write_fingerprints(config, fingerprints)
+
+
+def changed_services(process_executor, config, services):
+    """Return those of ``services`` whose fingerprint differs from the recorded one (or that have none recorded)."""
+    recorded = read_fingerprints(config)
+    current = service_fingerprints(process_executor, config, services)
+    return [s for s in services if recorded.get(s.service_name) != current[s.service_name]]
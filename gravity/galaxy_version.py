@@ -0,0 +1,121 @@
+""" Determine the version of Galaxy on disk and running.
+
+Galaxy's version is defined in ``lib/galaxy/version.py``, which is parsed rather than executed, and the result cached
+until the file changes. If it uses expressions other than those that Galaxy uses to construct its version, the string
+literals assigned to ``VERSION``, or ``VERSION_MAJOR`` and ``VERSION_MINOR``, are used.
+"""
+import ast
+import importlib.util
+import os
+import re
+
+import gravity.io
+from gravity.util import http_check
+
+# if galaxy.version cannot be found the version may still be available from the package metadata
+GALAXY_DISTRIBUTIONS = ("galaxy-app", "galaxy-util")
+
+_cache = {}
+
+_VERSION_ASSIGNMENT_RE = re.compile(r"""^(VERSION(?:_MAJOR|_MINOR)?)\s*=\s*(["'])(.*?)\2\s*(?:#.*)?$""", re.MULTILINE)
+
+
+class _UnsupportedExpression(Exception):
+    pass
+
+
+def _evaluate(node, names):
+    """Evaluate the limited subset of expressions that are used to construct Galaxy's version string."""
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        pass
+    if isinstance(node, ast.Name) and node.id in names:
+        return names[node.id]
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return _evaluate(node.left, names) + _evaluate(node.right, names)
+    elif isinstance(node, ast.IfExp):
+        return _evaluate(node.body if _evaluate(node.test, names) else node.orelse, names)
+    elif isinstance(node, ast.JoinedStr):
+        return "".join(str(_evaluate(value, names)) for value in node.values)
+    elif isinstance(node, ast.FormattedValue) and node.conversion == -1 and node.format_spec is None:
+        return _evaluate(node.value, names)
+    raise _UnsupportedExpression(ast.dump(node))
+
+
+def _parse_version_file(path):
+    with open(path) as fh:
+        source = fh.read()
+    names = {}
+    try:
+        for node in ast.parse(source, filename=path).body:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                names[node.targets[0].id] = _evaluate(node.value, names)
+        return names["VERSION"]
+    except (_UnsupportedExpression, KeyError, TypeError) as exc:
+        gravity.io.debug(f"Unable to evaluate Galaxy version in {path} ({exc!r}), using the version literals instead")
+    literals = {m.group(1): m.group(3) for m in _VERSION_ASSIGNMENT_RE.finditer(source)}
+    if "VERSION" in literals:
+        return literals["VERSION"]
+    elif "VERSION_MAJOR" in literals:
+        minor = literals.get("VERSION_MINOR")
+        return f"{literals['VERSION_MAJOR']}.{minor}" if minor else literals["VERSION_MAJOR"]
+    gravity.io.warn(f"Unable to determine the Galaxy version from {path}")
+    return None
+
+
+def version_from_file(path):
+    """Return the ``VERSION`` defined in a Galaxy ``version.py``, cached until the file is modified."""
+    st = os.stat(path)
+    signature = (st.st_mtime_ns, st.st_size)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, _parse_version_file(path))
+        _cache[path] = cached
+    return cached[1]
+
+
+def is_installed():
+    """Return whether Galaxy is installed in the current Python environment.
+
+    The package is located without being imported, importing ``galaxy.config`` takes longer than most ``galaxyctl``
+    commands.
+    """
+    try:
+        return importlib.util.find_spec("galaxy.config") is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def installed_version():
+    """Return the version of Galaxy installed in the current Python environment, if any."""
+    try:
+        spec = importlib.util.find_spec("galaxy.version")
+    except ImportError:
+        spec = None
+    if spec is not None and spec.origin and os.path.exists(spec.origin):
+        return version_from_file(spec.origin)
+    try:
+        import importlib.metadata as importlib_metadata
+    except ImportError:
+        return None
+    for distribution in GALAXY_DISTRIBUTIONS:
+        try:
+            return importlib_metadata.version(distribution)
+        except importlib_metadata.PackageNotFoundError:
+            pass
+    return None
+
+
+def source_version(galaxy_root):
+    """Return the version of the Galaxy source tree at ``galaxy_root``."""
+    return version_from_file(os.path.join(galaxy_root, "lib", "galaxy", "version.py"))
+
+
+def live_version(bind, url_prefix=None):
+    """Return the version of the Galaxy server listening on ``bind``, as it would appear in ``version.py``."""
+    prefix = (url_prefix or "").rstrip("/")
+    version = http_check(bind, f"{prefix}/api/version").json()
+    major = version["version_major"]
+    minor = version.get("version_minor")
+    return f"{major}.{minor}" if minor else major
@@ -0,0 +1,105 @@
+""" Installation of gx-it-proxy into the Gravity state directory.
+
+By default, gx-it-proxy is run with ``npx``, which resolves the requested version through the npm cache or registry each
+time the proxy starts. If ``install`` is set, gx-it-proxy is instead installed with ``npm`` when the process manager
+configs are updated, from the registry, an offline package tarball (``install_source``), or a local npm cache
+(``npm_cache``), and run with ``node`` directly.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from packaging.version import InvalidVersion, Version
+
+import gravity.io
+from gravity.settings import GX_IT_PROXY_MIN_VERSION
+from gravity.util import which
+
+PACKAGE = "@galaxyproject/gx-it-proxy"
+INSTALL_DIR_NAME = "gx-it-proxy"
+EXACT_VERSION_RE = re.compile(r"^\d+\.\d+\.\d+$")
+
+
+def install_dir(config, settings):
+    """Return the directory that the gx-it-proxy requested by ``settings`` is installed in."""
+    if settings.get("install_source"):
+        key = os.path.basename(settings["install_source"])
+        if key.endswith(".tgz"):
+            key = key[:-len(".tgz")]
+    else:
+        key = settings["version"]
+    return os.path.join(config.gravity_data_dir, INSTALL_DIR_NAME, re.sub(r"[^\w.-]+", "_", key))
+
+
+def installed_bin(path):
+    return os.path.join(path, "node_modules", ".bin", "gx-it-proxy")
+
+
+def installed_version(path):
+    """Return the version of gx-it-proxy installed in ``path``, or ``None`` if it is not installed."""
+    try:
+        with open(os.path.join(path, "node_modules", *PACKAGE.split("/"), "package.json")) as fh:
+            package = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if package.get("name") != PACKAGE or not os.path.exists(installed_bin(path)):
+        return None
+    return package.get("version")
+
+
+def _npm(config):
+    if config.virtualenv and os.path.exists(os.path.join(config.virtualenv, "bin", "npm")):
+        return os.path.join(config.virtualenv, "bin", "npm")
+    return which("npm")
+
+
+def _verify(settings, version):
+    if version is None:
+        return f"{PACKAGE} was not installed"
+    try:
+        if Version(version) < Version(GX_IT_PROXY_MIN_VERSION):
+            return f"{PACKAGE} {version} is older than the minimum supported version, {GX_IT_PROXY_MIN_VERSION}"
+    except InvalidVersion:
+        return f"{PACKAGE} has an invalid version: {version}"
+    requested = settings["version"]
+    if not settings.get("install_source") and EXACT_VERSION_RE.match(requested) and version != requested:
+        return f"{PACKAGE} {version} was installed but {requested} was requested"
+    return None
+
+
+def install(config, settings, force=False):
+    """Install gx-it-proxy if it is not already installed (or ``force`` is set)."""
+    path = install_dir(config, settings)
+    if not force and installed_version(path) is not None:
+        gravity.io.debug(f"{PACKAGE} {installed_version(path)} is installed in {path}")
+        return
+    npm = _npm(config)
+    if not npm:
+        gravity.io.exception(f"npm not found on $PATH or in the virtualenv, it is required to install {PACKAGE}")
+    source = settings.get("install_source") or f"{PACKAGE}@{settings['version']}"
+    # a failed install does not leave behind a partial installation
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=".install-")
+    try:
+        cmd = [npm, "install", "--no-save", "--no-audit", "--no-fund", "--prefix", tmp_path, source]
+        if settings.get("npm_cache"):
+            # npm verifies the integrity of packages installed from its cache
+            cmd.extend(["--offline", "--cache", settings["npm_cache"]])
+        gravity.io.info(f"Installing {source} in {path}")
+        gravity.io.debug(f"Running: {' '.join(cmd)}")
+        try:
+            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        except subprocess.CalledProcessError as exc:
+            gravity.io.exception(f"Installing {source} failed:\n{exc.stdout}")
+        error = _verify(settings, installed_version(tmp_path))
+        if error:
+            gravity.io.exception(error)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    gravity.io.info(f"Installed {PACKAGE} {installed_version(path)}")
@@ -0,0 +1,177 @@
+""" Extraction of handler configuration from Galaxy job configs.
+
+Only the handler IDs and assignment methods are needed from the job config, so rather than parsing the entire file
+(which at large sites can contain thousands of destinations and tool mappings), the file is parsed as a stream and
+parsing stops once the ``<handlers>`` element or ``handling:`` mapping has been read. Results are cached by the file's
+signature.
+"""
+import copy
+import json
+import os
+import xml.etree.ElementTree as elementtree
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore
+
+import gravity.io
+
+JOB_CONFIG_CACHE_FILE_NAME = "job_config_cache.json"
+
+_cache = {}
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def _handlers_from_xml(path):
+    assign_with = None
+    handlers = []
+    depth = 0
+    in_handlers = False
+    for event, elem in elementtree.iterparse(path, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 2 and elem.tag == "handlers":
+                in_handlers = True
+                assign_with = elem.get("assign_with")
+                if assign_with:
+                    assign_with = [a.strip() for a in assign_with.split(",")]
+            elif depth == 3 and in_handlers and elem.tag == "handler":
+                handlers.append({"service_name": elem.attrib["id"]})
+            continue
+        depth -= 1
+        if in_handlers and depth == 1:
+            # </handlers>, nothing else is needed from the file
+            break
+        if depth == 1:
+            # discard parsed siblings of <handlers> (destinations, tools, ...) as we go
+            elem.clear()
+    return (assign_with, handlers)
+
+
+def _node_events(events, first):
+    """Yield the events making up the node that starts with ``first``."""
+    yield first
+    if not isinstance(first, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+        return
+    depth = 1
+    for event in events:
+        yield event
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def _load_events(node_events):
+    document = [yaml.StreamStartEvent(), yaml.DocumentStartEvent(), *node_events, yaml.DocumentEndEvent(), yaml.StreamEndEvent()]
+    return yaml.safe_load(yaml.emit(document))
+
+
+def _yaml_top_level_value(fh, key):
+    """Return the value of ``key`` in the top level mapping of the YAML document in ``fh``, parsing no further."""
+    events = yaml.parse(fh, Loader=SafeLoader)
+    for event in events:
+        if isinstance(event, yaml.MappingStartEvent):
+            break
+        if isinstance(event, (yaml.ScalarEvent, yaml.SequenceStartEvent, yaml.AliasEvent)):
+            # not a mapping, there is nothing to find
+            return None
+    else:
+        return None
+    for event in events:
+        if isinstance(event, yaml.MappingEndEvent):
+            return None
+        is_key = isinstance(event, yaml.ScalarEvent) and event.value == key
+        # consume the key node (keys can be complex nodes), then the value node
+        for _ in _node_events(events, event):
+            pass
+        value_events = _node_events(events, next(events))
+        if is_key:
+            return _load_events(list(value_events))
+        for _ in value_events:
+            pass
+    return None
+
+
+def _handlers_from_yaml(path):
+    with open(path) as fh:
+        try:
+            handling = _yaml_top_level_value(fh, "handling")
+        except yaml.YAMLError:
+            # e.g. an alias to an anchor outside of the handling section, fall back to reading the whole file
+            gravity.io.debug(f"Unable to stream job config, parsing entire file: {path}")
+            fh.seek(0)
+            handling = (yaml.load(fh, Loader=SafeLoader) or {}).get("handling")
+    return handlers_from_dict({"handling": handling})
+
+
+def handlers_from_dict(conf):
+    handling = conf.get("handling") or {}
+    assign_with = handling.get("assign", [])
+    handlers = []
+    processes = handling.get("processes") or {}
+    for handler_name, handler_options in processes.items():
+        handlers.append({
+            "service_name": handler_name,
+            "environment": (handler_options or {}).get("environment", None)
+        })
+    return (assign_with, handlers)
+
+
+def _read_cache_file(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, JOB_CONFIG_CACHE_FILE_NAME)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache_file(cache_dir, path, entry):
+    cache_file = os.path.join(cache_dir, JOB_CONFIG_CACHE_FILE_NAME)
+    cache = _read_cache_file(cache_dir)
+    cache[path] = entry
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as fh:
+            json.dump(cache, fh)
+        os.replace(tmp_file, cache_file)
+    except OSError as exc:
+        gravity.io.debug(f"Unable to write job config cache {cache_file}: {exc}")
+
+
+def handlers_from_file(path, cache_dir=None):
+    """Return the handler assignment methods and handlers from a job config file.
+
+    Results are cached in memory and, if ``cache_dir`` is set, in a cache file in that directory, keyed on the job config
+    file's path and signature (mtime, size and inode).
+    """
+    path = os.path.abspath(path)
+    signature = file_signature(path)
+    entry = _cache.get(path)
+    if (entry is None or entry["signature"] != signature) and cache_dir:
+        entry = _read_cache_file(cache_dir).get(path)
+        if entry is not None:
+            gravity.io.debug(f"Read job config handlers from cache: {path}")
+    if entry is None or entry["signature"] != signature:
+        if path.endswith(".xml"):
+            assign_with, handlers = _handlers_from_xml(path)
+        elif path.endswith((".yml", ".yaml")):
+            assign_with, handlers = _handlers_from_yaml(path)
+        else:
+            gravity.io.exception(f"Unknown job config file type: {path}")
+        entry = {"signature": signature, "assign_with": assign_with, "handlers": handlers}
+        if cache_dir:
+            _write_cache_file(cache_dir, path, entry)
+    _cache[path] = entry
+    # callers may modify the handler settings
+    return (copy.deepcopy(entry["assign_with"]), copy.deepcopy(entry["handlers"]))
@@ -0,0 +1,71 @@
+""" Launcher for services run with ``service_command_style: launch``.
+
+The process manager runs ``python -m gravity.launch [--service-instance N] SPEC`` in place of ``galaxyctl exec``. The exec
+spec (command, environment, working directory, umask and restart policy of each service instance) is rendered by
+``galaxyctl update``, so unlike ``galaxyctl exec``, the launcher does not need to load any configs and only imports from
+the standard library (and :mod:`gravity.restart`).
+"""
+import json
+import os
+import sys
+
+from gravity.restart import backoff
+
+LAUNCH_DIR_NAME = "launch"
+LAUNCH_SPEC_FORMAT = 1
+# placeholder in an exec spec's $PATH for the $PATH the launcher is run with
+INHERITED_PATH = "$PATH"
+
+USAGE = "usage: python -m gravity.launch [--service-instance N] SPEC"
+
+
+def launch_spec_path(gravity_data_dir, instance_name, service_type, service_name):
+    return os.path.join(gravity_data_dir, LAUNCH_DIR_NAME, instance_name, f"{service_type}_{service_name}.json")
+
+
+def _fail(message):
+    print(f"gravity.launch: {message}", file=sys.stderr)
+    sys.exit(2)
+
+
+def read_launch_spec(path, instance_number=None):
+    """Return the exec spec for the given instance of the service in the spec file ``path``."""
+    with open(path) as fh:
+        spec = json.load(fh)
+    if spec.get("format") != LAUNCH_SPEC_FORMAT:
+        _fail(f"unsupported exec spec format in {path}, rerun `galaxyctl update`")
+    instances = spec["instances"]
+    if instance_number is None:
+        if len(instances) > 1:
+            _fail(f"{spec['service_name']} has multiple instances but --service-instance was not set")
+        instance_number = 0
+    if instance_number not in range(0, len(instances)):
+        _fail(f"--service-instance {instance_number} is out of range for {spec['service_name']}")
+    return instances[instance_number]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    instance_number = None
+    if argv[:1] == ["--service-instance"] and len(argv) > 1:
+        try:
+            instance_number = int(argv[1])
+        except ValueError:
+            _fail(USAGE)
+        argv = argv[2:]
+    if len(argv) != 1:
+        _fail(USAGE)
+    instance = read_launch_spec(argv[0], instance_number)
+    if instance.get("restart"):
+        backoff(instance["restart"])
+    env = dict(os.environ)
+    env.update(instance["env"])
+    if "PATH" in instance["env"]:
+        env["PATH"] = env["PATH"].replace(INHERITED_PATH, os.environ.get("PATH", os.defpath))
+    os.umask(int(instance["umask"], 8))
+    os.chdir(instance["cwd"])
+    os.execvpe(instance["argv"][0], instance["argv"], env)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+""" Load balancer configuration and connection draining for gunicorn instances.
+
+If ``load_balancer`` is set, the nginx ``upstream`` block or HAProxy ``backend`` section for an instance's gunicorns is
+written when the process manager configs are updated, to be included in the load balancer's configuration. During
+rolling restarts, each gunicorn is marked down in the load balancer before it is restarted, and restored once it is
+ready: by rewriting the configuration and running ``reload_command`` or, for HAProxy with a ``runtime_socket``, with the
+HAProxy runtime API. A reloaded nginx (or HAProxy) lets in-flight requests to the old workers finish, and Gravity waits
+``drain_time`` seconds for them to do so before restarting the gunicorn.
+"""
+import os
+import socket
+import subprocess
+import time
+
+import gravity.io
+from gravity.atomic import write_file
+from gravity.settings import LoadBalancer
+
+LOAD_BALANCER_DIR_NAME = "load_balancer"
+
+
+def config_path(config):
+    return config.load_balancer.get("path") or os.path.join(
+        config.gravity_data_dir, LOAD_BALANCER_DIR_NAME, f"{config.instance_name}.conf")
+
+
+def gunicorn_instances(config):
+    """Return the gunicorn service instances of an instance, whether or not they are in a service list."""
+    instances = []
+    for service in config.services:
+        if service.service_type == "gunicorn":
+            instances.extend(getattr(service, "services", [service]))
+    return instances
+
+
+def _server_address(lb_type, bind):
+    if bind.startswith("fd://"):
+        return None
+    if bind.startswith("unix:") and lb_type == LoadBalancer.haproxy:
+        # HAProxy servers with an absolute path are unix sockets
+        return bind.split(":", 1)[1]
+    return bind
+
+
+def render(config, down=()):
+    """Return the load balancer configuration for the gunicorns of an instance, with the named service instances in
+    ``down`` marked down.
+    """
+    lb = config.load_balancer
+    lines = [f"# Written by Gravity for instance '{config.instance_name}', changes will be overwritten"]
+    if lb["type"] == LoadBalancer.haproxy:
+        lines.append(f"backend {lb['name']}")
+        server_line = "    server {name} {address} check{down}"
+        down_flag = " disabled"
+    else:
+        lines.append(f"upstream {lb['name']} {{")
+        server_line = "    server {address}{down};"
+        down_flag = " down"
+    for service in gunicorn_instances(config):
+        address = _server_address(lb["type"], service.settings["bind"])
+        if not address:
+            gravity.io.warn(f"Cannot load balance {service.service_name}, it is bound to a file descriptor")
+            continue
+        lines.append(server_line.format(
+            name=service.service_name, address=address, down=down_flag if service.service_name in down else ""))
+    if lb["type"] != LoadBalancer.haproxy:
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def _reload(config):
+    command = config.load_balancer.get("reload_command")
+    if not command:
+        return
+    gravity.io.debug(f"Reloading load balancer: {command}")
+    proc = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if proc.returncode != 0:
+        gravity.io.exception(f"Load balancer reload command failed with exit code {proc.returncode}: {command}\n{proc.stdout}")
+
+
+def _write(config, down=()):
+    path = config_path(config)
+    contents = render(config, down=down)
+    try:
+        with open(path) as fh:
+            if fh.read() == contents:
+                return False
+    except FileNotFoundError:
+        pass
+    gravity.io.info(f"Writing load balancer configuration: {path}")
+    write_file(path, contents)
+    return True
+
+
+def update(config):
+    """Write the load balancer configuration of an instance, reloading the load balancer if it changed."""
+    if _write(config):
+        _reload(config)
+
+
+def _runtime_command(config, command):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(10)
+        sock.connect(config.load_balancer["runtime_socket"])
+        sock.sendall(f"{command}\n".encode("utf-8"))
+        response = b""
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            response += data
+    response = response.decode("utf-8").strip()
+    if response:
+        gravity.io.exception(f"HAProxy runtime API command '{command}' failed: {response}")
+
+
+def _set_state(config, services, state):
+    lb = config.load_balancer
+    if lb["type"] == LoadBalancer.haproxy and lb.get("runtime_socket"):
+        for service in services:
+            _runtime_command(config, f"set server {lb['name']}/{service.service_name} state {state}")
+    else:
+        down = [s.service_name for s in services] if state == "drain" else ()
+        _write(config, down=down)
+        _reload(config)
+
+
+def drain(config, services):
+    """Mark gunicorn service instances down in the load balancer and wait for their in-flight requests to finish."""
+    names = ", ".join(s.service_name for s in services)
+    gravity.io.info(f"Draining {names} in load balancer")
+    _set_state(config, services, "drain")
+    time.sleep(config.load_balancer["drain_time"])
+
+
+def restore(config, services):
+    """Restore gunicorn service instances in the load balancer."""
+    gravity.io.info(f"Restoring {', '.join(s.service_name for s in services)} in load balancer")
+    _set_state(config, services, "ready")
+
+
+def rolling_restart_hooks(config, service):
+    """Return the keyword arguments to :meth:`gravity.state.ServiceList.rolling_restart` that drain and restore the
+    instances of ``service`` in the load balancer, if it is configured.
+    """
+    if not config.load_balancer or service.service_type != "gunicorn":
+        return {}
+    return {
+        "before_restart": lambda services: drain(config, services),
+        "after_ready": lambda services: restore(config, services),
+    }
@@ -0,0 +1,80 @@
+""" Advisory locks that prevent simultaneous galaxyctl commands from racing on the same state.
+
+Commands that modify process manager configs or process state (``update``, ``start``, ``restart``, etc.) hold a lock
+for each instance they operate on, and the supervisor process manager additionally holds a global lock while starting
+or shutting down ``supervisord``. Read-only commands such as ``status`` and ``follow`` do not take any locks. Locks are
+``flock(2)`` locks, so they are released automatically if galaxyctl exits or is killed, and they are re-entrant within
+a galaxyctl process.
+"""
+import contextlib
+import errno
+import fcntl
+import os
+
+import gravity.io
+
+LOCK_DIR_NAME = "locks"
+
+# lock path -> [fd, depth] of locks held by this process
+_held = {}
+
+
+def instance_lock_path(config):
+    return os.path.join(config.gravity_data_dir, LOCK_DIR_NAME, f"{config.instance_name}.lock")
+
+
+def _read_holder(fd):
+    try:
+        return os.pread(fd, 32, 0).decode("ascii", "replace").strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+@contextlib.contextmanager
+def lock(path, description):
+    """Hold an exclusive lock on ``path``, waiting for it if it is held by another process."""
+    held = _held.get(path)
+    if held is not None:
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+        return
+    fd = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError as exc:
+        if exc.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+            raise
+        gravity.io.warn(f"Unable to create lock file, continuing without locking {description}: {exc}")
+    if fd is None:
+        yield
+        return
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            gravity.io.info(f"Waiting for {description} lock held by another galaxyctl process (pid {_read_holder(fd)})...")
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, f"{os.getpid()}\n".encode("ascii"), 0)
+        _held[path] = [fd, 1]
+        gravity.io.debug(f"Acquired {description} lock: {path}")
+        try:
+            yield
+        finally:
+            del _held[path]
+    finally:
+        # closing the file releases the lock
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def instance_locks(configs):
+    """Hold the locks of all of the given instances, which are always acquired in the same order to avoid deadlocks."""
+    with contextlib.ExitStack() as stack:
+        for config in sorted(configs, key=instance_lock_path):
+            stack.enter_context(lock(instance_lock_path(config), f"instance '{config.instance_name}'"))
+        yield
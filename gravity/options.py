@@ -2,11 +2,25 @@
 """
 import click
 
+from gravity import completion
+
 
 def debug_option():
     return click.option("-d", "--debug", is_flag=True, help="Enables debug mode.")
 
 
+def profile_option():
+    return click.option("--profile", is_flag=True, help="Print the time spent in each phase of the command.")
+
+
+def trace_file_option():
+    return click.option(
+        "--trace-file",
+        type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+        help="Write the time spent in each phase of the command to a file in the Chrome trace event format.",
+    )
+
+
 def state_dir_option():
     return click.option(
         "--state-dir", type=click.Path(file_okay=False, writable=True, resolve_path=True), help="Where process management configs and state will be stored."
@@ -61,4 +75,11 @@ def required_config_arg(name="config", exists=False, nargs=None):
 
 
 def instances_services_arg():
-    return click.argument("instances_services", metavar="[INSTANCES] [SERVICES]", nargs=-1)
+    # commands that take this argument import the modules that load the config when they are run, rather than when they
+    # are imported, so that it can be completed quickly
+    return click.argument(
+        "instances_services",
+        metavar="[INSTANCES] [SERVICES]",
+        nargs=-1,
+        shell_complete=completion.complete_instances_services,
+    )
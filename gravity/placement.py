@@ -0,0 +1,123 @@
+""" CPU and NUMA node placement of service processes.
+
+Services (and handler pools) can be restricted to a set of CPUs with the ``cpus`` setting and to a NUMA node with the
+``numa_node`` setting. A ``numa_node`` of ``auto`` spreads the instances of a service (or the processes of a handler
+pool) across the host's NUMA nodes in turn.
+
+Under systemd, placement is set with the ``AllowedCPUs``, ``NUMAPolicy`` and ``NUMAMask`` unit directives. Service
+instances share a single unit template, so for these, as well as under other process managers, the service command is
+run with ``numactl(8)`` (or, if only ``cpus`` is set or ``numactl`` is not installed, ``taskset(1)``).
+"""
+import functools
+import os
+import re
+from collections.abc import Mapping
+
+import gravity.io
+from gravity.settings import NUMA_NODE_AUTO, ProcessManager, validate_cpu_list, validate_numa_node
+from gravity.util import which
+
+NODE_DIR = "/sys/devices/system/node"
+
+
+@functools.lru_cache(maxsize=None)
+def numa_nodes():
+    """Return a dict of the host's NUMA nodes and their CPU lists, empty if NUMA topology is unavailable."""
+    nodes = {}
+    try:
+        node_dirs = os.listdir(NODE_DIR)
+    except OSError as exc:
+        gravity.io.debug(f"Unable to read NUMA topology: {exc}")
+        return nodes
+    for node_dir in node_dirs:
+        if not re.match(r"^node\d+$", node_dir):
+            continue
+        try:
+            with open(os.path.join(NODE_DIR, node_dir, "cpulist")) as fh:
+                cpus = fh.read().strip()
+        except OSError:
+            continue
+        # memory-only nodes have no CPUs
+        if cpus:
+            nodes[int(node_dir[4:])] = cpus
+    return dict(sorted(nodes.items()))
+
+
+def auto_numa_node(index):
+    """The NUMA node of the ``index``th process of a service with ``numa_node: auto``."""
+    nodes = list(numa_nodes())
+    if not nodes:
+        return None
+    return nodes[index % len(nodes)]
+
+
+def assign_numa_node(settings, index):
+    """Return ``settings`` (a dict or settings model) with an ``auto`` NUMA node replaced by the node of the
+    ``index``th process, or ``settings`` unchanged if its NUMA node is not ``auto``.
+    """
+    if isinstance(settings, Mapping):
+        if settings.get("numa_node") != NUMA_NODE_AUTO:
+            return settings
+        return {**settings, "numa_node": auto_numa_node(index)}
+    if getattr(settings, "numa_node", None) != NUMA_NODE_AUTO:
+        return settings
+    return settings.copy(update={"numa_node": auto_numa_node(index)})
+
+
+def validate_settings(settings):
+    """Validate the placement settings of a settings dict, e.g. of a handler pool, which is not a settings model."""
+    try:
+        validate_cpu_list(None, settings.get("cpus"))
+        numa_node = validate_numa_node(None, settings.get("numa_node"))
+    except ValueError as exc:
+        gravity.io.exception(exc)
+    if numa_node is not None:
+        settings["numa_node"] = numa_node
+    return settings
+
+
+def _resolve(settings):
+    cpus = settings.get("cpus")
+    numa_node = settings.get("numa_node")
+    if numa_node == NUMA_NODE_AUTO:
+        # a single process is placed on the first node
+        numa_node = auto_numa_node(0)
+    if numa_node is not None and cpus is None:
+        nodes = numa_nodes()
+        if numa_node not in nodes:
+            gravity.io.exception(f"NUMA node {numa_node} does not exist or has no CPUs, available nodes: {list(nodes)}")
+        cpus = nodes[numa_node]
+    return cpus, numa_node
+
+
+def in_systemd_unit(config, service):
+    """Whether the placement of ``service`` is set in its systemd unit rather than by its command."""
+    return config.process_manager == ProcessManager.systemd and service.count == 1
+
+
+def systemd_directives(settings):
+    """Return the systemd unit directives for the placement in ``settings``."""
+    cpus, numa_node = _resolve(settings)
+    directives = []
+    if cpus is not None:
+        directives.append(f"AllowedCPUs={cpus}")
+    if numa_node is not None:
+        directives.extend(["NUMAPolicy=bind", f"NUMAMask={numa_node}"])
+    return directives
+
+
+def command_prefix(settings):
+    """Return the command (with a trailing space) to run a service command with the placement in ``settings``."""
+    cpus, numa_node = _resolve(settings)
+    if cpus is None:
+        return ""
+    if numa_node is not None:
+        numactl = which("numactl")
+        if numactl:
+            cpu_opt = f"--cpunodebind={numa_node}" if settings.get("cpus") is None else f"--physcpubind={cpus}"
+            return f"{numactl} --membind={numa_node} {cpu_opt} "
+        gravity.io.warn(f"numactl not found, memory will not be bound to NUMA node {numa_node}, only CPUs: {cpus}")
+    taskset = which("taskset")
+    if not taskset:
+        gravity.io.exception("taskset (or numactl) must be installed to set the CPUs or NUMA node of services")
+    return f"{taskset} --cpu-list {cpus} "
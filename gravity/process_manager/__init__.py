@@ -2,8 +2,10 @@
 """
 import contextlib
 import errno
+import glob
 import importlib
 import inspect
+import json
 import os
 import shlex
 import sys
@@ -11,9 +13,17 @@ from abc import ABCMeta, abstractmethod
 from functools import partial, wraps
 
 import gravity.io
+from gravity import completion, fingerprint, gx_it_proxy, load_balancer, placement, restart, trace
+from gravity.atomic import FileTransaction, write_file
+from gravity.compiled import compile_configs
 from gravity.config_manager import ConfigManager
-from gravity.settings import DEFAULT_INSTANCE_NAME, ServiceCommandStyle
-from gravity.state import VALID_SERVICE_NAMES
+from gravity.launch import INHERITED_PATH, LAUNCH_SPEC_FORMAT, launch_spec_path
+from gravity.locks import instance_locks
+from gravity.sd_notify import ReadinessNotifier, notify_enabled
+from gravity.settings import DEFAULT_INSTANCE_NAME, ProcessManager, ServiceCommandStyle
+from gravity.startup_profiler import ServiceStartupProfiler
+from gravity.state import GracefulMethod, VALID_SERVICE_NAMES
+from gravity.template import compile_template, render
 from gravity.util import which
 
 
@@ -26,8 +36,10 @@ def process_manager(*args, **kwargs):
         pm.terminate()
 
 
-def _route(func, all_process_managers=False):
+def _route(func, all_process_managers=False, lock=False):
     """Given instance names, populates kwargs with instance configs for the given PM, and calls the PM-routed function
+
+    If ``lock`` is set, the locks of the instances operated on are held while calling the PM-routed function(s).
     """
     @wraps(func)
     def decorator(self, *args, instance_names=None, **kwargs):
@@ -44,24 +56,44 @@ def _route(func, all_process_managers=False):
                 configs_by_pm[config.process_manager] = [config]
         if not all_process_managers:
             pm_names = configs_by_pm.keys()
-        for pm_name in pm_names:
-            routed_func = getattr(self.process_managers[pm_name], func.__name__)
-            routed_func_params = list(inspect.signature(routed_func).parameters)
-            if "configs" in routed_func_params:
-                pm_configs = configs_by_pm.get(pm_name, [])
-                kwargs["configs"] = pm_configs
-                gravity.io.debug(f"Calling {func.__name__} in process manager {pm_name} for instances: {[c.instance_name for c in pm_configs]}")
-            else:
-                gravity.io.debug(f"Calling {func.__name__} in process manager {pm_name} for all instances")
-            if "service_names" in routed_func_params:
-                kwargs["service_names"] = service_names
-            routed_func(*args, **kwargs)
+        with instance_locks(configs) if lock else contextlib.nullcontext():
+            for pm_name in pm_names:
+                routed_func = getattr(self.process_managers[pm_name], func.__name__)
+                routed_func_params = list(inspect.signature(routed_func).parameters)
+                if "configs" in routed_func_params:
+                    pm_configs = configs_by_pm.get(pm_name, [])
+                    kwargs["configs"] = pm_configs
+                    gravity.io.debug(f"Calling {func.__name__} in process manager {pm_name} for instances: {[c.instance_name for c in pm_configs]}")
+                else:
+                    gravity.io.debug(f"Calling {func.__name__} in process manager {pm_name} for all instances")
+                if "service_names" in routed_func_params:
+                    kwargs["service_names"] = service_names
+                routed_func(*args, **kwargs)
         # note we don't ever actually call the decorated function, we call the routed one(s)
     return decorator
 
 
 route = partial(_route, all_process_managers=False)
-route_to_all = partial(_route, all_process_managers=True)
+# for operations that modify process manager configs or process state
+route_locked = partial(_route, all_process_managers=False, lock=True)
+route_to_all_locked = partial(_route, all_process_managers=True, lock=True)
+
+
+# the names of the format vars of every service (see _service_format_vars), process managers add their own
+SERVICE_FORMAT_VARS = frozenset((
+    "server_name",
+    "galaxy_umask",
+    "galaxy_conf",
+    "galaxy_root",
+    "virtualenv_bin",
+    "gravity_data_dir",
+    "app_config",
+    "settings",
+    "service_instance_count",
+    "command_arguments",
+    "command",
+    "environment",
+))
 
 
 class BaseProcessExecutionEnvironment(metaclass=ABCMeta):
@@ -79,8 +111,9 @@ class BaseProcessExecutionEnvironment(metaclass=ABCMeta):
     def _service_program_name(self, instance_name, service):
         return f"{instance_name}_{service.service_type}_{service.service_name}"
 
-    def _service_format_vars(self, config, service, pm_format_vars=None):
+    def _service_format_vars(self, config, service, pm_format_vars=None, command_style=None, apply_placement=True):
         pm_format_vars = pm_format_vars or {}
+        command_style = command_style or config.service_command_style
         virtualenv_dir = config.virtualenv
         virtualenv_bin = shlex.quote(f'{os.path.join(virtualenv_dir, "bin")}{os.path.sep}') if virtualenv_dir else ""
 
@@ -102,9 +135,13 @@ class BaseProcessExecutionEnvironment(metaclass=ABCMeta):
         format_vars.update(pm_format_vars)
 
         # template the command template
-        if config.service_command_style in (ServiceCommandStyle.direct, ServiceCommandStyle.exec):
+        if command_style in (ServiceCommandStyle.direct, ServiceCommandStyle.exec):
             format_vars["command_arguments"] = service.get_command_arguments(format_vars)
-            format_vars["command"] = service.command_template.format(**format_vars)
+            name = f"{service.service_type} command"
+            command_template = compile_template(service.command_template, names=frozenset(format_vars), name=name)
+            format_vars["command"] = command_template.render(format_vars, name=name)
+            if apply_placement:
+                format_vars["command"] = placement.command_prefix(service.settings) + format_vars["command"]
 
             # template env vars
             environment = service.environment
@@ -112,6 +149,13 @@ class BaseProcessExecutionEnvironment(metaclass=ABCMeta):
             if virtualenv_bin and service.add_virtualenv_to_path:
                 path = environment.get("PATH", self._service_default_path())
                 environment["PATH"] = ":".join([virtualenv_bin, path])
+        elif command_style == ServiceCommandStyle.launch:
+            instance_number_opt = ""
+            if service.count > 1:
+                instance_number_opt = f" --service-instance {pm_format_vars['instance_number']}"
+            spec_path = launch_spec_path(config.gravity_data_dir, config.instance_name, service.service_type, service.service_name)
+            format_vars["command"] = f"{shlex.quote(sys.executable)} -m gravity.launch{instance_number_opt} {shlex.quote(spec_path)}"
+            environment = {}
         else:
             config_file_option = ""
             if config.gravity_config_file:
@@ -138,12 +182,67 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
     def __init__(self, *args, foreground=False, **kwargs):
         super().__init__(*args, **kwargs)
         self._service_changes = None
+        self._transaction = None
 
     @property
     def _use_instance_name(self):
         return ((not self.config_manager.single_instance)
                 or self.config_manager.get_config().instance_name != DEFAULT_INSTANCE_NAME)
 
+    def _reset_restart_backoff(self, configs, service_names=None):
+        """Allow services that were parked after restarting in a loop to be started again."""
+        for config in configs:
+            names = None
+            if service_names:
+                services = config.get_services(service_names)
+                # a service list with one instance is exec'd under the name of the list
+                names = [service.service_name for service in services]
+                names.extend(s.service_name for service in services for s in getattr(service, "services", []))
+            restart.reset(config.gravity_data_dir, config.instance_name, names)
+
+    def _record_fingerprints(self, configs, service_names=None, only_missing=False):
+        """Record the fingerprints of the given (or all) services once they have been (re)started, see
+        :mod:`gravity.fingerprint`.
+        """
+        renderer = LaunchSpecRenderer(config_manager=self.config_manager)
+        for config in configs:
+            services = config.get_services(service_names)
+            fingerprint.record(renderer, config, services, only_missing=only_missing)
+
+    def _forget_fingerprints(self, configs, service_names=None):
+        for config in configs:
+            fingerprint.forget(config, config.get_services(service_names) if service_names else None)
+
+    def _graceful_services(self, configs, service_names=None, changed=False):
+        """Return a list of each config and its services to gracefully reload.
+
+        If ``changed`` is set, only services whose fingerprint differs from the recorded one are included.
+        """
+        renderer = LaunchSpecRenderer(config_manager=self.config_manager)
+        graceful_services = []
+        for config in configs:
+            services = config.get_services(service_names)
+            if changed:
+                services = fingerprint.changed_services(renderer, config, services)
+                if not services:
+                    gravity.io.info(f"No services of instance '{config.instance_name}' have changed")
+                    continue
+                gravity.io.info(f"Changed services of instance '{config.instance_name}': {', '.join(s.service_name for s in services)}")
+            graceful_services.append((config, services))
+        return graceful_services
+
+    def _record_graceful_fingerprints(self, config, services):
+        # services that cannot be reloaded gracefully still run the previous generation
+        services = [s for s in services if s.graceful_method != GracefulMethod.NONE]
+        renderer = LaunchSpecRenderer(config_manager=self.config_manager)
+        fingerprint.record(renderer, config, [s for s in services if s.graceful_method != GracefulMethod.SIGHUP])
+        reloaded = [s for s in services if s.graceful_method == GracefulMethod.SIGHUP]
+        if reloaded:
+            for service in fingerprint.record_reloaded(renderer, config, reloaded):
+                gravity.io.warn(
+                    f"The command or environment of {service.service_name} has changed, which reloading does not apply, "
+                    f"use `galaxyctl restart {service.service_name}` to apply it")
+
     def _remove_unintended_pm_files_for_configs(self, configs):
         unintended_pm_files = set()
         for config in configs:
@@ -162,9 +261,26 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
         pm_files = self._all_present_pm_files()
         self._disable_and_remove_pm_files(pm_files)
 
+    def _install_gx_it_proxy(self, configs, force):
+        for config in configs:
+            for service in config.services:
+                if service.service_type == "gx-it-proxy" and service.settings.get("install"):
+                    gx_it_proxy.install(config, service.settings, force=force)
+
+    def program_names(self, config):
+        """Return the names of an instance's programs (or units) in the process manager, for shell completion of
+        ``galaxyctl pm``.
+        """
+        return []
+
     def _pre_update(self, configs, force, clean):
+        completion.update_index(self.config_manager.state_dir, configs, self.program_names, remove=clean)
         all_configs = set(self.config_manager.get_configs())
         if not clean:
+            self._install_gx_it_proxy(configs, force)
+            for config in configs:
+                if config.load_balancer:
+                    load_balancer.update(config)
             # no --clean and either possibility of --force
             # remove any pm files for configs known to this gravity but managed by other PMs
             self._remove_all_pm_files_for_configs(all_configs - set(configs))
@@ -180,12 +296,56 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
             # --clean and --force
             self._remove_all_pm_files()
 
-    def _create_dir_for(self, path):
+    def _render_launch_specs(self, config):
+        """Render exec specs for all services if ``service_command_style`` is ``launch``.
+
+        Returns a list of ``_update_file()`` args.
+        """
+        if config.service_command_style != ServiceCommandStyle.launch:
+            return []
+        renderer = LaunchSpecRenderer(config_manager=self.config_manager)
+        rendered = []
+        for service in config.services:
+            with trace.span("render exec spec", service=service.service_name):
+                path, contents = renderer.render(config, service)
+            rendered.append((path, contents, service.service_name, "exec spec"))
+        return rendered
+
+    def _remove_stale_launch_specs(self, config, rendered):
+        """Remove the exec specs of services that are no longer configured, along with the other changes to the
+        process manager files.
+        """
+        if config.service_command_style != ServiceCommandStyle.launch:
+            return
+        intended = set(r[0] for r in rendered if r[3] == "exec spec")
+        present = glob.glob(launch_spec_path(config.gravity_data_dir, config.instance_name, "*", "*"))
+        with self._pm_file_transaction() as transaction:
+            for path in sorted(set(present) - intended):
+                gravity.io.info(f"Removing exec spec: {path}")
+                transaction.remove(path)
+
+    def render_pm_files(self, config):
+        """Render all process manager config files (and exec specs) for an instance without writing them.
+
+        Returns a list of ``(path, contents, name, file_type)`` tuples.
+        """
+        return []
+
+    @contextlib.contextmanager
+    def _pm_file_transaction(self):
+        """Stage files written by :meth:`_update_file` in the block and commit them together when it exits.
+
+        See :mod:`gravity.atomic`.
+        """
+        if self._transaction is not None:
+            yield self._transaction
+            return
         try:
-            os.makedirs(os.path.dirname(path))
-        except OSError as exc:
-            if exc.errno != errno.EEXIST:
-                raise
+            with FileTransaction() as transaction:
+                self._transaction = transaction
+                yield transaction
+        finally:
+            self._transaction = None
 
     def _file_needs_update(self, path, contents):
         """Update if contents differ"""
@@ -200,9 +360,10 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
         if force or self._file_needs_update(path, contents):
             verb = "Updating" if os.path.exists(path) else "Adding"
             gravity.io.info(f"{verb} {file_type} {name}")
-            self._create_dir_for(path)
-            with open(path, "w") as out:
-                out.write(contents)
+            if self._transaction is not None:
+                self._transaction.write(path, contents)
+            else:
+                write_file(path, contents)
             self._service_changes = True
             return True
         else:
@@ -226,7 +387,7 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
         """ """
 
     @abstractmethod
-    def graceful(self, configs=None, service_names=None):
+    def graceful(self, configs=None, service_names=None, changed=False):
         """ """
 
     @abstractmethod
@@ -252,7 +413,38 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
 
 class ProcessExecutor(BaseProcessExecutionEnvironment):
     def _service_environment_formatter(self, environment, format_vars):
-        return {k: v.format(**format_vars) for k, v in environment.items()}
+        return {k: render(v, format_vars, name=f"environment variable {k}") for k, v in environment.items()}
+
+    def exec_spec(self, config, service_instance, apply_placement=True):
+        """Return the command, environment, working directory and umask to exec a service instance with.
+
+        ``apply_placement`` is false if the CPU and NUMA placement of the service is set by the process manager.
+        """
+        # force generation of real commands
+        format_vars = self._service_format_vars(
+            config, service_instance, command_style=ServiceCommandStyle.exec, apply_placement=apply_placement)
+        return {
+            "command": format_vars["command"],
+            "argv": shlex.split(format_vars["command"]),
+            "env": format_vars["environment"],
+            "cwd": format_vars["galaxy_root"] or os.getcwd(),
+            "umask": format_vars["galaxy_umask"],
+            "restart": self._restart_backoff_policy(config, service_instance),
+        }
+
+    def _restart_backoff_policy(self, config, service_instance):
+        if config.process_manager == ProcessManager.systemd:
+            # restarts are delayed by systemd itself
+            return None
+        policy = {
+            **service_instance.restart_policy,
+            "name": f"{config.instance_name}:{service_instance.service_name}",
+            "state_file": restart.restart_state_path(config.gravity_data_dir, config.instance_name, service_instance.service_name),
+        }
+        if config.process_manager == ProcessManager.supervisor:
+            # supervisord only honors the exit code of programs that ran for startsecs, see gravity.restart
+            policy["park_delay"] = service_instance.settings["start_timeout"]
+        return policy
 
     def exec(self, config, service, service_instance_number=None, no_exec=False):
         service_name = service.service_name
@@ -269,14 +461,12 @@ class ProcessExecutor(BaseProcessExecutionEnvironment):
         else:
             service_instance = service
 
-        # force generation of real commands
-        config.service_command_style = ServiceCommandStyle.exec
-        format_vars = self._service_format_vars(config, service_instance)
-        print_env = ' '.join('{}={}'.format(k, shlex.quote(v)) for k, v in format_vars["environment"].items())
+        exec_spec = self.exec_spec(config, service_instance, apply_placement=not placement.in_systemd_unit(config, service))
+        print_env = ' '.join('{}={}'.format(k, shlex.quote(v)) for k, v in exec_spec["env"].items())
 
-        cmd = shlex.split(format_vars["command"])
-        env = {**dict(os.environ), **format_vars["environment"]}
-        cwd = format_vars["galaxy_root"] or os.getcwd()
+        cmd = exec_spec["argv"]
+        env = {**dict(os.environ), **exec_spec["env"]}
+        cwd = exec_spec["cwd"]
 
         # ensure the data dir exists
         try:
@@ -285,14 +475,57 @@ class ProcessExecutor(BaseProcessExecutionEnvironment):
             if exc.errno != errno.EEXIST:
                 raise
 
+        notifier = None
+        if notify_enabled(config, service) and os.environ.get("NOTIFY_SOCKET"):
+            notifier = ReadinessNotifier(service_instance, os.environ["NOTIFY_SOCKET"])
+            # services that implement sd_notify themselves (e.g. gunicorn) would report readiness before they are ready
+            env.pop("NOTIFY_SOCKET", None)
+
+        profiler = None
+        if config.startup_profiler:
+            profiler = ServiceStartupProfiler(config, service_instance, instance_number=service_instance_number)
+            cmd, env = profiler.prepare(cmd, env)
+
         gravity.io.info(f"Working directory: {cwd}")
-        gravity.io.info(f"Executing: {print_env} {format_vars['command']}")
+        gravity.io.info(f"Executing: {print_env} {exec_spec['command']}")
+        if profiler:
+            gravity.io.info(f"Startup profiling ({config.startup_profiler.value}) enabled, records will be written to: {profiler.report_dir}")
 
         if not no_exec:
+            if exec_spec["restart"]:
+                restart.backoff(exec_spec["restart"])
             os.chdir(cwd)
+            if notifier:
+                notifier.start()
+            if profiler:
+                profiler.start()
             os.execvpe(cmd[0], cmd, env)
 
 
+class LaunchSpecRenderer(ProcessExecutor):
+    """Render the exec specs run by :mod:`gravity.launch` when ``service_command_style`` is ``launch``."""
+    def _service_default_path(self):
+        # expanded by the launcher, since $PATH is set by the process manager
+        return INHERITED_PATH
+
+    def render(self, config, service):
+        """Return the path and contents of the exec spec for all instances of a service."""
+        instances = getattr(service, "services", [service])
+        spec = {
+            "format": LAUNCH_SPEC_FORMAT,
+            "instance_name": config.instance_name,
+            "service_name": service.service_name,
+            "instances": [],
+        }
+        apply_placement = not placement.in_systemd_unit(config, service)
+        for service_instance in instances:
+            exec_spec = self.exec_spec(config, service_instance, apply_placement=apply_placement)
+            del exec_spec["command"]
+            spec["instances"].append(exec_spec)
+        path = launch_spec_path(config.gravity_data_dir, config.instance_name, service.service_type, service.service_name)
+        return (path, json.dumps(spec, indent=1) + "\n")
+
+
 class ProcessManagerRouter:
     def __init__(self, state_dir=None, config_file=None, config_manager=None, user_mode=None, process_manager=None, **kwargs):
         self.config_manager = config_manager or ConfigManager(state_dir=state_dir,
@@ -353,35 +586,43 @@ class ProcessManagerRouter:
         service = services[0]
         return self._process_executor.exec(config, service, service_instance_number=service_instance_number, no_exec=no_exec)
 
+    def compile(self, instance_names=None):
+        """Return the compiled config records for the given (or all) instances, see :mod:`gravity.compiled`."""
+        instance_names, _ = self._instance_service_names(instance_names)
+        configs = self.config_manager.get_configs(instances=instance_names or None)
+        if not configs:
+            gravity.io.exception("No configured Galaxy instances")
+        return compile_configs(configs, self._process_executor, self.process_managers)
+
     @route
     def follow(self, instance_names=None, quiet=None):
         """ """
 
-    @route
+    @route_locked
     def start(self, instance_names=None):
         """ """
 
-    @route
+    @route_locked
     def stop(self, instance_names=None):
         """ """
 
-    @route
+    @route_locked
     def restart(self, instance_names=None):
         """ """
 
-    @route
-    def graceful(self, instance_names=None):
+    @route_locked
+    def graceful(self, instance_names=None, changed=False):
         """ """
 
     @route
     def status(self, instance_names=None):
         """ """
 
-    @route_to_all
+    @route_to_all_locked
     def update(self, instance_names=None, force=False, clean=False):
         """ """
 
-    @route
+    @route_locked
     def shutdown(self):
         """ """
 
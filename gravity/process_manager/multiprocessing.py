@@ -1,8 +1,11 @@
 """
 """
 import multiprocessing
+import multiprocessing.connection
 
+import gravity.io
 from gravity.process_manager import BaseProcessManager, ProcessExecutor
+from gravity.restart import PARK_EXIT_CODE
 from gravity.settings import ProcessManager
 
 
@@ -20,14 +23,27 @@ class MultiprocessingProcessManager(BaseProcessManager):
     def follow(self, configs=None, service_names=None, quiet=False):
         """ """
 
+    def __start_process(self, config, service):
+        process = multiprocessing.Process(target=self.process_executor.exec, args=(config, service))
+        process.start()
+        self.processes.append((process, config, service))
+
     def start(self, configs=None, service_names=None):
+        self._reset_restart_backoff(configs)
         for config in configs:
             for service in config.services:
-                process = multiprocessing.Process(target=self.process_executor.exec, args=(config, service))
-                process.start()
-                self.processes.append(process)
-        for process in self.processes:
-            process.join()
+                self.__start_process(config, service)
+        # services that exit are restarted, restarts are delayed by galaxyctl exec according to the restart policy
+        while self.processes:
+            multiprocessing.connection.wait([process.sentinel for process, _, _ in self.processes])
+            for exited in [p for p in self.processes if p[0].exitcode is not None]:
+                self.processes.remove(exited)
+                process, config, service = exited
+                if process.exitcode == PARK_EXIT_CODE:
+                    gravity.io.error(f"{config.instance_name}:{service.service_name} is restarting in a loop, not restarting it")
+                    continue
+                gravity.io.warn(f"{config.instance_name}:{service.service_name} exited with code {process.exitcode}, restarting")
+                self.__start_process(config, service)
 
     def pm(self, *args, **kwargs):
         """ """
@@ -44,7 +60,7 @@ class MultiprocessingProcessManager(BaseProcessManager):
     def restart(self, configs=None, service_names=None):
         """ """
 
-    def graceful(self, configs=None, service_names=None):
+    def graceful(self, configs=None, service_names=None, changed=False):
         """ """
 
     def status(self, configs=None, service_names=None):
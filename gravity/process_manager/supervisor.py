@@ -3,17 +3,20 @@
 import os
 import shlex
 import subprocess
-import time
 from functools import partial
 from glob import glob
 
 import gravity.io
-from gravity.process_manager import BaseProcessManager
-from gravity.settings import ProcessManager
+from gravity import load_balancer, trace
+from gravity.atomic import write_file
+from gravity.locks import lock
+from gravity.process_manager import SERVICE_FORMAT_VARS, BaseProcessManager
+from gravity.restart import PARK_EXIT_CODE
+from gravity.settings import ProcessManager, ServiceCommandStyle
 from gravity.state import GracefulMethod
+from gravity.template import compile_template, render
 from gravity.util import which
-
-from supervisor import supervisorctl  # type: ignore
+from gravity.wait import wait_for
 
 SUPERVISORD_START_TIMEOUT = 60
 DEFAULT_SUPERVISOR_SOCKET_PATH = os.environ.get("SUPERVISORD_SOCKET", '%(here)s/supervisor.sock')
@@ -50,7 +53,8 @@ command         = {command}
 directory       = {galaxy_root}
 umask           = {galaxy_umask}
 autostart       = true
-autorestart     = true
+autorestart     = {supervisor_autorestart}
+exitcodes       = {supervisor_exitcodes}
 stopasgroup     = true
 startsecs       = {settings[start_timeout]}
 stopwaitsecs    = {settings[stop_timeout]}
@@ -71,6 +75,22 @@ SUPERVISORD_GROUP_TEMPLATE = """;
 programs = {programs}
 """
 
+SUPERVISOR_FORMAT_VARS = SERVICE_FORMAT_VARS | frozenset((
+    "log_dir",
+    "log_file",
+    "instance_number",
+    "supervisor_program_name",
+    "supervisor_process_name",
+    "supervisor_numprocs_start",
+    "supervisor_autorestart",
+    "supervisor_exitcodes",
+))
+
+SUPERVISORD_CONF = compile_template(
+    SUPERVISORD_CONF_TEMPLATE, names=frozenset(("supervisor_state_dir", "supervisord_conf_dir")), name="supervisord.conf")
+SUPERVISORD_SERVICE = compile_template(SUPERVISORD_SERVICE_TEMPLATE, names=SUPERVISOR_FORMAT_VARS, name="supervisor program")
+SUPERVISORD_GROUP = compile_template(SUPERVISORD_GROUP_TEMPLATE, names=frozenset(("instance_name", "programs")), name="supervisor group")
+
 DEFAULT_STATE_DIR = os.path.expanduser(os.path.join("~", ".config", "galaxy-gravity"))
 if "XDG_CONFIG_HOME" in os.environ:
     DEFAULT_STATE_DIR = os.path.join(os.environ["XDG_CONFIG_HOME"], "galaxy-gravity")
@@ -157,6 +177,7 @@ class SupervisorProcessManager(BaseProcessManager):
         self.supervisord_conf_path = os.path.join(self.supervisor_state_dir, "supervisord.conf")
         self.supervisord_conf_dir = os.path.join(self.supervisor_state_dir, "supervisord.conf.d")
         self.supervisord_pid_path = os.path.join(self.supervisor_state_dir, "supervisord.pid")
+        self.supervisord_lock_path = os.path.join(self.supervisor_state_dir, "supervisord.lock")
         self.supervisord_sock_path = os.environ.get("SUPERVISORD_SOCKET", os.path.join(self.supervisor_state_dir, "supervisor.sock"))
         self.__supervisord_popen = None
         self.foreground = foreground
@@ -179,27 +200,40 @@ class SupervisorProcessManager(BaseProcessManager):
         supervisord_cmd = [self.supervisord_exe, "-c", self.supervisord_conf_path]
         if self.foreground:
             supervisord_cmd.append('--nodaemon')
-        if not self.__supervisord_is_running():
-            # any time that supervisord is not running, let's rewrite supervisord.conf
-            if not os.path.exists(self.supervisord_conf_dir):
-                os.makedirs(self.supervisord_conf_dir)
-            open(self.supervisord_conf_path, "w").write(SUPERVISORD_CONF_TEMPLATE.format(**format_vars))
-            self.__supervisord_popen = subprocess.Popen(supervisord_cmd, env=os.environ)
-            rc = self.__supervisord_popen.poll()
-            if rc:
-                gravity.io.error("supervisord exited with code %d" % rc)
-            start = time.time()
-            while not os.path.exists(self.supervisord_pid_path) or not os.path.exists(self.supervisord_sock_path):
-                if (time.time() - start) > SUPERVISORD_START_TIMEOUT:
-                    gravity.io.exception("Timed out waiting for supervisord to start")
+        # held while starting so that simultaneous galaxyctl commands do not each start a supervisord
+        with lock(self.supervisord_lock_path, "supervisord"):
+            if not self.__supervisord_is_running():
+                # any time that supervisord is not running, let's rewrite supervisord.conf
+                if not os.path.exists(self.supervisord_conf_dir):
+                    os.makedirs(self.supervisord_conf_dir)
+                write_file(self.supervisord_conf_path, SUPERVISORD_CONF.render(format_vars, name="supervisord.conf"))
+                self.__supervisord_popen = subprocess.Popen(supervisord_cmd, env=os.environ)
                 gravity.io.debug(f"Waiting for {self.supervisord_pid_path}")
-                time.sleep(0.5)
+                with trace.span("wait for supervisord to start"):
+                    started = wait_for(self.__supervisord_is_ready, self.supervisor_state_dir, timeout=SUPERVISORD_START_TIMEOUT)
+                if not started:
+                    gravity.io.exception("Timed out waiting for supervisord to start")
+
+    def __supervisord_is_ready(self):
+        rc = self.__supervisord_popen.poll()
+        if rc:
+            gravity.io.exception("supervisord exited with code %d" % rc)
+        if not os.path.exists(self.supervisord_pid_path) or not os.path.exists(self.supervisord_sock_path):
+            return False
+        # the socket exists, confirm that supervisord is accepting requests
+        try:
+            return self.__get_supervisor().getState()["statename"] == "RUNNING"
+        except Exception as exc:
+            gravity.io.debug(f"supervisord is not ready: {exc}")
+            return False
 
     def __get_supervisor(self):
         """Return the supervisor proxy object
 
         Should probably use this more rather than supervisorctl directly
         """
+        from supervisor import supervisorctl  # type: ignore
+
         options = supervisorctl.ClientOptions()
         options.realize(args=["-c", self.supervisord_conf_path])
         return supervisorctl.Controller(options).get_supervisor()
@@ -208,7 +242,7 @@ class SupervisorProcessManager(BaseProcessManager):
         return "%(ENV_PATH)s"
 
     def _service_environment_formatter(self, environment, format_vars):
-        return ",".join("{}={}".format(k, shlex.quote(v.format(**format_vars))) for k, v in environment.items())
+        return ",".join("{}={}".format(k, shlex.quote(render(v, format_vars, name=f"environment variable {k}"))) for k, v in environment.items())
 
     def terminate(self):
         if self.foreground:
@@ -247,11 +281,14 @@ class SupervisorProcessManager(BaseProcessManager):
             pm_files.add(os.path.join(self.supervisord_conf_dir, f"group_{instance_name}.conf"))
         return pm_files
 
+    def program_names(self, config):
+        return self.__supervisor_program_names(config, None)
+
     def _all_present_pm_files(self):
         return (glob(os.path.join(self.supervisord_conf_dir, "*.d", "*")) +
                 glob(os.path.join(self.supervisord_conf_dir, "group_*.conf")))
 
-    def __update_service(self, config, service, instance_conf_dir, instance_name, force):
+    def __service_format_vars(self, config, service):
         program = SupervisorProgram(config, service, self._use_instance_name)
         # supervisor-specific format vars
         supervisor_format_vars = {
@@ -261,45 +298,75 @@ class SupervisorProcessManager(BaseProcessManager):
             "supervisor_program_name": program.config_program_name,
             "supervisor_process_name": program.config_process_name,
             "supervisor_numprocs_start": program.config_numprocs_start,
+            "supervisor_autorestart": "true",
+            "supervisor_exitcodes": "0",
         }
+        if config.service_command_style != ServiceCommandStyle.direct:
+            # the program is run by galaxyctl exec or gravity.launch, which exit with PARK_EXIT_CODE to park a service
+            # that is restarting in a loop, see gravity.restart
+            supervisor_format_vars["supervisor_autorestart"] = "unexpected"
+            supervisor_format_vars["supervisor_exitcodes"] = str(PARK_EXIT_CODE)
 
-        format_vars = self._service_format_vars(config, service, supervisor_format_vars)
-
-        conf = os.path.join(instance_conf_dir, program.config_file_name)
-        template = SUPERVISORD_SERVICE_TEMPLATE
-        contents = template.format(**format_vars)
-        name = service.service_name if not self._use_instance_name else f"{instance_name}:{service.service_name}"
-        if self._update_file(conf, contents, name, "service", force):
-            self.supervisorctl('reread')
-        return conf
-
-    def __process_config(self, config, force):
-        """Perform necessary supervisor config updates as per current Galaxy/Gravity configuration.
+        return program, self._service_format_vars(config, service, supervisor_format_vars)
 
-        Does not call ``supervisorctl update``.
-        """
+    def render_pm_files(self, config):
         instance_name = config.instance_name
         instance_conf_dir = os.path.join(self.supervisord_conf_dir, f"{instance_name}.d")
 
+        rendered = self._render_launch_specs(config)
         programs = []
+        confs = []
+        format_vars_list = []
         for service in config.services:
-            self.__update_service(config, service, instance_conf_dir, instance_name, force)
+            with trace.span("supervisor program format vars", service=service.service_name):
+                program, format_vars = self.__service_format_vars(config, service)
+            name = service.service_name if not self._use_instance_name else f"{instance_name}:{service.service_name}"
+            confs.append((os.path.join(instance_conf_dir, program.config_file_name), name))
+            format_vars_list.append(format_vars)
             programs.append(f"{instance_name}_{service.service_type}_{service.service_name}")
+        with trace.span("render supervisor programs", instance=instance_name):
+            contents = SUPERVISORD_SERVICE.render_many(
+                format_vars_list, names=[f"supervisor program for {s.service_name}" for s in config.services])
+        rendered.extend((conf, c, name, "service") for (conf, name), c in zip(confs, contents))
 
-        group_conf = os.path.join(self.supervisord_conf_dir, f"group_{instance_name}.conf")
         if self._use_instance_name:
+            group_conf = os.path.join(self.supervisord_conf_dir, f"group_{instance_name}.conf")
             format_vars = {"instance_name": instance_name, "programs": ",".join(programs)}
-            contents = SUPERVISORD_GROUP_TEMPLATE.format(**format_vars)
-            if self._update_file(group_conf, contents, instance_name, "supervisor group", force):
-                self.supervisorctl('reread')
-        elif os.path.exists(group_conf):
-            os.unlink(group_conf)
+            contents = SUPERVISORD_GROUP.render(format_vars, name="supervisor group")
+            rendered.append((group_conf, contents, instance_name, "supervisor group"))
+        return rendered
+
+    def __process_config(self, config, force):
+        """Perform necessary supervisor config updates as per current Galaxy/Gravity configuration.
+
+        Does not call ``supervisorctl update``.
+        """
+        # all configs are rendered before any are written so that a template error does not leave a partial update
+        with trace.span("render pm files", instance=config.instance_name):
+            rendered = self.render_pm_files(config)
+        self._remove_stale_launch_specs(config, rendered)
+
+        group_conf = os.path.join(self.supervisord_conf_dir, f"group_{config.instance_name}.conf")
+        if not self._use_instance_name and os.path.exists(group_conf):
+            with self._pm_file_transaction() as transaction:
+                transaction.remove(group_conf)
+
+        updated = [self._update_file(*file_args, force) for file_args in rendered]
+        return any(updated)
 
     def __process_configs(self, configs, force):
-        for config in configs:
-            self.__process_config(config, force)
-            if not os.path.exists(config.log_dir):
-                os.makedirs(config.log_dir)
+        """Write the supervisor configs of ``configs`` and return the configs whose programs changed."""
+        # configs are only reread once all changes to all instances have been committed
+        updated = []
+        with self._pm_file_transaction():
+            for config in configs:
+                if self.__process_config(config, force):
+                    updated.append(config)
+                if not os.path.exists(config.log_dir):
+                    os.makedirs(config.log_dir)
+        if updated:
+            self.supervisorctl('reread')
+        return updated
 
     def __supervisor_programs(self, config, service_names):
         services = config.get_services(service_names)
@@ -330,14 +397,19 @@ class SupervisorProcessManager(BaseProcessManager):
                 graceful_method = service.graceful_method
                 if graceful_method == GracefulMethod.SIGHUP:
                     self.supervisorctl("signal", "SIGHUP", *program.program_names)
-                elif graceful_method == GracefulMethod.ROLLING:
+                    continue
+                elif graceful_method == GracefulMethod.NONE:
+                    continue
+                # deliberate restarts are not delayed or parked by the restart policy
+                self._reset_restart_backoff([config], [service.service_name])
+                if graceful_method == GracefulMethod.ROLLING:
                     self.__rolling_restart(config, service, program)
-                elif graceful_method != GracefulMethod.NONE:
+                else:
                     self.supervisorctl("restart", *program.program_names)
 
     def __rolling_restart(self, config, service, program):
         restart_callbacks = list(partial(self.supervisorctl, "restart", p) for p in program.program_names)
-        service.rolling_restart(restart_callbacks)
+        service.rolling_restart(restart_callbacks, **load_balancer.rolling_restart_hooks(config, service))
 
     def follow(self, configs=None, service_names=None, quiet=False):
         # supervisor has a built-in tail command but it only works on a single log file. `galaxyctl pm tail ...` can be
@@ -361,12 +433,15 @@ class SupervisorProcessManager(BaseProcessManager):
 
     def start(self, configs=None, service_names=None):
         self.update(configs=configs)
+        self._reset_restart_backoff(configs, service_names)
         self.__supervisord()
         self.__op_on_programs("start", configs, service_names)
+        self._record_fingerprints(configs, service_names, only_missing=True)
         self.supervisorctl("status")
 
     def stop(self, configs=None, service_names=None):
         self.__op_on_programs("stop", configs, service_names)
+        self._forget_fingerprints(configs, service_names)
         # Exit supervisor if all processes are stopped
         supervisor = self.__get_supervisor()
         if self.__supervisord_is_running():
@@ -383,15 +458,19 @@ class SupervisorProcessManager(BaseProcessManager):
             self.__supervisord()
             gravity.io.warn("supervisord was not previously running; it has been started, so the 'restart' command has been ignored")
         else:
+            self._reset_restart_backoff(configs, service_names)
             self.__op_on_programs("restart", configs, service_names)
+            self._record_fingerprints(configs, service_names)
 
-    def graceful(self, configs=None, service_names=None):
+    def graceful(self, configs=None, service_names=None, changed=False):
         self.update(configs=configs)
         if not self.__supervisord_is_running():
             self.__supervisord()
             gravity.io.warn("supervisord was not previously running; it has been started, so the 'graceful' command has been ignored")
         else:
-            self.__reload_graceful(configs, service_names)
+            for config, services in self._graceful_services(configs, service_names, changed=changed):
+                self.__reload_graceful([config], [s.service_name for s in services])
+                self._record_graceful_fingerprints(config, services)
 
     def status(self, configs=None, service_names=None):
         # TODO: create our own formatted output
@@ -400,28 +479,36 @@ class SupervisorProcessManager(BaseProcessManager):
         self.__op_on_programs("status", configs, service_names)
 
     def shutdown(self):
-        self.supervisorctl("shutdown")
-        while self.__supervisord_is_running():
+        with lock(self.supervisord_lock_path, "supervisord"):
+            self.supervisorctl("shutdown")
+            self._forget_fingerprints(self.config_manager.get_configs(process_manager=self.name))
             gravity.io.debug("Waiting for supervisord to terminate")
-            time.sleep(0.5)
+            with trace.span("wait for supervisord to terminate"):
+                wait_for(lambda: not self.__supervisord_is_running(), self.supervisor_state_dir)
         gravity.io.info("supervisord has terminated")
 
     def update(self, configs=None, force=False, clean=False):
         """Add newly defined servers, remove any that are no longer present"""
         self._pre_update(configs, force, clean)
+        updated = []
         if not clean:
-            self.__process_configs(configs, force)
+            updated = self.__process_configs(configs, force)
         # only need to update if supervisord is running, otherwise changes will be picked up at next start
         if self.__supervisord_is_running():
+            # `supervisorctl update` restarts the changed programs, which is not a restart loop
+            self._reset_restart_backoff(updated)
             self.supervisorctl("update")
 
     def supervisorctl(self, *args):
         if not self.__supervisord_is_running():
             gravity.io.warn("supervisord is not running")
             return
+        from supervisor import supervisorctl  # type: ignore
+
         try:
             gravity.io.debug("Calling supervisorctl with args: %s", list(args))
-            supervisorctl.main(args=["-c", self.supervisord_conf_path] + list(args))
+            with trace.span("supervisorctl", args=" ".join(args)):
+                supervisorctl.main(args=["-c", self.supervisord_conf_path] + list(args))
         except SystemExit as e:
             # supervisorctl.main calls sys.exit(), so we catch that
             if e.code == 0:
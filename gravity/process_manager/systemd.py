@@ -8,9 +8,13 @@ from glob import glob
 from functools import partial
 
 import gravity.io
-from gravity.process_manager import BaseProcessManager
+from gravity import load_balancer, placement, trace
+from gravity.restart import systemd_restart_steps
+from gravity.process_manager import SERVICE_FORMAT_VARS, BaseProcessManager
+from gravity.sd_notify import notify_enabled
 from gravity.settings import ProcessManager
 from gravity.state import GracefulMethod
+from gravity.template import compile_template, render
 
 SYSTEMD_TARGET_HASH_RE = r";\s*GRAVITY=([0-9a-f]+)"
 
@@ -23,10 +27,12 @@ Description={systemd_description}
 After=network.target
 After=time-sync.target
 PartOf={systemd_target}
+{systemd_start_limit}
 
 [Service]
 UMask={galaxy_umask}
-Type=simple
+Type={systemd_type}
+{systemd_notify_access}
 {systemd_user_group}
 WorkingDirectory={galaxy_root}
 TimeoutStartSec={settings[start_timeout]}
@@ -34,8 +40,8 @@ TimeoutStopSec={settings[stop_timeout]}
 ExecStart={command}
 {systemd_exec_reload}
 {environment}
-{systemd_memory_limit}
-Restart=always
+{systemd_resource_control}
+{systemd_restart}
 
 MemoryAccounting=yes
 CPUAccounting=yes
@@ -62,6 +68,80 @@ Wants={systemd_target_wants}
 WantedBy=multi-user.target
 """
 
+SYSTEMD_SLICE_TEMPLATE = """;
+; This file is maintained by Gravity - CHANGES WILL BE OVERWRITTEN
+;
+
+[Unit]
+Description={systemd_description}
+Before=slices.target
+
+[Slice]
+MemoryAccounting=yes
+CPUAccounting=yes
+IOAccounting=yes
+TasksAccounting=yes
+{systemd_slice_limits}
+"""
+
+SYSTEMD_FORMAT_VARS = SERVICE_FORMAT_VARS | frozenset((
+    "systemd_type",
+    "systemd_notify_access",
+    "instance_number",
+    "systemd_user_group",
+    "systemd_exec_reload",
+    "systemd_resource_control",
+    "systemd_restart",
+    "systemd_start_limit",
+    "systemd_description",
+    "systemd_target",
+))
+
+SYSTEMD_SERVICE = compile_template(SYSTEMD_SERVICE_TEMPLATE, names=SYSTEMD_FORMAT_VARS, name="systemd service unit")
+SYSTEMD_TARGET = compile_template(
+    SYSTEMD_TARGET_TEMPLATE, names=frozenset(("gravity_config_hash", "systemd_description", "systemd_target_wants")),
+    name="systemd target unit")
+SYSTEMD_SLICE = compile_template(
+    SYSTEMD_SLICE_TEMPLATE, names=frozenset(("systemd_description", "systemd_slice_limits")), name="systemd slice unit")
+
+# the slice (within the instance's slice) that services of each type are grouped in, other types are grouped by type
+SYSTEMD_SLICE_GROUPS = {
+    "gunicorn": "web",
+    "unicornherder": "web",
+    "standalone": "handlers",
+    "celery": "celery",
+    "celery-beat": "celery",
+}
+INSTANCE_SLICE_KEY = "instance"
+SYSTEMD_SLICE_LIMITS = (
+    ("memory_max", "MemoryMax={}G"),
+    ("memory_high", "MemoryHigh={}G"),
+    ("cpu_weight", "CPUWeight={}"),
+    ("io_weight", "IOWeight={}"),
+    ("tasks_max", "TasksMax={}"),
+)
+
+
+def service_slice_group(service):
+    return SYSTEMD_SLICE_GROUPS.get(service.service_type, service.service_type)
+
+
+def systemd_escape(name):
+    """Escape ``name`` for use in a unit name in the same way as ``systemd-escape``.
+
+    Escaping "-", which denotes the hierarchy in slice unit names, keeps e.g. ``a-b`` and ``a_b`` from mapping to the same
+    unit.
+    """
+    escaped = []
+    for i, char in enumerate(name):
+        if char == "/":
+            escaped.append("-")
+        elif (char.isascii() and char.isalnum()) or char in ":_" or (char == "." and i > 0):
+            escaped.append(char)
+        else:
+            escaped.extend(f"\\x{byte:02x}" for byte in char.encode("utf-8"))
+    return "".join(escaped)
+
 
 class SystemdService:
     # converts between different formats
@@ -134,7 +214,8 @@ class SystemdProcessManager(BaseProcessManager):
         if capture:
             call = subprocess.check_output
         try:
-            return call(["systemctl"] + args, text=True)
+            with trace.span("systemctl", args=" ".join(args)):
+                return call(["systemctl"] + args, text=True)
         except subprocess.CalledProcessError as exc:
             if exc.returncode in not_found_rc:
                 gravity.io.exception("Some expected systemd units were not found, did you forget to run `galaxyctl update`?")
@@ -155,7 +236,7 @@ class SystemdProcessManager(BaseProcessManager):
                 return line.split("=", 1)[1]
 
     def _service_environment_formatter(self, environment, format_vars):
-        return "\n".join("Environment={}={}".format(k, shlex.quote(v.format(**format_vars))) for k, v in environment.items())
+        return "\n".join("Environment={}={}".format(k, shlex.quote(render(v, format_vars, name=f"environment variable {k}"))) for k, v in environment.items())
 
     def terminate(self):
         # this is used to stop a foreground supervisord in the supervisor PM, so it is a no-op here
@@ -165,6 +246,32 @@ class SystemdProcessManager(BaseProcessManager):
         instance_name = f"-{config.instance_name}" if self._use_instance_name else ""
         return f"galaxy{instance_name}.target"
 
+    def __slice_unit_name(self, config, group=None):
+        instance_name = f"-{systemd_escape(config.instance_name)}" if self._use_instance_name else ""
+        group = f"-{systemd_escape(group)}" if group else ""
+        return f"galaxy{instance_name}{group}.slice"
+
+    def __render_slices(self, config):
+        rendered = []
+        groups = [None] + list(dict.fromkeys(service_slice_group(service) for service in config.services))
+        for group in groups:
+            unit_name = self.__slice_unit_name(config, group)
+            limits = config.systemd_slices.get(group or INSTANCE_SLICE_KEY) or {}
+            description = "Galaxy"
+            if self._use_instance_name:
+                description += f" {config.instance_name}"
+            if group:
+                description += f" {group}"
+            format_vars = {
+                "systemd_description": f"{description} services",
+                "systemd_slice_limits": "\n".join(
+                    directive.format(limits[key]) for key, directive in SYSTEMD_SLICE_LIMITS if limits.get(key) is not None
+                ),
+            }
+            contents = SYSTEMD_SLICE.render(format_vars, name=f"systemd unit {unit_name}")
+            rendered.append((os.path.join(self.__systemd_unit_dir, unit_name), contents, unit_name, "systemd unit"))
+        return rendered
+
     def __unit_files_to_active_unit_names(self, unit_files):
         unit_names = []
         for unit_file in unit_files:
@@ -181,8 +288,9 @@ class SystemdProcessManager(BaseProcessManager):
     def _disable_and_remove_pm_files(self, unit_files):
         for target in [u for u in unit_files if u.endswith(".target")]:
             self.__systemctl("disable", "--now", os.path.basename(target))
-        # stopping all the targets should also stop all the services, but we'll check to be sure
-        active_unit_names = self.__unit_files_to_active_unit_names(unit_files)
+        # stopping all the targets should also stop all the services, but we'll check to be sure. slices are not stopped,
+        # since that would stop any services still running in them, they are unloaded by systemd once empty
+        active_unit_names = self.__unit_files_to_active_unit_names([u for u in unit_files if not u.endswith(".slice")])
         if active_unit_names:
             gravity.io.info(f"Stopping active units: {', '.join(active_unit_names)}")
             self.__systemctl("disable", "--now", *active_unit_names)
@@ -213,6 +321,9 @@ class SystemdProcessManager(BaseProcessManager):
             if target_hash == config.path_hash:
                 unit_files.add(target)
                 unit_files.update(glob(f"{os.path.splitext(target)[0]}-*.service"))
+                instance_slice = os.path.join(self.__systemd_unit_dir, self.__slice_unit_name(config))
+                unit_files.update(glob(instance_slice))
+                unit_files.update(glob(f"{os.path.splitext(instance_slice)[0]}-*.slice"))
         return unit_files
 
     def _intended_pm_files_for_config(self, config):
@@ -222,14 +333,24 @@ class SystemdProcessManager(BaseProcessManager):
             unit_files.add(os.path.join(self.__systemd_unit_dir, systemd_service.unit_file_name))
         target_unit_name = self.__target_unit_name(config)
         unit_files.add(os.path.join(self.__systemd_unit_dir, target_unit_name))
+        if config.systemd_slices is not None:
+            unit_files.update(r[0] for r in self.__render_slices(config))
         return unit_files
 
+    def program_names(self, config):
+        unit_names = [self.__target_unit_name(config)]
+        for service in config.services:
+            unit_names.extend(SystemdService(config, service, self._use_instance_name).unit_names)
+        return unit_names
+
     def _all_present_pm_files(self):
         return (glob(os.path.join(self.__systemd_unit_dir, "galaxy-*.service")) +
                 glob(os.path.join(self.__systemd_unit_dir, "galaxy-*.target")) +
-                glob(os.path.join(self.__systemd_unit_dir, "galaxy.target")))
+                glob(os.path.join(self.__systemd_unit_dir, "galaxy.target")) +
+                glob(os.path.join(self.__systemd_unit_dir, "galaxy-*.slice")) +
+                glob(os.path.join(self.__systemd_unit_dir, "galaxy.slice")))
 
-    def __update_service(self, config, service, systemd_service: SystemdService, force: bool):
+    def __service_format_vars(self, config, service, systemd_service: SystemdService):
         # under supervisor we expect that gravity is installed in the galaxy venv and the venv is active when gravity
         # runs, but under systemd this is not the case. we do assume $VIRTUAL_ENV is the galaxy venv if running as an
         # unprivileged user, though.
@@ -242,21 +363,49 @@ class SystemdProcessManager(BaseProcessManager):
         elif not virtualenv_dir:
             gravity.io.exception("The `virtualenv` Gravity config option must be set when using the systemd process manager")
 
+        resource_control = []
         memory_limit = service.settings.get("memory_limit") or config.memory_limit
         if memory_limit:
-            memory_limit = f"MemoryLimit={memory_limit}G"
+            # MemoryLimit= is the deprecated cgroup v1 equivalent, which slices (and their limits) are not used with
+            memory_directive = "MemoryMax" if config.systemd_slices is not None else "MemoryLimit"
+            resource_control.append(f"{memory_directive}={memory_limit}G")
+        placement_in_unit = placement.in_systemd_unit(config, service)
+        if placement_in_unit:
+            resource_control.extend(placement.systemd_directives(service.settings))
+        if config.systemd_slices is not None:
+            resource_control.append(f"Slice={self.__slice_unit_name(config, service_slice_group(service))}")
+
+        restart_policy = service.restart_policy
+        restart = ["Restart=always", f"RestartSec={restart_policy['delay']:g}"]
+        restart_steps = systemd_restart_steps(restart_policy)
+        if restart_steps:
+            restart.extend([f"RestartSteps={restart_steps}", f"RestartMaxDelaySec={restart_policy['max_delay']:g}"])
+        start_limit = ""
+        if restart_policy["burst"]:
+            start_limit = f"StartLimitIntervalSec={restart_policy['interval']}\nStartLimitBurst={restart_policy['burst']}"
 
         exec_reload = None
         if service.graceful_method == GracefulMethod.SIGHUP:
             exec_reload = "ExecReload=/bin/kill -HUP $MAINPID"
 
+        systemd_type = "simple"
+        notify_access = None
+        if notify_enabled(config, service):
+            systemd_type = "notify"
+            # readiness is reported by a galaxyctl exec sidecar, not the main process
+            notify_access = "NotifyAccess=all"
+
         # systemd-specific format vars
         systemd_format_vars = {
+            "systemd_type": systemd_type,
+            "systemd_notify_access": notify_access or "",
             "virtualenv_bin": shlex.quote(f'{os.path.join(virtualenv_dir, "bin")}{os.path.sep}'),
             "instance_number": "%i",
             "systemd_user_group": "",
             "systemd_exec_reload": exec_reload or "",
-            "systemd_memory_limit": memory_limit or "",
+            "systemd_resource_control": "\n".join(resource_control),
+            "systemd_restart": "\n".join(restart),
+            "systemd_start_limit": start_limit,
             "systemd_description": systemd_service.description,
             "systemd_target": self.__target_unit_name(config),
         }
@@ -265,22 +414,27 @@ class SystemdProcessManager(BaseProcessManager):
             if config.galaxy_group is not None:
                 systemd_format_vars["systemd_user_group"] += f"\nGroup={config.galaxy_group}"
 
-        format_vars = self._service_format_vars(config, service, systemd_format_vars)
-
-        unit_file = systemd_service.unit_file_name
-        conf = os.path.join(self.__systemd_unit_dir, unit_file)
-        template = SYSTEMD_SERVICE_TEMPLATE
-        contents = template.format(**format_vars)
-        self._update_file(conf, contents, unit_file, "systemd unit", force)
+        return self._service_format_vars(config, service, systemd_format_vars, apply_placement=not placement_in_unit)
 
-    def __process_config(self, config, force):
+    def render_pm_files(self, config):
+        rendered = self._render_launch_specs(config)
+        if config.systemd_slices is not None:
+            rendered.extend(self.__render_slices(config))
         service_units = []
+        unit_files = []
+        format_vars_list = []
         for service in config.services:
             systemd_service = SystemdService(config, service, self._use_instance_name)
-            self.__update_service(config, service, systemd_service, force)
+            with trace.span("systemd unit format vars", service=service.service_name):
+                format_vars_list.append(self.__service_format_vars(config, service, systemd_service))
+            unit_files.append(systemd_service.unit_file_name)
             service_units.extend(systemd_service.unit_names)
+        with trace.span("render systemd units", instance=config.instance_name):
+            contents = SYSTEMD_SERVICE.render_many(format_vars_list, names=[f"systemd unit {u}" for u in unit_files])
+        rendered.extend(
+            (os.path.join(self.__systemd_unit_dir, u), c, u, "systemd unit") for u, c in zip(unit_files, contents))
 
-        # create systemd target
+        # create systemd target, which is always last
         target_unit_name = self.__target_unit_name(config)
         target_conf = os.path.join(self.__systemd_unit_dir, target_unit_name)
         format_vars = {
@@ -290,13 +444,29 @@ class SystemdProcessManager(BaseProcessManager):
         }
         if self._use_instance_name:
             format_vars["systemd_description"] += f" {config.instance_name}"
-        contents = SYSTEMD_TARGET_TEMPLATE.format(**format_vars)
-        if self._update_file(target_conf, contents, target_unit_name, "systemd unit", force):
-            self.__systemctl("enable", target_conf)
+        contents = SYSTEMD_TARGET.render(format_vars, name=f"systemd unit {target_unit_name}")
+        rendered.append((target_conf, contents, target_unit_name, "systemd unit"))
+        return rendered
+
+    def __process_config(self, config, force):
+        # all units are rendered before any are written so that a template error does not leave a partial update
+        with trace.span("render pm files", instance=config.instance_name):
+            rendered = self.render_pm_files(config)
+        self._remove_stale_launch_specs(config, rendered)
+        target_args = rendered.pop()
+
+        for file_args in rendered:
+            self._update_file(*file_args, force)
+        return self._update_file(*target_args, force) and target_args[0]
 
     def __process_configs(self, configs, force):
-        for config in configs:
-            self.__process_config(config, force)
+        # targets are only enabled once all changes to all instances have been committed
+        updated_targets = []
+        with self._pm_file_transaction():
+            for config in configs:
+                updated_targets.append(self.__process_config(config, force))
+        for target_conf in filter(None, updated_targets):
+            self.__systemctl("enable", target_conf)
 
     def __unit_names(self, configs, service_names, use_target=True, include_services=False):
         unit_names = []
@@ -319,44 +489,54 @@ class SystemdProcessManager(BaseProcessManager):
         u_args = [i for sl in list(zip(["-u"] * len(unit_names), unit_names)) for i in sl]
         self.__journalctl("-f", *u_args)
 
+    def __reset_failed(self, configs, service_names):
+        # services that hit their start limit are not started again until their failed state is reset
+        unit_names = self.__unit_names(configs, service_names, use_target=False)
+        self.__systemctl("reset-failed", *unit_names, ignore_rc=(1,))
+
     def start(self, configs=None, service_names=None):
         """ """
         self.update(configs=configs)
+        self.__reset_failed(configs, service_names)
         unit_names = self.__unit_names(configs, service_names)
         self.__systemctl("start", *unit_names, not_found_rc=(5,))
+        self._record_fingerprints(configs, service_names, only_missing=True)
         self.status(configs=configs, service_names=service_names)
 
     def stop(self, configs=None, service_names=None):
         """ """
         unit_names = self.__unit_names(configs, service_names)
         self.__systemctl("stop", *unit_names, not_found_rc=(5,))
+        self._forget_fingerprints(configs, service_names)
         self.status(configs=configs, service_names=service_names)
 
     def restart(self, configs=None, service_names=None):
         """ """
         # this can result in a double restart if your configs changed, not ideal but we can't really control that
         self.update(configs=configs)
+        self.__reset_failed(configs, service_names)
         unit_names = self.__unit_names(configs, service_names)
         self.__systemctl("restart", *unit_names, not_found_rc=(5,))
+        self._record_fingerprints(configs, service_names)
         self.status(configs=configs, service_names=service_names)
 
     def __graceful_service(self, config, service, service_names):
         systemd_service = SystemdService(config, service, self._use_instance_name)
         if service.graceful_method == GracefulMethod.ROLLING:
             restart_callbacks = list(partial(self.__systemctl, "reload-or-restart", u) for u in systemd_service.unit_names)
-            service.rolling_restart(restart_callbacks)
+            service.rolling_restart(restart_callbacks, **load_balancer.rolling_restart_hooks(config, service))
         elif service.graceful_method != GracefulMethod.NONE:
             self.__systemctl("reload-or-restart", *systemd_service.unit_names, not_found_rc=(5,))
             gravity.io.info(f"Restarted: {', '.join(systemd_service.unit_names)}")
 
-    def graceful(self, configs=None, service_names=None):
+    def graceful(self, configs=None, service_names=None, changed=False):
         """ """
         self.update(configs=configs)
         # reload-or-restart on a target does a restart on its services, so we use the services directly
-        for config in configs:
-            services = config.get_services(service_names)
+        for config, services in self._graceful_services(configs, service_names, changed=changed):
             for service in services:
                 self.__graceful_service(config, service, service_names)
+            self._record_graceful_fingerprints(config, services)
 
     def status(self, configs=None, service_names=None):
         """ """
@@ -378,11 +558,12 @@ class SystemdProcessManager(BaseProcessManager):
 
     def shutdown(self):
         """ """
+        configs = self.config_manager.get_configs(process_manager=self.name)
         if self._use_instance_name:
-            configs = self.config_manager.get_configs(process_manager=self.name)
             self.__systemctl("stop", *[f"galaxy-{c.instance_name}.target" for c in configs])
         else:
             self.__systemctl("stop", "galaxy.target")
+        self._forget_fingerprints(configs)
 
     def pm(self, *args):
         """ """
@@ -0,0 +1,87 @@
+""" Readiness probes, used to wait for services to become ready after they are (re)started.
+
+Gunicorn services are ready once they respond to requests. Job handlers serve no requests, so handler pools can be
+configured with a ``readiness`` check (see :class:`gravity.settings.ReadinessSettings`): a heartbeat file written by the
+handler, a marker written to its log, or simply that it has been running for a while. Services with a readiness check
+are restarted in a rolling fashion by ``galaxyctl graceful`` and can report readiness to systemd.
+
+A probe is created when its service is (re)started, and its checks are relative to that time, so that e.g. the heartbeat
+of the previous process is not mistaken for that of the new one.
+"""
+import os
+import time
+
+import gravity.io
+from gravity.settings import ReadinessCheck
+
+
+class ReadinessProbe:
+    """Checks the readiness of a service with its ``is_ready`` method."""
+    def __init__(self, service):
+        self.service = service
+        self.since = time.time()
+
+    def ready(self, quiet=True):
+        return self.service.is_ready(quiet=quiet)
+
+
+class HandlerReadinessProbe(ReadinessProbe):
+    """Checks the readiness of a handler according to its ``readiness`` settings.
+
+    If ``since`` is ``None``, the handler is not being restarted, and the check is whether it is currently ready.
+    """
+    def __init__(self, service, since=None):
+        self.service = service
+        self.since = since
+        self.settings = service.settings["readiness"]
+        self.path = None
+        if self.settings.get("path"):
+            self.path = os.path.join(
+                service.config.galaxy_root or os.getcwd(),
+                self.settings["path"].format(server_name=service.settings["server_name"]))
+        # only log written after the restart is searched for the marker
+        self.offset = 0
+        if since is not None and self.settings["check"] == ReadinessCheck.log:
+            self.offset = self._size()
+
+    def _size(self):
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _log(self, quiet, message):
+        if not quiet:
+            gravity.io.error(f"{self.service.service_name} is not ready: {message}")
+
+    def ready(self, quiet=True):
+        check = self.settings["check"]
+        if check == ReadinessCheck.settled:
+            return self.since is None or time.time() - self.since >= self.settings["settle_time"]
+        elif check == ReadinessCheck.heartbeat:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError as exc:
+                self._log(quiet, exc)
+                return False
+            oldest = self.since if self.since is not None else time.time() - self.settings["max_age"]
+            if mtime < oldest:
+                self._log(quiet, f"heartbeat file {self.path} has not been written since {time.ctime(oldest)}")
+                return False
+            return True
+        else:
+            size = self._size()
+            if size < self.offset:
+                # the log was rotated
+                self.offset = 0
+            try:
+                with open(self.path, "rb") as fh:
+                    fh.seek(self.offset)
+                    log = fh.read()
+            except OSError as exc:
+                self._log(quiet, exc)
+                return False
+            if self.settings["marker"].encode("utf-8") not in log:
+                self._log(quiet, f"'{self.settings['marker']}' not found in log file {self.path}")
+                return False
+            return True
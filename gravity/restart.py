@@ -0,0 +1,137 @@
+""" Restart backoff and crash-loop detection.
+
+Under systemd, the restart policy of a service is rendered into its unit (``RestartSec``, ``RestartSteps``,
+``RestartMaxDelaySec``, ``StartLimitBurst``). Other process managers restart services immediately, so for services run
+with ``galaxyctl exec`` or :mod:`gravity.launch`, the policy is implemented before exec: the start times of each service
+instance within the last ``interval`` seconds are recorded in a state file, and each start is delayed by ``delay``
+seconds, multiplied by ``multiplier`` for each previous start, up to ``max_delay``. Once a service has been started
+``burst`` times within ``interval``, it exits with :data:`PARK_EXIT_CODE` rather than starting again, until its state
+is reset by ``galaxyctl start`` or ``galaxyctl restart``. supervisord does not restart programs that exit with this
+code, but only once they have been running for ``startsecs`` (programs that exit sooner are retried until they are
+FATAL), so under supervisor, the policy's ``park_delay`` is ``start_timeout`` and a parked service waits that long
+before exiting. Like systemd's ``RestartSec``, the policy only applies to
+automatic restarts: the state of services that galaxyctl restarts deliberately (with ``restart``, ``graceful``, or an
+``update`` that changes their config) is reset before they are restarted.
+
+Like :mod:`gravity.launch`, this module only imports from the standard library.
+"""
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+RESTART_DIR_NAME = "restarts"
+# EX_TEMPFAIL
+PARK_EXIT_CODE = 75
+DEFAULT_RESTART_POLICY = {
+    "delay": 1,
+    "multiplier": 2,
+    "max_delay": 60,
+    "burst": 0,
+    "interval": 300,
+}
+
+
+def restart_state_dir(gravity_data_dir, instance_name):
+    return os.path.join(gravity_data_dir, RESTART_DIR_NAME, instance_name)
+
+
+def restart_state_path(gravity_data_dir, instance_name, service_name):
+    return os.path.join(restart_state_dir(gravity_data_dir, instance_name), f"{service_name}.json")
+
+
+def restart_policy(*policies):
+    """Merge restart policies (dicts, later ones taking precedence) over the defaults, ignoring unset (``None``)
+    values.
+    """
+    policy = DEFAULT_RESTART_POLICY.copy()
+    for p in policies:
+        policy.update({k: v for k, v in (p or {}).items() if v is not None})
+    return policy
+
+
+def restart_delay(policy, previous_starts):
+    """The delay before a start of a service that was started ``previous_starts`` times within the interval."""
+    if not previous_starts:
+        return 0
+    return min(policy["delay"] * policy["multiplier"] ** (previous_starts - 1), policy["max_delay"])
+
+
+def systemd_restart_steps(policy):
+    """The ``RestartSteps`` that approximate the policy's multiplier, or ``None`` if the delay does not increase."""
+    delay, max_delay, multiplier = policy["delay"], policy["max_delay"], policy["multiplier"]
+    if delay <= 0 or max_delay <= delay or multiplier <= 1:
+        return None
+    return math.ceil(math.log(max_delay / delay, multiplier))
+
+
+def _log(message):
+    print(f"gravity: {message}", file=sys.stderr, flush=True)
+
+
+def _read_starts(path):
+    try:
+        with open(path) as fh:
+            return [float(t) for t in json.load(fh)]
+    except FileNotFoundError:
+        return []
+    except (OSError, TypeError, ValueError) as exc:
+        _log(f"Ignoring unreadable restart state {path}: {exc}")
+        return []
+
+
+def _write_starts(path, starts):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".restart-")
+        with os.fdopen(fd, "w") as fh:
+            json.dump(starts, fh)
+        os.replace(tmp, path)
+    except OSError as exc:
+        _log(f"Unable to write restart state {path}, restarts will not be delayed: {exc}")
+
+
+def backoff(policy):
+    """Record a start of a service, first waiting if it has been restarting in a loop.
+
+    ``policy`` is a restart policy with the additional keys ``name`` (of the service), ``state_file`` and optionally
+    ``park_delay``. Exits with :data:`PARK_EXIT_CODE` (after ``park_delay`` seconds) if the service has been started
+    ``burst`` times in the last ``interval`` seconds.
+    """
+    name = policy["name"]
+    path = policy["state_file"]
+    now = time.time()
+    interval = policy["interval"]
+    starts = [t for t in _read_starts(path) if now - interval < t <= now + policy["max_delay"]]
+    if policy["burst"] and len(starts) >= policy["burst"]:
+        _log(f"{name} was started {len(starts)} times in the last {interval} seconds, it will not be restarted until it "
+             "is started with `galaxyctl start` or `galaxyctl restart`")
+        if policy.get("park_delay"):
+            time.sleep(policy["park_delay"])
+        sys.exit(PARK_EXIT_CODE)
+    delay = restart_delay(policy, len(starts))
+    # the start is recorded at the time the service will actually start
+    _write_starts(path, starts + [now + delay])
+    if delay:
+        _log(f"{name} was started {len(starts)} times in the last {interval} seconds, waiting {delay:g} seconds before "
+             "restarting it")
+        time.sleep(delay)
+
+
+def reset(gravity_data_dir, instance_name, service_names=None):
+    """Remove the restart state of the given services (or all services) of an instance."""
+    state_dir = restart_state_dir(gravity_data_dir, instance_name)
+    try:
+        state_files = os.listdir(state_dir)
+    except FileNotFoundError:
+        return
+    for state_file in state_files:
+        service_name, ext = os.path.splitext(state_file)
+        if ext != ".json" or (service_names and service_name not in service_names):
+            continue
+        try:
+            os.unlink(os.path.join(state_dir, state_file))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,109 @@
+""" systemd readiness notification (``Type=notify``) for services run with ``galaxyctl exec``.
+
+When ``systemd_notify`` is set, units of services that have a readiness check (e.g. gunicorn) are written with
+``Type=notify``, so systemd does not consider them started until they can serve requests. The service itself does not
+implement the ``sd_notify(3)`` protocol, so before exec, ``galaxyctl exec`` forks a sidecar that runs the service's
+readiness check and sends ``READY=1`` to systemd once it passes. While waiting, the sidecar periodically sends
+``EXTEND_TIMEOUT_USEC`` so that services which take longer than ``start_timeout`` to start (e.g. when preloading) are
+not killed, for up to ``restart_timeout`` (or :data:`DEFAULT_READY_TIMEOUT`) seconds.
+
+The service is exec'd without ``NOTIFY_SOCKET`` in its environment, since gunicorn's arbiter sends its own ``READY=1``
+as soon as it boots, before the application is loaded.
+"""
+import os
+import signal
+import socket
+import sys
+import time
+
+import gravity.io
+from gravity.settings import ProcessManager, ServiceCommandStyle
+
+DEFAULT_READY_TIMEOUT = 600
+POLL_INTERVAL = 0.5
+
+
+def notify_enabled(config, service):
+    """Whether readiness notification is used for ``service``."""
+    if not config.systemd_notify or config.process_manager != ProcessManager.systemd:
+        return False
+    if config.service_command_style != ServiceCommandStyle.gravity:
+        return False
+    # readiness of service instances is checked per instance
+    service_instance = getattr(service, "services", [service])[0]
+    return service_instance.has_readiness_check
+
+
+def notify(message, socket_path=None):
+    """Send a message to the systemd notification socket, returns ``False`` if there is no socket."""
+    socket_path = socket_path or os.environ.get("NOTIFY_SOCKET")
+    if not socket_path:
+        return False
+    if socket_path.startswith("@"):
+        # abstract namespace socket
+        socket_path = "\0" + socket_path[1:]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+        sock.connect(socket_path)
+        sock.sendall(message.encode("utf-8"))
+    return True
+
+
+class ReadinessNotifier:
+    """Sends ``READY=1`` once a service passes its readiness check.
+
+    As with :class:`gravity.startup_profiler.ServiceStartupProfiler`, the notifier is a detached grandchild of the
+    process that execs the service, so that the service remains the unit's main process.
+    """
+    def __init__(self, service, socket_path):
+        self.service = service
+        self.probe = service.readiness_probe()
+        self.socket_path = socket_path
+        self.start_timeout = service.settings.get("start_timeout") or 0
+        self.ready_timeout = service.settings.get("restart_timeout") or DEFAULT_READY_TIMEOUT
+
+    def start(self):
+        """Fork the notifier. Must be called immediately before exec."""
+        main_pid = os.getpid()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.setsid()
+                if os.fork() == 0:
+                    self._run(main_pid)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+    def _main_is_running(self, main_pid):
+        try:
+            os.kill(main_pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def _run(self, main_pid):
+        for signum in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, signal.SIG_IGN)
+        start = time.time()
+        self._notify(f"STATUS=Waiting for {self.service.service_name} to become ready")
+        last_extend = start
+        while time.time() - start < self.ready_timeout and self._main_is_running(main_pid):
+            if self.probe.ready():
+                self._notify(f"READY=1\nSTATUS={self.service.service_name} is ready")
+                return
+            now = time.time()
+            if self.start_timeout and now - last_extend >= max(self.start_timeout / 2, POLL_INTERVAL):
+                self._notify(f"EXTEND_TIMEOUT_USEC={int(self.start_timeout * 1000000)}")
+                last_extend = now
+            time.sleep(POLL_INTERVAL)
+        gravity.io.error(f"{self.service.service_name} did not become ready, readiness was not reported to systemd")
+
+    def _notify(self, message):
+        try:
+            notify(message, socket_path=self.socket_path)
+        except OSError as exc:
+            gravity.io.error(f"Unable to send readiness notification to systemd: {exc}")
@@ -1,4 +1,5 @@
 import os
+import re
 from enum import Enum
 from typing import Any, Dict, List, Optional, Union
 
@@ -9,6 +10,8 @@ except ImportError:
 
 DEFAULT_INSTANCE_NAME = "_default_"
 GX_IT_PROXY_MIN_VERSION = "0.0.6"
+NUMA_NODE_AUTO = "auto"
+CPU_LIST_RE = re.compile(r"^\d+(-\d+)?(,\d+(-\d+)?)*$")
 
 
 def none_to_default(cls, v, field):
@@ -24,6 +27,24 @@ def none_to_default(cls, v, field):
         return v
 
 
+def validate_cpu_list(cls, v):
+    if v is not None and not CPU_LIST_RE.match(str(v)):
+        raise ValueError(f"Invalid CPU list '{v}', CPU lists are comma-separated CPU numbers or ranges, e.g. '0-3,8'")
+    return v
+
+
+def validate_numa_node(cls, v):
+    if v is None or v == NUMA_NODE_AUTO:
+        return v
+    try:
+        v = int(v)
+    except (TypeError, ValueError):
+        v = -1
+    if v < 0:
+        raise ValueError(f"Invalid NUMA node, NUMA nodes are non-negative integers or '{NUMA_NODE_AUTO}'")
+    return v
+
+
 class LogLevel(str, Enum):
     debug = "DEBUG"
     info = "INFO"
@@ -40,14 +61,32 @@ class ProcessManager(str, Enum):
 class ServiceCommandStyle(str, Enum):
     gravity = "gravity"
     direct = "direct"
+    launch = "launch"
     exec = "_exec"
 
 
+class StartupProfiler(str, Enum):
+    timing = "timing"
+    importtime = "importtime"
+    cprofile = "cprofile"
+
+
 class AppServer(str, Enum):
     gunicorn = "gunicorn"
     unicornherder = "unicornherder"
 
 
+class ReadinessCheck(str, Enum):
+    heartbeat = "heartbeat"
+    log = "log"
+    settled = "settled"
+
+
+class LoadBalancer(str, Enum):
+    nginx = "nginx"
+    haproxy = "haproxy"
+
+
 class Pool(str, Enum):
     prefork = "prefork"
     eventlet = "eventlet"
@@ -57,6 +96,67 @@ class Pool(str, Enum):
     threads = "threads"
 
 
+class RestartSettings(BaseModel):
+    delay: Optional[float] = Field(
+        None, ge=0, description="Seconds to wait before restarting a service that has exited. Default is ``1``.")
+    multiplier: Optional[float] = Field(
+        None,
+        ge=1,
+        description="""
+Factor by which ``delay`` is multiplied for each restart of a service within ``interval``. Default is ``2``.
+""")
+    max_delay: Optional[float] = Field(
+        None, ge=0, description="Maximum seconds to wait before restarting a service. Default is ``60``.")
+    burst: Optional[int] = Field(
+        None,
+        ge=0,
+        description="""
+Number of times a service can be started within ``interval`` seconds, after which it is no longer restarted until it
+is started with ``galaxyctl start`` or ``galaxyctl restart``. Default is ``0``, no limit (under systemd, the default start
+rate limit of systemd applies).
+""")
+    interval: Optional[int] = Field(
+        None, ge=1, description="Seconds within which restarts of a service are counted. Default is ``300``.")
+
+
+class ReadinessSettings(BaseModel):
+    check: ReadinessCheck = Field(
+        description="""
+How to determine that a handler is ready after it has been restarted:
+
+- ``heartbeat``: the file ``path`` (e.g. the Galaxy ``heartbeat_log``) has been written since the restart
+- ``log``: ``marker`` has been written to the log file ``path`` since the restart
+- ``settled``: the handler has been running for ``settle_time`` seconds
+""")
+    path: Optional[str] = Field(
+        None,
+        description="""
+File checked by the ``heartbeat`` and ``log`` checks, relative to ``galaxy_root`` if not absolute. ``{server_name}`` is
+replaced with the handler's server name.
+""")
+    marker: Optional[str] = Field(None, description="Text that the ``log`` check waits for in the log file.")
+    max_age: int = Field(
+        60,
+        ge=1,
+        description="""
+Seconds within which the ``heartbeat`` file must have been written for a handler that is not being restarted to be
+considered ready. Should be greater than the Galaxy ``heartbeat_interval``.
+""")
+    settle_time: float = Field(10, ge=0, description="Seconds that the ``settled`` check waits after a restart.")
+
+    @validator("path", always=True)
+    def _path_required(cls, v, values):
+        if v is None and values.get("check") in (ReadinessCheck.heartbeat, ReadinessCheck.log):
+            raise ValueError(f"path is required for the {values['check'].value} readiness check")
+        return v
+
+    @validator("marker", always=True)
+    def _marker_required(cls, v, values):
+        if not v and values.get("check") == ReadinessCheck.log:
+            raise ValueError("marker is required for the log readiness check")
+        return v
+
+
 class TusdSettings(BaseModel):
     enable: bool = Field(False, description="""
 Enable tusd server.
@@ -93,12 +193,22 @@ You can find a list of available hooks at https://github.com/tus/tusd/blob/maste
     umask: Optional[str] = Field(None, description="umask under which service should be executed")
     start_timeout: int = Field(10, description="Value of supervisor startsecs, systemd TimeoutStartSec")
     stop_timeout: int = Field(10, description="Value of supervisor stopwaitsecs, systemd TimeoutStopSec")
+    restart_timeout: int = Field(
+        default=300,
+        description="""
+Amount of time to wait for a server to become alive when performing rolling restarts.
+""")
     memory_limit: Optional[int] = Field(
         None,
         description="""
 Memory limit (in GB). If the service exceeds the limit, it will be killed. Default is no limit or the value of the
 ``memory_limit`` setting at the top level of the Gravity configuration, if set. Ignored if ``process_manager`` is
 ``supervisor``.
+""")
+    restart: RestartSettings = Field(
+        default={},
+        description="""
+Restart policy of the service, overrides the ``restart`` setting at the top level of the Gravity configuration.
 """)
     environment: Dict[str, str] = Field(
         default={},
@@ -107,6 +217,8 @@ Extra environment variables and their values to set when running the service. A
 names.
 """)
 
+    _normalize_restart = validator("restart", allow_reuse=True, pre=True)(none_to_default)
+
 
 class CelerySettings(BaseModel):
     enable: bool = Field(True, description="Enable Celery distributed task queue.")
@@ -125,6 +237,24 @@ class CelerySettings(BaseModel):
 Memory limit (in GB). If the service exceeds the limit, it will be killed. Default is no limit or the value of the
 ``memory_limit`` setting at the top level of the Gravity configuration, if set. Ignored if ``process_manager`` is
 ``supervisor``.
+""")
+    cpus: Optional[str] = Field(
+        None,
+        description="""
+CPUs that the Celery workers may run on, as a comma-separated list of CPU numbers or ranges (e.g. ``0-7,16-23``).
+Default is all CPUs, or the CPUs of ``numa_node``, if set.
+""")
+    numa_node: Optional[Union[int, str]] = Field(
+        None,
+        description="""
+NUMA node that the Celery workers run on and allocate memory from (``auto`` selects the first node). Under systemd, this
+and ``cpus`` are set with the ``AllowedCPUs``, ``NUMAPolicy`` and ``NUMAMask`` unit directives, otherwise, the service
+is run with ``numactl`` (or ``taskset``).
+""")
+    restart: RestartSettings = Field(
+        default={},
+        description="""
+Restart policy of the service, overrides the ``restart`` setting at the top level of the Gravity configuration.
 """)
     environment: Dict[str, str] = Field(
         default={},
@@ -133,6 +263,10 @@ Extra environment variables and their values to set when running the service. A
 names.
 """)
 
+    _normalize_restart = validator("restart", allow_reuse=True, pre=True)(none_to_default)
+    _validate_cpus = validator("cpus", allow_reuse=True)(validate_cpu_list)
+    _validate_numa_node = validator("numa_node", allow_reuse=True)(validate_numa_node)
+
     class Config:
         use_enum_values = True
 
@@ -181,6 +315,25 @@ Amount of time to wait for a server to become alive when performing rolling rest
 Memory limit (in GB). If the service exceeds the limit, it will be killed. Default is no limit or the value of the
 ``memory_limit`` setting at the top level of the Gravity configuration, if set. Ignored if ``process_manager`` is
 ``supervisor``.
+""")
+    cpus: Optional[str] = Field(
+        None,
+        description="""
+CPUs that gunicorn may run on, as a comma-separated list of CPU numbers or ranges (e.g. ``0-7,16-23``). Default is all
+CPUs, or the CPUs of ``numa_node``, if set.
+""")
+    numa_node: Optional[Union[int, str]] = Field(
+        None,
+        description="""
+NUMA node that gunicorn runs on and allocates memory from. If ``auto`` and ``gunicorn`` is a list, the service instances
+are spread across the host's NUMA nodes in turn. Under systemd, this and ``cpus`` are set with the ``AllowedCPUs``,
+``NUMAPolicy`` and ``NUMAMask`` unit directives, otherwise (or for service instances), the service is run with
+``numactl`` (or ``taskset``).
+""")
+    restart: RestartSettings = Field(
+        default={},
+        description="""
+Restart policy of the service, overrides the ``restart`` setting at the top level of the Gravity configuration.
 """)
     environment: Dict[str, str] = Field(
         default={},
@@ -189,6 +342,10 @@ Extra environment variables and their values to set when running the service. A
 names.
 """)
 
+    _normalize_restart = validator("restart", allow_reuse=True, pre=True)(none_to_default)
+    _validate_cpus = validator("cpus", allow_reuse=True)(validate_cpu_list)
+    _validate_numa_node = validator("numa_node", allow_reuse=True)(validate_numa_node)
+
 
 class ReportsSettings(BaseModel):
     enable: bool = Field(False, description="Enable Galaxy Reports server.")
@@ -234,6 +391,11 @@ If <bind> is a unix socket, you will need a ``:`` after the socket path but befo
 Memory limit (in GB). If the service exceeds the limit, it will be killed. Default is no limit or the value of the
 ``memory_limit`` setting at the top level of the Gravity configuration, if set. Ignored if ``process_manager`` is
 ``supervisor``.
+""")
+    restart: RestartSettings = Field(
+        default={},
+        description="""
+Restart policy of the service, overrides the ``restart`` setting at the top level of the Gravity configuration.
 """)
     environment: Dict[str, str] = Field(
         default={},
@@ -242,10 +404,32 @@ Extra environment variables and their values to set when running the service. A
 names.
 """)
 
+    _normalize_restart = validator("restart", allow_reuse=True, pre=True)(none_to_default)
+
 
 class GxItProxySettings(BaseModel):
     enable: bool = Field(default=False, description="Set to true to start gx-it-proxy")
     version: str = Field(default=f">={GX_IT_PROXY_MIN_VERSION}", description="gx-it-proxy version")
+    install: bool = Field(
+        default=False,
+        description="""
+Install gx-it-proxy into the Gravity state directory with ``npm`` when the process manager configs are updated (e.g.
+by ``galaxyctl update``), and run it with ``node`` rather than resolving it with ``npx`` each time it starts. Set
+``install_source`` or ``npm_cache`` to install without access to the npm registry. Use ``galaxyctl update --force`` to
+reinstall.
+""")
+    install_source: Optional[str] = Field(
+        default=None,
+        description="""
+Path to a gx-it-proxy package tarball (as created by ``npm pack``) to install if ``install`` is set, rather than
+``version`` from the npm registry.
+""")
+    npm_cache: Optional[str] = Field(
+        default=None,
+        description="""
+npm cache directory to install gx-it-proxy from without access to the npm registry if ``install`` is set. npm verifies
+the integrity of the package against the cache.
+""")
     ip: str = Field(default="localhost", description="Public-facing IP of the proxy")
     port: int = Field(default=4002, description="Public-facing port of the proxy")
     sessions: str = Field(
@@ -282,6 +466,11 @@ This is an advanced option that is only needed when proxying to remote interacti
 Memory limit (in GB). If the service exceeds the limit, it will be killed. Default is no limit or the value of the
 ``memory_limit`` setting at the top level of the Gravity configuration, if set. Ignored if ``process_manager`` is
 ``supervisor``.
+""")
+    restart: RestartSettings = Field(
+        default={},
+        description="""
+Restart policy of the service, overrides the ``restart`` setting at the top level of the Gravity configuration.
 """)
     environment: Dict[str, str] = Field(
         default={},
@@ -290,6 +479,52 @@ Extra environment variables and their values to set when running the service. A
 names.
 """)
 
+    _normalize_restart = validator("restart", allow_reuse=True, pre=True)(none_to_default)
+
+
+class SystemdSliceSettings(BaseModel):
+    memory_max: Optional[int] = Field(
+        None, ge=1, description="Hard memory limit (in GB) for all processes in the slice, systemd ``MemoryMax``")
+    memory_high: Optional[int] = Field(
+        None, ge=1, description="""
+Memory throttling limit (in GB) for all processes in the slice, above which they are slowed down and their memory
+reclaimed aggressively, systemd ``MemoryHigh``
+""")
+    cpu_weight: Optional[int] = Field(
+        None, ge=1, le=10000, description="Relative CPU share of the slice (1-10000, default 100), systemd ``CPUWeight``")
+    io_weight: Optional[int] = Field(
+        None, ge=1, le=10000, description="Relative IO share of the slice (1-10000, default 100), systemd ``IOWeight``")
+    tasks_max: Optional[int] = Field(
+        None, ge=1, description="Maximum number of tasks (processes and threads) in the slice, systemd ``TasksMax``")
+
+
+class LoadBalancerSettings(BaseModel):
+    type: LoadBalancer = Field(LoadBalancer.nginx, description="Load balancer (proxy server) to write the configuration for.")
+    path: Optional[str] = Field(
+        None,
+        description="""
+Path of the nginx ``upstream`` block or HAProxy ``backend`` section to write, to be included in the load balancer's
+configuration. Default is ``<gravity_data_dir>/load_balancer/<instance_name>.conf``.
+""")
+    name: str = Field("galaxy", description="Name of the upstream or backend.")
+    reload_command: Optional[str] = Field(
+        None,
+        description="""
+Command to run to reload the load balancer once its configuration has been written, e.g. ``sudo systemctl reload nginx``.
+""")
+    runtime_socket: Optional[str] = Field(
+        None,
+        description="""
+Path to the HAProxy runtime API socket. If set, instances are drained and restored with the runtime API rather than by
+rewriting the configuration and reloading HAProxy.
+""")
+    drain_time: int = Field(
+        10,
+        ge=0,
+        description="""
+Seconds to wait for in-flight requests to an instance to finish once it has been marked down, before restarting it.
+""")
+
 
 class Settings(BaseSettings):
     """
@@ -312,6 +547,9 @@ Process manager to use.
 What command to write to the process manager configs
 `gravity` (`galaxyctl exec <service-name>`) is the default
 `direct` (each service's actual command) is also supported.
+`launch` (`python -m gravity.launch <exec-spec>`) runs each service's command from an exec spec written by
+`galaxyctl update`, without loading the Gravity and Galaxy configs every time the service starts. As with `direct`,
+`galaxyctl update` must be run (and services restarted) for configuration changes to take effect.
 """)
 
     use_service_instances: bool = Field(
@@ -319,7 +557,7 @@ What command to write to the process manager configs
         description="""
 Use the process manager's *service instance* functionality for services that can run multiple instances.
 Presently this includes services like gunicorn and Galaxy dynamic job handlers. Service instances are only supported if
-``service_command_style`` is ``gravity``, and so this option is automatically set to ``false`` if
+``service_command_style`` is ``gravity`` or ``launch``, and so this option is automatically set to ``false`` if
 ``service_command_style`` is set to ``direct``.
 """)
 
@@ -333,6 +571,52 @@ umask under which services should be executed. Setting ``umask`` on an individua
 Memory limit (in GB), processes exceeding the limit will be killed. Default is no limit. If set, this is default value
 for all services. Setting ``memory_limit`` on an individual service overrides this value. Ignored if ``process_manager``
 is ``supervisor``.
+""")
+
+    restart: RestartSettings = Field(
+        default={},
+        description="""
+Policy for restarting services that exit, to avoid restarting crashing services in a tight loop. Under systemd, this
+is set with the ``RestartSec``, ``RestartSteps``, ``RestartMaxDelaySec`` (systemd 254 or later), ``StartLimitBurst``
+and ``StartLimitIntervalSec`` unit directives. Under other process managers, this is applied by ``galaxyctl exec`` (or
+the launcher) if ``service_command_style`` is ``gravity`` or ``launch``. Setting ``restart`` on an individual service
+(or handler) overrides this value.
+""")
+    systemd_notify: bool = Field(
+        False,
+        description="""
+Use ``Type=notify`` for the systemd units of services that have a readiness check (e.g. gunicorn), so that systemd
+considers them started only once they are ready to serve requests. ``galaxyctl exec`` reports readiness to systemd, so
+this requires ``service_command_style`` to be ``gravity``. Services that take longer than ``start_timeout`` to become
+ready are given up to ``restart_timeout`` seconds. Ignored if ``process_manager`` is ``supervisor``.
+""")
+
+    systemd_slices: Optional[Dict[str, SystemdSliceSettings]] = Field(
+        None,
+        description="""
+Run each instance's services in systemd slices, so that resource limits can be applied to groups of services. If set,
+a slice is created for the instance, containing a slice for each group of services: ``web`` (gunicorn or unicornherder),
+``handlers``, ``celery`` (celery and celery-beat), and for other services, the service type (e.g. ``tusd``). Limits for
+the instance's slice are set with the ``instance`` key, and for a group's slice with the group's name, e.g.:
+
+.. code-block:: yaml
+
+    systemd_slices:
+      instance:
+        memory_max: 64
+      handlers:
+        memory_max: 16
+        cpu_weight: 50
+
+Set to ``{}`` to group services in slices without limits. If set, the ``memory_limit`` of services is applied with
+systemd's ``MemoryMax`` rather than the deprecated ``MemoryLimit``. Ignored if ``process_manager`` is ``supervisor``.
+""")
+
+    load_balancer: Optional[LoadBalancerSettings] = Field(
+        None,
+        description="""
+Write the load balancer configuration for the ``gunicorn`` instances (see Zero-Downtime Restarts in the documentation),
+and mark each instance down in the load balancer while it is restarted by ``galaxyctl graceful``.
 """)
 
     galaxy_config_file: Optional[str] = Field(
@@ -377,6 +661,16 @@ Select the application server.
 ``gunicorn`` is the default application server.
 ``unicornherder`` is a production-oriented manager for (G)unicorn servers that automates zero-downtime Galaxy server restarts,
 similar to uWSGI Zerg Mode used in the past.
+""")
+    startup_profiler: Optional[StartupProfiler] = Field(
+        None,
+        description="""
+Record the startup time of services run with ``galaxyctl exec`` (i.e. when ``service_command_style`` is ``gravity``).
+``timing`` records the time from exec until the first log output, the port being bound and the first successful
+readiness check.
+``importtime`` additionally runs Python services with ``python -X importtime`` and saves the import time report.
+``cprofile`` additionally runs Python services under cProfile and saves the profile when the service exits.
+Reports and the startup history are stored in ``<gravity_data_dir>/startup``, use ``galaxyctl startup`` to view them.
 """)
     instance_name: str = Field(default=DEFAULT_INSTANCE_NAME, description="""Override the default instance name.
 this is hidden from you when running a single instance.""")
@@ -397,6 +691,11 @@ The ``tusd`` binary must be installed manually and made available on PATH (e.g i
         description="""
 Configure dynamic handlers in this section.
 See https://docs.galaxyproject.org/en/latest/admin/scaling.html#dynamically-defined-handlers for details.
+The ``cpus`` and ``numa_node`` settings of ``gunicorn`` can also be set on each handler pool. If ``numa_node`` is
+``auto``, the pool's processes are spread across the host's NUMA nodes in turn.
+If ``readiness`` is set on a handler pool (see Rolling Handler Restarts in the documentation), ``galaxyctl graceful``
+restarts the pool's processes ``rolling_restart_batch_size`` (default ``1``) at a time, waiting up to
+``restart_timeout`` (default ``300``) seconds for each batch to become ready before restarting the next.
 """)
 
     # Use validators to turn None to default value
@@ -405,6 +704,7 @@ See https://docs.galaxyproject.org/en/latest/admin/scaling.html#dynamically-defi
     _normalize_celery = validator("celery", allow_reuse=True, pre=True)(none_to_default)
     _normalize_tusd = validator("tusd", allow_reuse=True, pre=True)(none_to_default)
     _normalize_reports = validator("reports", allow_reuse=True, pre=True)(none_to_default)
+    _normalize_restart = validator("restart", allow_reuse=True, pre=True)(none_to_default)
 
     # Require galaxy_user if running as root
     @validator("galaxy_user")
@@ -425,10 +725,10 @@ See https://docs.galaxyproject.org/en/latest/admin/scaling.html#dynamically-defi
                 v = ProcessManager.systemd.value
         return v
 
-    # disable service instances unless command style is gravity
+    # disable service instances unless command style is gravity or launch
     @validator("use_service_instances")
     def _disable_service_instances_if_direct(cls, v, values):
-        if values["service_command_style"] != ServiceCommandStyle.gravity:
+        if values["service_command_style"] not in (ServiceCommandStyle.gravity, ServiceCommandStyle.launch):
             v = False
         return v
 
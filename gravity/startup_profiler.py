@@ -0,0 +1,268 @@
+""" Startup timing and profiling of services run with ``galaxyctl exec``
+"""
+import json
+import os
+import shlex
+import shutil
+import signal
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import gravity.io
+from gravity.settings import StartupProfiler
+
+STARTUP_DIR_NAME = "startup"
+HISTORY_FILE_NAME = "history.jsonl"
+IMPORTTIME_PREFIX = b"import time:"
+DEFAULT_READY_TIMEOUT = 600
+POLL_INTERVAL = 0.5
+# a version is considered to have regressed if its median time to ready is this much slower than the previous version's
+REGRESSION_THRESHOLD = 1.2
+
+
+def startup_dir(config):
+    return os.path.join(config.gravity_data_dir, STARTUP_DIR_NAME)
+
+
+def history_path(config):
+    return os.path.join(startup_dir(config), HISTORY_FILE_NAME)
+
+
+def read_history(config, service_names=None):
+    records = []
+    try:
+        with open(history_path(config)) as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not service_names or record.get("service_name") in service_names:
+                    records.append(record)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def summarize_history(records):
+    """Summarize startup records by service and Galaxy version, in the order versions were first seen.
+
+    Each summary row contains the median time to first output, port bind and readiness, and is flagged as a regression
+    if its median time to ready is more than ``REGRESSION_THRESHOLD`` times that of the previous version of the service.
+    """
+    by_service = {}
+    for record in records:
+        versions = by_service.setdefault(record["service_name"], {})
+        versions.setdefault(record.get("galaxy_version"), []).append(record)
+    rval = []
+    for service_name, versions in by_service.items():
+        previous_ready = None
+        for galaxy_version, version_records in versions.items():
+            row = {
+                "service_name": service_name,
+                "galaxy_version": galaxy_version,
+                "starts": len(version_records),
+                "first_output": _median(r.get("first_output") for r in version_records),
+                "port_bind": _median(r.get("port_bind") for r in version_records),
+                "ready": _median(r.get("ready") for r in version_records),
+                "regression": False,
+            }
+            if previous_ready is not None and row["ready"] is not None:
+                row["regression"] = row["ready"] > previous_ready * REGRESSION_THRESHOLD
+            previous_ready = row["ready"] if row["ready"] is not None else previous_ready
+            rval.append(row)
+    return rval
+
+
+def service_address(service):
+    """Return the (family, address) a service listens on, if it is known."""
+    settings = service.settings
+    bind = settings.get("bind")
+    if bind is None and settings.get("port"):
+        bind = f"{settings.get('host') or settings.get('ip') or 'localhost'}:{settings['port']}"
+    if not bind or bind.startswith("fd://"):
+        return None
+    if bind.startswith("unix:"):
+        return (socket.AF_UNIX, bind.split(":", 1)[1])
+    host, _, port = bind.rpartition(":")
+    if not port.isdigit():
+        return None
+    return (socket.AF_INET6 if host.startswith("[") else socket.AF_INET, (host.strip("[]") or "localhost", int(port)))
+
+
+def _write(fd, data):
+    # the observer must keep draining the pipe even if its output goes away, or the service would block or get SIGPIPE
+    try:
+        os.write(fd, data)
+    except OSError:
+        pass
+
+
+def address_is_bound(address):
+    family, addr = address
+    try:
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(addr)
+        return True
+    except OSError:
+        return False
+
+
+class ServiceStartupProfiler:
+    """Observes a service across exec, relaying its output, and records how long it takes to start.
+
+    The observer is a detached grandchild of the process that execs the service, so that the process manager continues
+    to track (and signal) the service itself. The service's stdout and stderr are redirected through a pipe to the
+    observer, which relays it to the original output and notes the arrival of the first line.
+    """
+    def __init__(self, config, service, instance_number=None):
+        self.config = config
+        self.service = service
+        self.instance_number = instance_number
+        self.mode = config.startup_profiler
+        self.report_dir = startup_dir(config)
+        suffix = f"_{instance_number}" if instance_number is not None else ""
+        self.report_name = f"{config.instance_name}_{service.service_name}{suffix}_{time.strftime('%Y%m%dT%H%M%S')}"
+        self.report_path = None
+
+    def _python_command(self, cmd):
+        """Return the interpreter argv and script argv if cmd runs a Python program."""
+        exe = shutil.which(cmd[0]) or cmd[0]
+        if os.path.basename(exe).startswith("python"):
+            return [exe], cmd[1:]
+        try:
+            with open(exe, "rb") as fh:
+                shebang = fh.readline().decode("utf-8", errors="replace")
+        except OSError:
+            return None, None
+        if shebang.startswith("#!") and "python" in shebang:
+            return shlex.split(shebang[2:].strip()), [exe] + cmd[1:]
+        return None, None
+
+    def prepare(self, cmd, env):
+        """Modify the command and environment as needed for the configured profiler."""
+        os.makedirs(self.report_dir, exist_ok=True)
+        if self.mode == StartupProfiler.importtime:
+            env = {**env, "PYTHONPROFILEIMPORTTIME": "1"}
+            self.report_path = os.path.join(self.report_dir, f"{self.report_name}.importtime")
+        elif self.mode == StartupProfiler.cprofile:
+            interpreter, script = self._python_command(cmd)
+            if interpreter is None:
+                gravity.io.warn(f"Not profiling {self.service.service_name} with cProfile, it is not a Python program: {cmd[0]}")
+            else:
+                self.report_path = os.path.join(self.report_dir, f"{self.report_name}.prof")
+                cmd = interpreter + ["-m", "cProfile", "-o", self.report_path] + script
+        return cmd, env
+
+    def start(self):
+        """Fork the observer and redirect output into it. Must be called immediately before exec."""
+        exec_time = time.time()
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(write_fd)
+                os.setsid()
+                if os.fork() == 0:
+                    self._observe(read_fd, exec_time)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        os.close(read_fd)
+        os.dup2(write_fd, sys.stdout.fileno())
+        os.dup2(write_fd, sys.stderr.fileno())
+        os.close(write_fd)
+
+    def _observe(self, read_fd, exec_time):
+        for signum in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, signal.SIG_IGN)
+        first_output = threading.Event()
+        finished = threading.Event()
+        record = {
+            "instance_name": self.config.instance_name,
+            "service_name": self.service.service_name,
+            "instance_number": self.instance_number,
+            "galaxy_version": self._galaxy_version(),
+            "profiler": self.mode,
+            "exec_time": exec_time,
+            "first_output": None,
+            "port_bind": None,
+            "ready": None,
+            "report": self.report_path,
+        }
+        relay = threading.Thread(target=self._relay, args=(read_fd, exec_time, first_output, finished, record))
+        relay.start()
+        self._wait_for_startup(exec_time, finished, record)
+        self._write_record(record)
+        relay.join()
+
+    def _relay(self, read_fd, exec_time, first_output, finished, record):
+        out_fd = sys.stdout.fileno()
+        report = open(self.report_path, "ab") if self.mode == StartupProfiler.importtime else None
+        buf = b""
+        try:
+            while True:
+                data = os.read(read_fd, 65536)
+                if not data:
+                    break
+                if not first_output.is_set():
+                    record["first_output"] = round(time.time() - exec_time, 3)
+                    first_output.set()
+                if report is None:
+                    _write(out_fd, data)
+                    continue
+                # importtime output is written to the report rather than the log
+                buf += data
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    if line.startswith(IMPORTTIME_PREFIX):
+                        report.write(line + b"\n")
+                    else:
+                        _write(out_fd, line + b"\n")
+        finally:
+            if buf:
+                _write(out_fd, buf)
+            if report:
+                report.close()
+            finished.set()
+
+    def _wait_for_startup(self, exec_time, finished, record):
+        address = service_address(self.service)
+        can_check_ready = self.service.has_readiness_check
+        probe = self.service.readiness_probe() if can_check_ready else None
+        timeout = self.service.settings.get("restart_timeout") or DEFAULT_READY_TIMEOUT
+        # stop waiting if the service exits (closing its output) before it is ready
+        while (time.time() - exec_time) < timeout and not finished.is_set():
+            now = time.time()
+            if address and record["port_bind"] is None and address_is_bound(address):
+                record["port_bind"] = round(now - exec_time, 3)
+            if can_check_ready and record["ready"] is None and probe.ready():
+                record["ready"] = round(now - exec_time, 3)
+            if (
+                record["first_output"] is not None
+                and (not address or record["port_bind"] is not None)
+                and (not can_check_ready or record["ready"] is not None)
+            ):
+                break
+            time.sleep(POLL_INTERVAL)
+
+    def _galaxy_version(self):
+        try:
+            return self.config.galaxy_version
+        except Exception:
+            return None
+
+    def _write_record(self, record):
+        with open(history_path(self.config), "a") as fh:
+            fh.write(json.dumps(record) + "\n")
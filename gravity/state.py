@@ -3,28 +3,42 @@ state data.
 """
 from __future__ import annotations
 
+import copy
 import enum
 import hashlib
 import os
 import sys
 import time
+from collections import ChainMap
+from collections.abc import Mapping
+from types import MappingProxyType
 from typing import Any, Dict, List, Optional
 
-try:
-    import galaxy.config
-    import galaxy.version
-    galaxy_installed = True
-except ImportError:
-    galaxy_installed = False
+import click
+
 try:
     from pydantic.v1 import BaseModel, validator
 except ImportError:
     from pydantic import BaseModel, validator
 
 import gravity.io
-from gravity.settings import AppServer, ProcessManager, ServiceCommandStyle
+from gravity import galaxy_version, gx_it_proxy, placement, trace
+from gravity.readiness import HandlerReadinessProbe, ReadinessProbe
+from gravity.restart import restart_policy
+from gravity.settings import (
+    AppServer,
+    ProcessManager,
+    ReadinessSettings,
+    RestartSettings,
+    ServiceCommandStyle,
+    StartupProfiler,
+)
+from gravity.startup_profiler import address_is_bound, service_address
+from gravity.template import render
 from gravity.util import http_check
 
+galaxy_installed = galaxy_version.is_installed()
+
 DEFAULT_GALAXY_ENVIRONMENT = {
     "PYTHONPATH": "lib",
     "GALAXY_CONFIG_FILE": "{galaxy_conf}",
@@ -50,6 +64,7 @@ class ConfigFile(BaseModel):
     app_config: Dict[str, Any]
     gravity_config_file: Optional[str]
     galaxy_config_file: Optional[str]
+    job_config_file: Optional[str]
     instance_name: str
     process_manager: ProcessManager
     service_command_style: ServiceCommandStyle
@@ -60,9 +75,15 @@ class ConfigFile(BaseModel):
     galaxy_group: Optional[str]
     umask: Optional[str]
     memory_limit: Optional[int]
+    restart: Dict[str, Any] = {}
+    startup_profiler: Optional[StartupProfiler]
+    systemd_notify: bool
+    systemd_slices: Optional[Dict[str, Dict[str, Any]]]
+    load_balancer: Optional[Dict[str, Any]]
     gravity_data_dir: str
     log_dir: str
-    services: List[Service] = []
+    # Service and ServiceList instances, these are not pydantic models
+    services: List[Any] = []
 
     def __hash__(self):
         return id(self)
@@ -74,13 +95,9 @@ class ConfigFile(BaseModel):
     @property
     def galaxy_version(self):
         if galaxy_installed:
-            return galaxy.version.VERSION
+            return galaxy_version.installed_version()
         else:
-            galaxy_version_file = os.path.join(self.galaxy_root, "lib", "galaxy", "version.py")
-            with open(galaxy_version_file) as fh:
-                locs = {}
-                exec(fh.read(), {}, locs)
-                return locs["VERSION"]
+            return galaxy_version.source_version(self.galaxy_root)
 
     @validator("galaxy_root")
     def _galaxy_root_required(cls, v, values):
@@ -112,21 +129,25 @@ class ConfigFile(BaseModel):
         else:
             return self.services
 
-    # this worked for me until it didn't, so we set exclude on the Service instead
-    # def dict(self, *args, **kwargs):
-    #     exclude = kwargs.pop("exclude", None) or {}
-    #     exclude["services"] = {-1: {"config"}}
-    #     return super().dict(*args, exclude=exclude, **kwargs)
+    def dict(self, *args, **kwargs):
+        # services are not pydantic models
+        exclude = kwargs.pop("exclude", None) or set()
+        rval = super().dict(*args, exclude={"services"} | set(exclude), **kwargs)
+        if "services" not in exclude:
+            rval["services"] = [s.dict() for s in self.services]
+        return rval
 
 
-class Service(BaseModel):
-    config: ConfigFile
-    # unfortunately as a class attribute this is now excluded from dict()
-    _service_type: str = "service"
-    service_name: str = "_default_"
+class Service:
+    """A Galaxy service as configured by Gravity.
 
-    settings: Dict[str, Any]
+    Large deployments can have hundreds of services (e.g. handlers), so services are immutable objects with
+    ``__slots__`` rather than pydantic models. Their settings are validated once per settings block by
+    :meth:`validate_settings`, and the resulting read-only mapping is shared by all services created from that block.
+    """
+    __slots__ = ("config", "service_name", "settings")
 
+    _service_type: str = "service"
     _default_environment: Dict[str, str] = {}
 
     _settings_from: Optional[str] = None
@@ -149,21 +170,47 @@ class Service(BaseModel):
                 gravity.io.exception(
                     f"Settings for {cls._service_type} is a list, but lists are not allowed for this service type")
             for i, instance_settings in enumerate(settings):
+                instance_settings = placement.assign_numa_node(instance_settings, i)
                 services.extend(cls.services_if_enabled(config, settings=instance_settings, service_name=f"{service_name}{i}"))
             if gravity_settings.use_service_instances:
                 services = [ServiceList(services=services, service_name=service_name)]
-        elif isinstance(settings, dict) and settings[cls._enable_attribute]:
+        elif isinstance(settings, Mapping) and settings[cls._enable_attribute]:
             # settings is already a dict e.g. in the case of handlers
             services = [cls(config=config, settings=settings, service_name=service_name)]
         elif getattr(settings, cls._enable_attribute):
             services = [cls(config=config, settings=settings.dict(), service_name=service_name)]
         return services
 
-    def __init__(self, *args, **kwargs):
+    @classmethod
+    def validate_settings(cls, config, settings):
+        """Validate and normalize a settings block, returning it as a read-only mapping.
+
+        Already validated settings are returned unchanged, so services created from the same block can share it.
+        """
+        if isinstance(settings, MappingProxyType):
+            return settings
         try:
-            super().__init__(*args, **kwargs)
+            settings = cls._validate_settings(config, dict(settings))
+        except click.ClickException:
+            raise
         except Exception as exc:
-            gravity.io.exception(f"{type(self)} init failed: {exc}")
+            gravity.io.exception(f"{cls} init failed: {exc}")
+        return MappingProxyType(settings)
+
+    @classmethod
+    def _validate_settings(cls, config, settings):
+        return settings
+
+    def __init__(self, config, settings, service_name=None):
+        object.__setattr__(self, "config", config)
+        object.__setattr__(self, "service_name", service_name or self._service_type)
+        object.__setattr__(self, "settings", self.validate_settings(config, settings))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"{type(self).__name__}(service_name={self.service_name!r}, settings={dict(self.settings)!r})"
 
     @property
     def service_type(self):
@@ -189,6 +236,19 @@ class Service(BaseModel):
     def graceful_method(self):
         return self._graceful_method
 
+    @property
+    def restart_policy(self):
+        return restart_policy(self.config.restart, self.settings.get("restart"))
+
+    @property
+    def has_readiness_check(self):
+        # services whose readiness check is optional define is_ready regardless, and override this
+        return hasattr(self, "is_ready")
+
+    def readiness_probe(self):
+        """Return a probe of the readiness of the service, to be called when it is (re)started."""
+        return ReadinessProbe(self)
+
     @property
     def add_virtualenv_to_path(self):
         return self._add_virtualenv_to_path
@@ -210,31 +270,38 @@ class Service(BaseModel):
         for setting, value in self.settings.items():
             if setting in self.command_arguments:
                 if value:
-                    rval[setting] = self.command_arguments[setting].format(**format_vars)
+                    rval[setting] = render(self.command_arguments[setting], format_vars, name=f"{self.service_type} {setting} argument")
                 else:
                     rval[setting] = ""
             else:
                 rval[setting] = value
         return rval
 
-    def dict(self, *args, **kwargs):
-        exclude = kwargs.pop("exclude", None) or {}
-        exclude = {"config"}
-        return super().dict(*args, exclude=exclude, **kwargs)
+    def dict(self):
+        return {"service_name": self.service_name, "settings": copy.deepcopy(dict(self.settings))}
+
 
+class ServiceList:
+    __slots__ = ("service_name", "services")
 
-class ServiceList(BaseModel):
-    config = ConfigFile
     _service_type = "_list_"
-    service_name = "_list_"
-    services: List[Service] = []
 
-    # ServiceList is *only* used when service_command_style = gravity, meaning that the only case we need to do anything
-    # special with is galaxyctl exec
+    # ServiceList is *only* used when service_command_style = gravity or launch, meaning that the only cases we need to
+    # do anything special with are galaxyctl exec and the launch exec specs
+
+    def __init__(self, services, service_name="_list_"):
+        object.__setattr__(self, "services", list(services))
+        object.__setattr__(self, "service_name", service_name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"{type(self).__name__}(service_name={self.service_name!r}, services={self.services!r})"
 
     @property
     def graceful_method(self):
-        if self.count > 1 and hasattr(self.services[0], "is_ready"):
+        if self.count > 1 and self.services[0].has_readiness_check:
             return GracefulMethod.ROLLING
         else:
             return self.services[0].graceful_method
@@ -246,33 +313,63 @@ class ServiceList(BaseModel):
     def get_service_instance(self, instance_number):
         return self.services[instance_number]
 
-    def rolling_restart(self, restart_callbacks):
+    def dict(self):
+        return {"services": [s.dict() for s in self.services], "service_name": self.service_name}
+
+    def rolling_restart(self, restart_callbacks, before_restart=None, after_ready=None):
+        """Restart the service's instances a batch at a time, waiting for each batch to become ready.
+
+        ``before_restart`` and ``after_ready`` are called with the service instances of each batch before they are
+        restarted and once they are ready. If some instances of a batch fail their readiness check, ``after_ready`` is
+        only called with those that passed, so that e.g. the failed instances are left drained in the load balancer.
+        """
         gravity.io.info(f"Performing rolling restart on service: {self.service_name}")
-        for instance_number, service_instance in enumerate(self.services):
-            if not service_instance.is_ready(quiet=False):
-                gravity.io.exception(f"Refusing to continue rolling restart, instance {instance_number} check failed before restart")
-            gravity.io.debug(f"Calling restart callback {instance_number}: {restart_callbacks[instance_number]}")
-            gravity.io.info(f"Restarting {self.service_name} instance {instance_number}")
-            restart_callbacks[instance_number]()
-            gravity.io.info(f"Restarted {self.service_name} instance {instance_number}, waiting for readiness check...")
+        batch_size = self.services[0].settings.get("rolling_restart_batch_size") or 1
+        instances = list(enumerate(self.services))
+        for batch in [instances[i:i + batch_size] for i in range(0, len(instances), batch_size)]:
+            for instance_number, service_instance in batch:
+                if not service_instance.is_ready(quiet=False):
+                    gravity.io.exception(f"Refusing to continue rolling restart, instance {instance_number} check failed before restart")
+            if before_restart:
+                before_restart([service_instance for _, service_instance in batch])
+            probes = {}
+            for instance_number, service_instance in batch:
+                probes[instance_number] = service_instance.readiness_probe()
+                gravity.io.debug(f"Calling restart callback {instance_number}: {restart_callbacks[instance_number]}")
+                gravity.io.info(f"Restarting {self.service_name} instance {instance_number}")
+                restart_callbacks[instance_number]()
+            instance_numbers = ", ".join(str(n) for n in probes)
+            gravity.io.info(f"Restarted {self.service_name} instance(s) {instance_numbers}, waiting for readiness check...")
             start = time.time()
-            timeout = service_instance.settings["restart_timeout"]
-            instance_is_ready = service_instance.is_ready()
-            while not instance_is_ready and ((time.time() - start) < timeout):
-                gravity.io.debug(f"{self.service_name}@{instance_number} not ready...")
-                time.sleep(2)
-                instance_is_ready = service_instance.is_ready()
-            if not instance_is_ready:
-                gravity.io.exception(f"Refusing to continue rolling restart, instance failed to respond after {timeout} seconds")
+            timeout = max(service_instance.settings["restart_timeout"] for _, service_instance in batch)
+            with trace.span("wait for ready", service=self.service_name, instances=instance_numbers):
+                while True:
+                    probes = {n: p for n, p in probes.items() if not p.ready()}
+                    if not probes or (time.time() - start) >= timeout:
+                        break
+                    gravity.io.debug(f"{self.service_name}@{', '.join(str(n) for n in probes)} not ready...")
+                    time.sleep(2)
+            if after_ready:
+                ready = [service_instance for instance_number, service_instance in batch if instance_number not in probes]
+                if ready:
+                    after_ready(ready)
+            if probes:
+                not_restored = " and were left drained in the load balancer" if after_ready else ""
+                gravity.io.exception(f"Refusing to continue rolling restart, instance(s) {', '.join(str(n) for n in probes)} "
+                                     f"failed to respond after {timeout} seconds{not_restored}")
 
     # everything else falls through to the first configured service
     def __getattr__(self, name):
+        if name in self.__slots__:
+            # not yet initialized
+            raise AttributeError(name)
         return getattr(self.services[0], name)
 
 
 class GalaxyGunicornService(Service):
+    __slots__ = ()
+
     _service_type = "gunicorn"
-    service_name = "gunicorn"
     _service_list_allowed = True
     _default_environment = DEFAULT_GALAXY_ENVIRONMENT
     _command_arguments = {
@@ -288,12 +385,11 @@ class GalaxyGunicornService(Service):
                         " {command_arguments[preload]}" \
                         " {settings[extra_args]}"
 
-    @validator("settings")
-    def _normalize_settings(cls, v, values):
-        # TODO: should be copy?
-        if v["preload"] is None:
-            v["preload"] = True
-        return v
+    @classmethod
+    def _validate_settings(cls, config, settings):
+        if settings["preload"] is None:
+            settings["preload"] = True
+        return settings
 
     @property
     def graceful_method(self):
@@ -313,27 +409,26 @@ class GalaxyGunicornService(Service):
         environment.update(self.settings.get("environment", {}))
         return environment
 
+    def live_version(self):
+        return galaxy_version.live_version(self.settings["bind"], self.config.app_config.get("galaxy_url_prefix"))
+
     def is_ready(self, quiet=True):
         bind = self.settings["bind"]
-        prefix = self.config.app_config.get("galaxy_url_prefix") or ""
-        if prefix:
-            prefix = prefix.rstrip("/")
         try:
-            response = http_check(bind, f"{prefix}/api/version")
-            version = response.json()
+            live_version = self.live_version()
         except Exception as exc:
             if not quiet:
                 gravity.io.error(exc)
             return False
-        live_version = f"{version['version_major']}.{version['version_minor']}"
         disk_version = self.config.galaxy_version
         gravity.io.info(f"Gunicorn on {bind} running, version: {live_version} (disk version: {disk_version})", bright=False)
         return True
 
 
 class GalaxyUnicornHerderService(Service):
+    __slots__ = ()
+
     _service_type = "unicornherder"
-    service_name = "unicornherder"
     _settings_from = "gunicorn"
     _graceful_method = GracefulMethod.SIGHUP
     _default_environment = DEFAULT_GALAXY_ENVIRONMENT
@@ -348,20 +443,20 @@ class GalaxyUnicornHerderService(Service):
                         " {command_arguments[preload]}" \
                         " {settings[extra_args]}"
 
-    @validator("settings")
-    def _normalize_settings(cls, v, values):
-        # TODO: should be copy?
-        if v["preload"] is None:
-            v["preload"] = False
-        return v
+    @classmethod
+    def _validate_settings(cls, config, settings):
+        if settings["preload"] is None:
+            settings["preload"] = False
+        return settings
 
     environment = GalaxyGunicornService.environment
     command_arguments = GalaxyGunicornService.command_arguments
 
 
 class GalaxyCeleryService(Service):
+    __slots__ = ()
+
     _service_type = "celery"
-    service_name = "celery"
     _default_environment = DEFAULT_GALAXY_ENVIRONMENT
     _command_template = "{virtualenv_bin}celery" \
                         " --app galaxy.celery worker" \
@@ -373,8 +468,9 @@ class GalaxyCeleryService(Service):
 
 
 class GalaxyCeleryBeatService(Service):
+    __slots__ = ()
+
     _service_type = "celery-beat"
-    service_name = "celery-beat"
     _settings_from = "celery"
     _enable_attribute = "enable_beat"
     _default_environment = DEFAULT_GALAXY_ENVIRONMENT
@@ -386,8 +482,9 @@ class GalaxyCeleryBeatService(Service):
 
 
 class GalaxyGxItProxyService(Service):
+    __slots__ = ()
+
     _service_type = "gx-it-proxy"
-    service_name = "gx-it-proxy"
     _settings_from = "gx_it_proxy"
     _default_environment = {
         "npm_config_yes": "true",
@@ -406,29 +503,50 @@ class GalaxyGxItProxyService(Service):
                         " {command_arguments[forward_ip]} {command_arguments[forward_port]}" \
                         " {command_arguments[reverse_proxy]} {command_arguments[proxy_path_prefix]}"
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    # installed at update, see gravity.gx_it_proxy
+    _installed_command_template = "{virtualenv_bin}node {settings[installed_bin]} --ip {settings[ip]} --port {settings[port]}" \
+                                  " --sessions {settings[sessions]} {command_arguments[verbose]}" \
+                                  " {command_arguments[forward_ip]} {command_arguments[forward_port]}" \
+                                  " {command_arguments[reverse_proxy]} {command_arguments[proxy_path_prefix]}"
+
+    @property
+    def command_template(self):
+        if self.settings.get("install"):
+            return self._installed_command_template
+        else:
+            return self._command_template
+
+    @classmethod
+    def _validate_settings(cls, config, settings):
+        if not config.app_config["interactivetools_enable"]:
+            gravity.io.exception("To run gx-it-proxy you need to set interactivetools_enable in the galaxy section of galaxy.yml")
         # override from Galaxy config if set
-        self.settings["sessions"] = (
-            self.config.app_config.get("interactivetoolsproxy_map") or
-            self.config.app_config.get("interactivetools_map", self.settings["sessions"])
+        settings["sessions"] = (
+            config.app_config.get("interactivetoolsproxy_map") or
+            config.app_config.get("interactivetools_map", settings["sessions"])
         )
         # this can only be set in Galaxy config
-        it_base_path = self.config.app_config.get("interactivetools_base_path", "/")
+        it_base_path = config.app_config.get("interactivetools_base_path", "/")
         it_base_path = "/" + f"/{it_base_path.strip('/')}/".lstrip("/")
-        it_prefix = self.config.app_config.get("interactivetools_prefix", "interactivetool")
-        self.settings["proxy_path_prefix"] = f"{it_base_path}{it_prefix}/ep"
+        it_prefix = config.app_config.get("interactivetools_prefix", "interactivetool")
+        settings["proxy_path_prefix"] = f"{it_base_path}{it_prefix}/ep"
+        if settings.get("install"):
+            settings["installed_bin"] = gx_it_proxy.installed_bin(gx_it_proxy.install_dir(config, settings))
+        return settings
 
-    @validator("settings")
-    def _validate_settings(cls, v, values):
-        if not values["config"].app_config["interactivetools_enable"]:
-            gravity.io.exception("To run gx-it-proxy you need to set interactivetools_enable in the galaxy section of galaxy.yml")
-        return v
+    def is_ready(self, quiet=True):
+        # the proxy has no health endpoint, and proxies all requests, so it is ready once it accepts connections
+        if not address_is_bound(service_address(self)):
+            if not quiet:
+                gravity.io.error(f"gx-it-proxy is not accepting connections on {self.settings['ip']}:{self.settings['port']}")
+            return False
+        return True
 
 
 class GalaxyTUSDService(Service):
+    __slots__ = ()
+
     _service_type = "tusd"
-    service_name = "tusd"
     _service_list_allowed = True
     _graceful_method = GracefulMethod.NONE
     _command_template = "{settings[tusd_path]} -host={settings[host]} -port={settings[port]}" \
@@ -437,18 +555,29 @@ class GalaxyTUSDService(Service):
                         " -hooks-http-forward-headers=X-Api-Key,Cookie {settings[extra_args]}" \
                         " -hooks-enabled-events {settings[hooks_enabled_events]}"
 
-    @validator("settings")
-    def _validate_settings(cls, v, values):
-        if v["hooks_http"].startswith("/"):
-            if not values["config"].app_config["galaxy_infrastructure_url"]:
+    @classmethod
+    def _validate_settings(cls, config, settings):
+        if settings["hooks_http"].startswith("/"):
+            if not config.app_config["galaxy_infrastructure_url"]:
                 gravity.io.exception("To run tusd you need to set galaxy_infrastructure_url in the galaxy section of galaxy.yml")
-            v["hooks_http"] = f'{values["config"].app_config["galaxy_infrastructure_url"]}{v["hooks_http"]}'
-        return v
+            settings["hooks_http"] = f'{config.app_config["galaxy_infrastructure_url"]}{settings["hooks_http"]}'
+        return settings
+
+    def is_ready(self, quiet=True):
+        # tusd serves its metrics unless started with -expose-metrics=false
+        try:
+            http_check(f"{self.settings['host']}:{self.settings['port']}", "/metrics")
+        except Exception as exc:
+            if not quiet:
+                gravity.io.error(exc)
+            return False
+        return True
 
 
 class GalaxyReportsService(Service):
+    __slots__ = ()
+
     _service_type = "reports"
-    service_name = "reports"
     _graceful_method = GracefulMethod.SIGHUP
     _default_environment = {
         "PYTHONPATH": "lib",
@@ -467,28 +596,36 @@ class GalaxyReportsService(Service):
                         " {command_arguments[url_prefix]}" \
                         " {settings[extra_args]}"
 
-    def _ensure_config_absolute_path(cls, v, values):
-        if "config_file" not in v:
+    @classmethod
+    def _validate_settings(cls, config, settings):
+        if "config_file" not in settings:
             gravity.io.exception("No reports config files specified.")
-        if not os.path.isabs(v["config_file"]):
-            v["config_file"] = os.path.join(os.path.dirname(values["config"].galaxy_config_file), v["config_file"])
-        return None
-
-    @validator("settings")
-    def _validate_settings(cls, v, values):
-        GalaxyReportsService._ensure_config_absolute_path(cls, v, values)
-        if not os.path.exists(v["config_file"]):
-            gravity.io.exception(f"Reports enabled but reports config file does not exist: {v['config_file']}")
-        return v
+        if not os.path.isabs(settings["config_file"]):
+            settings["config_file"] = os.path.join(os.path.dirname(config.galaxy_config_file), settings["config_file"])
+        if not os.path.exists(settings["config_file"]):
+            gravity.io.exception(f"Reports enabled but reports config file does not exist: {settings['config_file']}")
+        return settings
+
+    def is_ready(self, quiet=True):
+        url_prefix = (self.settings.get("url_prefix") or "").rstrip("/")
+        try:
+            http_check(self.settings["bind"], f"{url_prefix}/")
+        except Exception as exc:
+            if not quiet:
+                gravity.io.error(exc)
+            return False
+        return True
 
 
 class GalaxyStandaloneService(Service):
+    __slots__ = ()
+
     _service_type = "standalone"
-    service_name = "standalone"
     # TODO: add these to Galaxy docs
     _default_settings = {
         "start_timeout": 20,
         "stop_timeout": 65,
+        "restart_timeout": 300,
     }
     _service_list_allowed = True
     _source_command_template = "{virtualenv_bin}python ./lib/galaxy/main.py -c {galaxy_conf}" \
@@ -503,14 +640,39 @@ class GalaxyStandaloneService(Service):
         else:
             return self._source_command_template
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    @classmethod
+    def _validate_settings(cls, config, settings):
         # ensure defaults are part of settings, this is not automatic since standalone does not have gravity settings
-        settings = self._default_settings.copy()
-        settings.update(self.settings)
-        self.settings = settings
+        settings = placement.validate_settings({**cls._default_settings, **settings})
+        if settings.get("restart") is not None:
+            settings["restart"] = RestartSettings(**settings["restart"]).dict()
+        if settings.get("readiness") is not None:
+            settings["readiness"] = ReadinessSettings(**settings["readiness"]).dict()
+        batch_size = settings.get("rolling_restart_batch_size")
+        if batch_size is not None and (not isinstance(batch_size, int) or batch_size < 1):
+            raise ValueError(f"rolling_restart_batch_size must be a positive integer: {batch_size}")
+        return settings
+
+    def __init__(self, config, settings, service_name=None):
+        super().__init__(config, settings, service_name=service_name)
         if "server_name" not in self.settings:
-            self.settings["server_name"] = self.service_name
+            # the shared settings are not modified, the server name is specific to this service
+            object.__setattr__(self, "settings", MappingProxyType(ChainMap({"server_name": self.service_name}, self.settings)))
+
+    @property
+    def has_readiness_check(self):
+        return bool(self.settings.get("readiness"))
+
+    def readiness_probe(self):
+        if not self.has_readiness_check:
+            return super().readiness_probe()
+        return HandlerReadinessProbe(self, since=time.time())
+
+    def is_ready(self, quiet=True):
+        # without a readiness check, there is nothing to wait for
+        if not self.has_readiness_check:
+            return True
+        return HandlerReadinessProbe(self).ready(quiet=quiet)
 
     def get_command_arguments(self, format_vars):
         # full override to do the join
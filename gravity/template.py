@@ -0,0 +1,139 @@
+""" Compiled ``str.format()`` templates.
+
+The same command, environment and process manager templates are rendered for every service. Each template is parsed once
+(and cached) and compiled into a render function, an f-string with the template's literal text and field lookups, so
+rendering neither reparses the template nor copies the format vars into keyword arguments.
+
+The fields that a template references are known when it is compiled, so :func:`compile_template` checks them against the
+names of the format vars that it will be rendered with, if given, and templates can be checked before anything is
+rendered. Fields that cannot be resolved when rendering (e.g. a missing key of ``settings``) are reported by name.
+"""
+import functools
+import keyword
+import string
+from _string import formatter_field_name_split
+
+import gravity.io
+
+_formatter = string.Formatter()
+
+_CONVERSIONS = {"r": "repr", "s": "str", "a": "ascii"}
+
+
+class Template:
+    __slots__ = ("source", "fields", "names", "_render")
+
+    def __init__(self, source):
+        self.source = source
+        fields = []
+        keys = []
+        subtemplates = []
+        body = self._compile(source, fields, keys, subtemplates)
+        # fields in the order they first appear, e.g. ``settings[bind]``
+        self.fields = tuple(dict.fromkeys(fields))
+        # the top level format vars used, e.g. ``settings``
+        self.names = frozenset(_field_name(field) for field in self.fields)
+        # the body only refers to keys and subtemplates by index, so it contains no quotes or backslashes of its own
+        self._render = eval(f"lambda v: f{body!r}", {"_k": tuple(keys), "_t": tuple(subtemplates)})
+
+    def _compile(self, source, fields, keys, subtemplates):
+        """Return the body of an f-string that renders ``source``, collecting its fields, keys and nested templates."""
+        body = []
+        for literal, field, format_spec, conversion in _formatter.parse(source):
+            body.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is None:
+                continue
+            if not field or field[0].isdigit():
+                raise ValueError(f"Positional fields are not supported in templates: {source!r}")
+            fields.append(field)
+            expr = self._lookup(field, keys)
+            if conversion:
+                expr = f"{_CONVERSIONS[conversion]}({expr})"
+            if format_spec:
+                if "{" in format_spec:
+                    # format specs can contain nested fields
+                    spec = Template(format_spec)
+                    fields.extend(spec.fields)
+                    subtemplates.append(spec._render)
+                    expr = f"format({expr}, _t[{len(subtemplates) - 1}](v))"
+                else:
+                    keys.append(format_spec)
+                    expr = f"format({expr}, _k[{len(keys) - 1}])"
+            body.append(f"{{{expr}}}")
+        return "".join(body)
+
+    @staticmethod
+    def _lookup(field, keys):
+        first, rest = formatter_field_name_split(field)
+        keys.append(first)
+        expr = f"v[_k[{len(keys) - 1}]]"
+        for is_attr, key in rest:
+            if is_attr:
+                if not key.isidentifier() or keyword.iskeyword(key):
+                    raise ValueError(f"Invalid attribute in template field: {field!r}")
+                expr = f"{expr}.{key}"
+            else:
+                keys.append(key)
+                expr = f"{expr}[_k[{len(keys) - 1}]]"
+        return expr
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.source!r})"
+
+    def undefined_fields(self, format_vars):
+        """Return the fields referenced by the template that cannot be resolved from ``format_vars``."""
+        undefined = []
+        for field in self.fields:
+            try:
+                _formatter.get_field(field, (), format_vars)
+            except (KeyError, IndexError, AttributeError, TypeError):
+                undefined.append(field)
+        return undefined
+
+    def check(self, names, name=None):
+        """Raise if the template references format vars other than ``names``."""
+        if not self.names <= names:
+            undefined = [field for field in self.fields if _field_name(field) not in names]
+            gravity.io.exception(f"Undefined field(s) in {name or 'template'}: {', '.join(undefined)}")
+
+    def render(self, format_vars, name=None):
+        try:
+            return self._render(format_vars)
+        except (KeyError, IndexError, AttributeError) as exc:
+            undefined = self.undefined_fields(format_vars) or [str(exc)]
+            gravity.io.exception(f"Undefined field(s) in {name or 'template'}: {', '.join(undefined)}")
+
+    def render_many(self, format_vars_list, names=None):
+        """Render the template with each of ``format_vars_list``, ``names`` are the names of what each one renders."""
+        render = self._render
+        try:
+            return [render(format_vars) for format_vars in format_vars_list]
+        except (KeyError, IndexError, AttributeError):
+            # find (and report) the first one that failed
+            for format_vars, name in zip(format_vars_list, names or [None] * len(format_vars_list)):
+                self.render(format_vars, name=name)
+            raise
+
+
+def _field_name(field):
+    return field.partition(".")[0].partition("[")[0]
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(source):
+    return Template(source)
+
+
+def compile_template(source, names=None, name=None):
+    """Return the compiled :class:`Template` of ``source``, which is only parsed and compiled on the first call.
+
+    If ``names`` (a frozenset of format var names) is given, the template may only reference those format vars.
+    """
+    template = _compile(source)
+    if names is not None:
+        template.check(names, name=name)
+    return template
+
+
+def render(source, format_vars, name=None):
+    return compile_template(source).render(format_vars, name=name)
@@ -0,0 +1,132 @@
+""" Timing of the phases of galaxyctl commands.
+
+Phases of a command (loading configs, rendering process manager configs, calls to ``supervisorctl`` and ``systemctl``,
+waiting for services to become ready, etc.) are wrapped in :func:`span`. With ``galaxyctl --profile``, the spans are
+printed as a tree of durations once the command completes, and with ``--trace-file``, written in the Chrome trace event
+format, which can be loaded in ``chrome://tracing`` or https://ui.perfetto.dev/.
+
+Spans are only recorded once tracing is enabled, or provisionally after :func:`begin`, so that the spans of a command
+that occur before its command line options are parsed (e.g. importing the subcommand) are still recorded. Provisional
+spans are discarded by :func:`finish` if tracing was not enabled.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+# when this module is first imported, which gravity.cli does before anything else. click (and gravity.io, which imports
+# it) are only imported where they are used, so that the time spent importing them is counted.
+IMPORT_START = time.perf_counter()
+
+Span = namedtuple("Span", ("name", "start", "end", "depth", "args", "tid"))
+
+_enabled = False
+_recording = False
+_output = {}
+_spans = []
+_local = threading.local()
+
+
+def enable(report=False, trace_file=None):
+    """Start recording spans, and output them with :func:`finish` to stderr if ``report`` is set and to ``trace_file``
+    if it is set.
+    """
+    global _enabled
+    _enabled = True
+    _output.update(report=report, trace_file=trace_file)
+
+
+def enabled():
+    return _enabled
+
+
+def begin():
+    """Record spans provisionally until tracing is enabled or :func:`finish` is called."""
+    global _recording
+    _recording = True
+
+
+def reset():
+    global _enabled, _recording
+    _enabled = False
+    _recording = False
+    _output.clear()
+    _spans.clear()
+
+
+def record(name, start, end=None, depth=0, **args):
+    """Record a span that was timed by the caller, e.g. because it occurred before tracing could be enabled."""
+    _spans.append(Span(name, start, end or time.perf_counter(), depth, args, threading.get_ident()))
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    """Time the enclosed block. ``args`` are included in the trace."""
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        if _enabled or _recording:
+            _spans.append(Span(name, start, time.perf_counter(), depth, args, threading.get_ident()))
+
+
+def spans():
+    return sorted(_spans, key=lambda s: (s.start, -s.end))
+
+
+def _format_args(args):
+    return " ".join(f"{k}={v}" for k, v in args.items())
+
+
+def report():
+    """Print the recorded spans as a tree of durations to stderr."""
+    import click
+
+    recorded = spans()
+    if not recorded:
+        return
+    total = max(s.end for s in recorded) - min(s.start for s in recorded)
+    click.echo("\nTiming (ms):", err=True)
+    for s in recorded:
+        duration = (s.end - s.start) * 1000
+        percent = (s.end - s.start) / total * 100 if total else 100
+        label = f"{'  ' * s.depth}{s.name}"
+        if s.args:
+            label = f"{label} ({_format_args(s.args)})"
+        click.echo(f"{duration:10.1f} {percent:5.1f}%  {label}", err=True)
+
+
+def write_chrome_trace(path):
+    """Write the recorded spans to ``path`` in the Chrome trace event format."""
+    recorded = spans()
+    origin = min((s.start for s in recorded), default=0)
+    pid = os.getpid()
+    events = [{
+        "name": s.name,
+        "cat": "gravity",
+        "ph": "X",
+        "ts": round((s.start - origin) * 1000000, 1),
+        "dur": round((s.end - s.start) * 1000000, 1),
+        "pid": pid,
+        "tid": s.tid,
+        "args": {k: str(v) for k, v in s.args.items()},
+    } for s in recorded]
+    with open(path, "w") as fh:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fh)
+
+
+def finish():
+    """Output the recorded spans as requested with :func:`enable`, and stop recording."""
+    if _output.get("report"):
+        report()
+    if _output.get("trace_file"):
+        import gravity.io
+
+        write_chrome_trace(_output["trace_file"])
+        gravity.io.info(f"Wrote trace: {_output['trace_file']}", bright=False)
+    reset()
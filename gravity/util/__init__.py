@@ -5,11 +5,6 @@ import copy
 import os
 import sys
 
-import jsonref
-import requests
-import requests_unixsocket
-import yaml
-
 from gravity.settings import Settings
 
 
@@ -39,6 +34,9 @@ def which(file):
 
 
 def settings_to_sample():
+    # imported here, like the other libraries only needed by a few commands, so that galaxyctl starts quickly
+    import jsonref
+
     schema = Settings.schema_json()
     # expand schema for easier processing
     data = jsonref.loads(schema)
@@ -56,6 +54,8 @@ def process_property(key, value, depth=0):
         # Little hack that prevents listing the default value for tusd in the sample config
         default = {}
     if default != "":
+        import yaml
+
         # make values more yaml-like.
         default = yaml.dump(default)
         if default.endswith("\n...\n"):
@@ -67,8 +67,10 @@ def process_property(key, value, depth=0):
         # we've got a union
         combined = [c for c in value["anyOf"] if c["type"] == "object"]
     if combined and combined[0].get("properties"):
-        # we've got a nested map, add key once
-        description = f"{description}\n{extra_white_space}{key}:\n"
+        # we've got a nested map, add key once. maps nested within sections are commented out like other settings, so
+        # that the sections keep their default values
+        key_comment = "# " if depth > 1 else ""
+        description = f"{description}\n{extra_white_space}{key_comment}{key}:\n"
     has_child = False
     for item in combined:
         if "enum" in item:
@@ -92,7 +94,11 @@ def process_property(key, value, depth=0):
 
 
 def http_check(bind, path):
+    import requests
+
     if bind.startswith("unix:"):
+        import requests_unixsocket
+
         socket = requests.utils.quote(bind.split(":", 1)[1], safe="")
         session = requests_unixsocket.Session()
         response = session.get(f"http+unix://{socket}{path}")
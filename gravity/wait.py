@@ -0,0 +1,106 @@
+""" Waiting for changes in a directory.
+
+Used to wait for supervisord to create (or remove) its pid file and socket. On Linux, changes are detected with
+inotify(7) so that waiting ends as soon as the condition is met. Elsewhere, or if inotify is unavailable, the condition
+is polled at an increasing interval.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+
+import gravity.io
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# the condition is always rechecked at least this often, in case it changes without a change to the directory
+MAX_INTERVAL = 0.5
+MIN_INTERVAL = 0.01
+
+_libc = None
+
+
+def _inotify_libc():
+    global _libc
+    if _libc is None:
+        _libc = False
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                _libc = libc
+            except (OSError, AttributeError) as exc:
+                gravity.io.debug(f"inotify is unavailable: {exc}")
+    return _libc
+
+
+class _DirectoryWatch:
+    """inotify watch on a directory, or if inotify is unavailable, a fallback that never reports any changes."""
+
+    def __init__(self, path):
+        self.fd = None
+        libc = _inotify_libc()
+        if not libc:
+            return
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            gravity.io.debug(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return
+        if libc.inotify_add_watch(fd, os.fsencode(path), IN_WATCH_MASK) < 0:
+            gravity.io.debug(f"Unable to watch {path}: {os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return
+        self.fd = fd
+
+    def wait(self, timeout):
+        """Wait up to ``timeout`` seconds for a change."""
+        if self.fd is None:
+            time.sleep(timeout)
+            return
+        if select.select([self.fd], [], [], timeout)[0]:
+            # the events themselves are not needed, the caller rechecks its condition
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def wait_for(condition, directory, timeout=None):
+    """Wait until ``condition()`` is true, rechecking it whenever a file in ``directory`` is created, modified or
+    removed.
+
+    Returns ``True`` if the condition was met or ``False`` if ``timeout`` seconds passed first.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    watch = _DirectoryWatch(directory)
+    interval = MAX_INTERVAL if watch.fd is not None else MIN_INTERVAL
+    try:
+        # the watch is established before the first check so that no changes are missed
+        while not condition():
+            wait = interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            watch.wait(wait)
+            interval = min(interval * 2, MAX_INTERVAL)
+        return True
+    finally:
+        watch.close()
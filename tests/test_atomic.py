@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from gravity.atomic import FileTransaction, write_file
+
+
+def test_write_file(tmp_path):
+    path = tmp_path / "sub" / "file.conf"
+    write_file(str(path), "one")
+    assert path.read_text() == "one"
+    os.chmod(path, 0o640)
+    write_file(str(path), "two")
+    assert path.read_text() == "two"
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(path.parent) == ["file.conf"]
+
+
+def test_transaction_commit(tmp_path):
+    existing = tmp_path / "existing.conf"
+    existing.write_text("old")
+    new = tmp_path / "new.conf"
+    with FileTransaction() as transaction:
+        transaction.write(str(existing), "new")
+        transaction.write(str(new), "new")
+        # nothing is in place until the transaction is committed
+        assert existing.read_text() == "old"
+        assert not new.exists()
+    assert existing.read_text() == "new"
+    assert new.read_text() == "new"
+    assert sorted(os.listdir(tmp_path)) == ["existing.conf", "new.conf"]
+
+
+def test_transaction_rollback(tmp_path):
+    existing = tmp_path / "existing.conf"
+    existing.write_text("old")
+    new = tmp_path / "new.conf"
+    with pytest.raises(RuntimeError):
+        with FileTransaction() as transaction:
+            transaction.write(str(existing), "new")
+            transaction.write(str(new), "new")
+            raise RuntimeError()
+    assert existing.read_text() == "old"
+    assert os.listdir(tmp_path) == ["existing.conf"]
+    # committed changes are restored on rollback
+    transaction = FileTransaction()
+    transaction.write(str(existing), "new")
+    transaction.write(str(new), "new")
+    transaction.commit()
+    assert existing.read_text() == "new"
+    transaction.rollback()
+    assert existing.read_text() == "old"
+    assert os.listdir(tmp_path) == ["existing.conf"]
+
+
+def test_transaction_remove(tmp_path):
+    existing = tmp_path / "existing.conf"
+    existing.write_text("old")
+    new = tmp_path / "new.conf"
+    with pytest.raises(RuntimeError):
+        with FileTransaction() as transaction:
+            transaction.remove(str(existing))
+            transaction.write(str(new), "new")
+            # nothing is removed until the transaction is committed
+            assert existing.read_text() == "old"
+            raise RuntimeError()
+    assert os.listdir(tmp_path) == ["existing.conf"]
+    transaction = FileTransaction()
+    transaction.remove(str(existing))
+    transaction.remove(str(tmp_path / "missing.conf"))
+    transaction.write(str(new), "new")
+    transaction.commit()
+    assert os.listdir(tmp_path) == ["new.conf"]
+    # removed files are restored on rollback
+    transaction.rollback()
+    assert existing.read_text() == "old"
+    assert os.listdir(tmp_path) == ["existing.conf"]
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+
+from click.shell_completion import ShellComplete
+
+import gravity
+from gravity import completion, process_manager
+from gravity.cli import galaxyctl
+
+
+def complete(args, incomplete=''):
+    comp = ShellComplete(galaxyctl, {}, 'galaxyctl', '_GALAXYCTL_COMPLETE')
+    return [c.value for c in comp.get_completions(args, incomplete)]
+
+
+def update(galaxy_yml, config_manager, gravity_config):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'process_manager': 'supervisor', **gravity_config}}))
+    config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=config_manager) as pm:
+        pm.update()
+
+
+def test_complete_from_index(galaxy_yml, default_config_manager):
+    update(galaxy_yml, default_config_manager, {'instance_name': 'main', 'handlers': {'handler': {'processes': 2}}})
+    assert complete(['restart']) == ['celery', 'celery-beat', 'gunicorn', 'handler', 'main']
+    assert complete(['--config-file', str(galaxy_yml), 'restart', 'main'], 'ce') == ['celery', 'celery-beat']
+    # names that were already given are not completed again
+    assert complete(['restart', 'main', 'gunicorn'], 'g') == []
+    assert complete(['show'], 'm') == ['main']
+    assert 'main:handler1' in complete(['pm', 'status'])
+    # instances of other config files are not completed
+    assert complete(['--config-file', __file__, 'restart']) == []
+    # the index is not used once the config file changes
+    galaxy_yml.write('\n', mode='a')
+    assert complete(['restart']) == []
+
+
+def test_complete_config_file_from_environment(galaxy_yml, default_config_manager, monkeypatch):
+    update(galaxy_yml, default_config_manager, {'instance_name': 'main'})
+    monkeypatch.setenv('GALAXY_CONFIG_FILE', __file__)
+    assert complete(['show']) == []
+    # $GRAVITY_CONFIG_FILE takes precedence over $GALAXY_CONFIG_FILE
+    monkeypatch.setenv('GRAVITY_CONFIG_FILE', str(galaxy_yml))
+    assert complete(['show']) == ['main']
+    # even if it does not exist, in which case galaxyctl fails rather than using $GALAXY_CONFIG_FILE
+    monkeypatch.setenv('GRAVITY_CONFIG_FILE', str(galaxy_yml) + '.missing')
+    monkeypatch.setenv('GALAXY_CONFIG_FILE', str(galaxy_yml))
+    assert complete(['show']) == []
+
+
+def test_index_replaces_instances(galaxy_yml, default_config_manager, state_dir):
+    update(galaxy_yml, default_config_manager, {'instance_name': 'old'})
+    assert list(completion.read_index(str(state_dir))) == ['old']
+    default_config_manager = type(default_config_manager)(state_dir=state_dir)
+    update(galaxy_yml, default_config_manager, {'instance_name': 'new'})
+    assert list(completion.read_index(str(state_dir))) == ['new']
+
+
+def test_complete_without_loading_config(galaxy_yml, default_config_manager):
+    update(galaxy_yml, default_config_manager, {'instance_name': 'main'})
+    code = (
+        "import atexit, sys; atexit.register(lambda: print('gravity.config_manager' in sys.modules, file=sys.stderr)); "
+        "from gravity.cli import galaxyctl; galaxyctl(prog_name='galaxyctl')"
+    )
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.path.dirname(os.path.dirname(gravity.__file__)),
+        _GALAXYCTL_COMPLETE='bash_complete',
+        COMP_WORDS='galaxyctl restart gu',
+        COMP_CWORD='2',
+    )
+    proc = subprocess.run([sys.executable, '-c', code], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    assert proc.stdout.splitlines() == ['plain,gunicorn']
+    assert proc.stderr.strip() == 'False'
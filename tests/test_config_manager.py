@@ -5,7 +5,7 @@ import pytest
 
 from gravity import config_manager
 from gravity.settings import Settings
-from gravity.state import GracefulMethod
+from gravity.state import GalaxyStandaloneService, GracefulMethod
 
 
 def test_load_defaults(galaxy_yml, galaxy_root_dir, state_dir, default_config_manager):
@@ -109,4 +109,109 @@ def test_gunicorn_graceful_method_no_preload(galaxy_yml, default_config_manager)
     assert graceful_method == GracefulMethod.SIGHUP
 
 
+def test_expanded_handlers_share_settings(galaxy_yml, default_config_manager, monkeypatch):
+    validated = []
+    validate_settings = GalaxyStandaloneService._validate_settings.__func__
+
+    def _validate_settings(cls, config, settings):
+        validated.append(settings)
+        return validate_settings(cls, config, settings)
+
+    monkeypatch.setattr(GalaxyStandaloneService, "_validate_settings", classmethod(_validate_settings))
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {
+            'use_service_instances': False,
+            'handlers': {'handler': {'processes': 3, 'pools': ['job-handlers']}}}}
+    ))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    config = default_config_manager.get_config()
+    handlers = config.get_services(['handler_0', 'handler_1', 'handler_2'])
+    assert [h.settings['server_name'] for h in handlers] == ['handler_0', 'handler_1', 'handler_2']
+    assert handlers[0].settings['start_timeout'] == 20
+    assert len(validated) == 1
+    with pytest.raises(TypeError):
+        handlers[0].settings['server_name'] = 'handler_3'
+    with pytest.raises(AttributeError):
+        handlers[0].service_name = 'handler_3'
+
+
+def test_load_config_files_in_order(galaxy_root_dir, state_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(config_manager, "PARALLEL_LOAD_MIN_FILES", 2)
+    galaxy_yml_sample = str(galaxy_root_dir / "config" / "galaxy.yml.sample")
+    config_files = []
+    for name in ("c", "a", "d", "b"):
+        config_file = tmp_path / f"{name}.yml"
+        config_file.write_text(json.dumps({
+            'gravity': {'instance_name': name, 'galaxy_root': str(galaxy_root_dir), 'galaxy_config_file': galaxy_yml_sample}
+        }))
+        config_files.append(str(config_file))
+    with config_manager.config_manager(config_file=config_files, state_dir=state_dir) as cm:
+        assert cm.get_configured_instance_names() == ["c", "a", "d", "b"]
+        assert cm.get_configured_files() == config_files
+        assert cm.get_config(instance_name="d").galaxy_config_file == galaxy_yml_sample
+    (tmp_path / "e.yml").write_text(json.dumps({'gravity': {'instance_name': 'a', 'galaxy_root': str(galaxy_root_dir)}}))
+    config_files.insert(2, str(tmp_path / "e.yml"))
+    with pytest.raises(Exception, match="Duplicate instance name a,"):
+        config_manager.ConfigManager(config_file=config_files, state_dir=state_dir)
+
+
 # TODO: tests for switching process managers between supervisor and systemd
+
+
+def test_get_job_config_xml_stops_after_handlers(tmp_path):
+    # the unparseable content after </handlers> is never read
+    job_conf = tmp_path / "job_conf.xml"
+    job_conf.write_text("""<job_conf>
+    <plugins><plugin id="local" type="runner" load="galaxy.jobs.runners.local:LocalJobRunner"/></plugins>
+    <handlers assign_with="db-skip-locked, db-self">
+        <handler id="handler0"/>
+        <handler id="handler1"/>
+    </handlers>
+    <destinations><broken
+""")
+    cache_dir = tmp_path / "cache"
+    assign_with, handlers = config_manager.ConfigManager.get_job_config(str(job_conf), cache_dir=str(cache_dir))
+    assert assign_with == ["db-skip-locked", "db-self"]
+    assert handlers == [{"service_name": "handler0"}, {"service_name": "handler1"}]
+    assert (cache_dir / "job_config_cache.json").exists()
+    # modifying the returned handlers does not modify the cached copy
+    handlers[0].pop("service_name")
+    assert config_manager.ConfigManager.get_job_config(str(job_conf))[1][0] == {"service_name": "handler0"}
+
+
+def test_get_job_config_yaml_stops_after_handling(tmp_path):
+    job_conf = tmp_path / "job_conf.yml"
+    job_conf.write_text("""runners:
+  local:
+    load: galaxy.jobs.runners.local:LocalJobRunner
+handling:
+  assign:
+    - db-self
+  processes:
+    handler0:
+    handler1:
+      environment:
+        FOO: foo
+execution: [unclosed
+""")
+    assign_with, handlers = config_manager.ConfigManager.get_job_config(str(job_conf))
+    assert assign_with == ["db-self"]
+    assert handlers == [
+        {"service_name": "handler0", "environment": None},
+        {"service_name": "handler1", "environment": {"FOO": "foo"}},
+    ]
+
+
+def test_get_job_config_yaml_alias_fallback(tmp_path):
+    job_conf = tmp_path / "job_conf.yml"
+    job_conf.write_text("""handler_env: &env
+  FOO: foo
+handling:
+  assign: [db-skip-locked]
+  processes:
+    handler0:
+      environment: *env
+""")
+    assign_with, handlers = config_manager.ConfigManager.get_job_config(str(job_conf))
+    assert assign_with == ["db-skip-locked"]
+    assert handlers == [{"service_name": "handler0", "environment": {"FOO": "foo"}}]
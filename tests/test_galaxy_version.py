@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+import gravity
+from gravity import galaxy_version
+
+
+VERSION_PY = """
+VERSION_MAJOR = "{major}"
+VERSION_MINOR = "{minor}"
+VERSION = VERSION_MAJOR + (f".{{VERSION_MINOR}}" if VERSION_MINOR else "")
+"""
+
+
+def write_version(path, major, minor, mtime):
+    path.write_text(VERSION_PY.format(major=major, minor=minor))
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_version_from_file(tmp_path):
+    version_py = tmp_path / "version.py"
+    write_version(version_py, "23.1", "dev0", 1_000_000_000)
+    assert galaxy_version.version_from_file(str(version_py)) == "23.1.dev0"
+    # reparsed when modified
+    write_version(version_py, "23.1", "", 2_000_000_000)
+    assert galaxy_version.version_from_file(str(version_py)) == "23.1"
+
+
+def test_version_from_file_unsupported_expression(tmp_path):
+    # anything outside of the supported subset of expressions falls back to the version literals, and is never executed
+    version_py = tmp_path / "version.py"
+    version_py.write_text('VERSION_MAJOR = "23.0"\nVERSION_MINOR = "dev0"  # minor\nVERSION = ".".join([VERSION_MAJOR, VERSION_MINOR])\n')
+    assert galaxy_version.version_from_file(str(version_py)) == "23.0.dev0"
+    version_py.write_text('VERSION = ".".join(["23", "0"])\nraise Exception("version.py was executed")\n')
+    assert galaxy_version.version_from_file(str(version_py)) is None
+
+
+def test_installed_galaxy_not_imported(tmp_path):
+    # importing galaxy.config is slow, so gravity must only locate it
+    galaxy_lib = tmp_path / "galaxy"
+    (galaxy_lib / "config").mkdir(parents=True)
+    (galaxy_lib / "__init__.py").write_text("")
+    (galaxy_lib / "config" / "__init__.py").write_text("raise Exception('galaxy.config was imported')\n")
+    write_version(galaxy_lib / "version.py", "23.1", "", 1_000_000_000)
+    code = (
+        "import sys; import gravity.cli, gravity.state; from gravity import galaxy_version; "
+        "print(gravity.state.galaxy_installed, galaxy_version.installed_version(), "
+        "'galaxy.config' in sys.modules, 'galaxy.version' in sys.modules)"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), os.path.dirname(os.path.dirname(gravity.__file__))]))
+    output = subprocess.check_output([sys.executable, "-c", code], env=env, universal_newlines=True)
+    assert output.split() == ["True", "23.1", "False", "False"]
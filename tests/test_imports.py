@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+import gravity
+
+
+def test_heavy_dependencies_imported_lazily():
+    # the HTTP stack, jsonref and supervisor's RPC client are only imported by the code paths that use them
+    code = (
+        "import sys; import gravity.cli, gravity.commands.cmd_exec, gravity.commands.cmd_list; "
+        "print(' '.join(m for m in ('requests', 'requests_unixsocket', 'jsonref', 'supervisor.supervisorctl') "
+        "if m in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(gravity.__file__)))
+    output = subprocess.check_output([sys.executable, "-c", code], env=env, universal_newlines=True)
+    assert output.split() == []
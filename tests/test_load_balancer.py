@@ -0,0 +1,111 @@
+import json
+import socket
+import threading
+
+import click
+import pytest
+
+from gravity import load_balancer, process_manager
+from gravity.state import GalaxyGunicornService
+
+
+@pytest.fixture
+def no_drain_wait(monkeypatch):
+    monkeypatch.setattr(load_balancer.time, 'sleep', lambda seconds: None)
+
+
+def load_gunicorns(galaxy_yml, config_manager, lb_settings, **gunicorn_settings):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'process_manager': 'supervisor',
+        'load_balancer': lb_settings,
+        'gunicorn': [
+            {'bind': 'localhost:8080', **gunicorn_settings},
+            {'bind': 'unix:/srv/galaxy/var/gunicorn1.sock', **gunicorn_settings}]}}))
+    config_manager.load_config_file(str(galaxy_yml))
+    return config_manager.get_config()
+
+
+def test_nginx_upstream(galaxy_yml, default_config_manager, tmp_path, no_drain_wait, monkeypatch):
+    upstream = tmp_path / 'upstream.conf'
+    reloads = tmp_path / 'reloads'
+    config = load_gunicorns(galaxy_yml, default_config_manager, {
+        'path': str(upstream), 'reload_command': f'echo reload >> {reloads}'})
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+        pm.update()
+    assert upstream.read_text().splitlines()[1:] == [
+        'upstream galaxy {',
+        '    server localhost:8080;',
+        '    server unix:/srv/galaxy/var/gunicorn1.sock;',
+        '}',
+    ]
+    # reloaded only when changed
+    assert reloads.read_text() == 'reload\n'
+    # each gunicorn is down while it is restarted
+    monkeypatch.setattr(GalaxyGunicornService, 'is_ready', lambda self, quiet=True: True)
+    gunicorn = config.get_service('gunicorn')
+    upstreams = []
+    gunicorn.rolling_restart(
+        [lambda: upstreams.append(upstream.read_text())] * 2, **load_balancer.rolling_restart_hooks(config, gunicorn))
+    assert '    server localhost:8080 down;' in upstreams[0]
+    assert '    server unix:/srv/galaxy/var/gunicorn1.sock;' in upstreams[0]
+    assert '    server localhost:8080;' in upstreams[1]
+    assert '    server unix:/srv/galaxy/var/gunicorn1.sock down;' in upstreams[1]
+    assert ' down;' not in upstream.read_text()
+    assert reloads.read_text() == 'reload\n' * 5
+
+
+def test_drained_after_failed_restart(galaxy_yml, default_config_manager, tmp_path, no_drain_wait, monkeypatch):
+    upstream = tmp_path / 'upstream.conf'
+    config = load_gunicorns(galaxy_yml, default_config_manager, {'path': str(upstream)}, restart_timeout=0)
+    load_balancer.update(config)
+
+    class NeverReady:
+        def ready(self):
+            return False
+
+    monkeypatch.setattr(GalaxyGunicornService, 'is_ready', lambda self, quiet=True: True)
+    monkeypatch.setattr(GalaxyGunicornService, 'readiness_probe', lambda self: NeverReady())
+    gunicorn = config.get_service('gunicorn')
+    upstreams = []
+    with pytest.raises(click.ClickException, match='failed to respond after 0 seconds and were left drained'):
+        gunicorn.rolling_restart(
+            [lambda: upstreams.append(upstream.read_text())] * 2, **load_balancer.rolling_restart_hooks(config, gunicorn))
+    assert len(upstreams) == 1
+    # the instance that failed its readiness check is not sent traffic, the rest were not restarted
+    assert '    server localhost:8080 down;' in upstream.read_text()
+    assert '    server unix:/srv/galaxy/var/gunicorn1.sock;' in upstream.read_text()
+
+
+def test_haproxy_runtime_api(galaxy_yml, default_config_manager, tmp_path, no_drain_wait):
+    runtime_socket = tmp_path / 'haproxy.sock'
+    backend = tmp_path / 'backend.cfg'
+    config = load_gunicorns(galaxy_yml, default_config_manager, {
+        'type': 'haproxy', 'path': str(backend), 'runtime_socket': str(runtime_socket)})
+    load_balancer.update(config)
+    assert backend.read_text().splitlines()[1:] == [
+        'backend galaxy',
+        '    server gunicorn0 localhost:8080 check',
+        '    server gunicorn1 /srv/galaxy/var/gunicorn1.sock check',
+    ]
+    commands = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(runtime_socket))
+        server.listen()
+
+        def serve():
+            for _ in range(2):
+                conn, _ = server.accept()
+                with conn:
+                    commands.append(conn.recv(4096).decode())
+                    conn.sendall(b'\n')
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        gunicorn = config.get_service('gunicorn')
+        load_balancer.drain(config, [gunicorn.services[0]])
+        load_balancer.restore(config, [gunicorn.services[0]])
+        thread.join()
+    assert commands == ['set server galaxy/gunicorn0 state drain\n', 'set server galaxy/gunicorn0 state ready\n']
+    # the configuration is not rewritten
+    assert 'disabled' not in backend.read_text()
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from gravity import locks, process_manager
+
+HOLD_LOCK = """
+import fcntl, os, sys, time
+fd = os.open(sys.argv[1], os.O_RDWR | os.O_CREAT)
+fcntl.flock(fd, fcntl.LOCK_EX)
+print("locked", flush=True)
+time.sleep(float(sys.argv[2]))
+"""
+
+
+def test_lock_waits_for_other_process(tmp_path, capsys):
+    path = str(tmp_path / "locks" / "test.lock")
+    os.makedirs(os.path.dirname(path))
+    holder = subprocess.Popen([sys.executable, "-c", HOLD_LOCK, path, "1"], stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        start = time.time()
+        with locks.lock(path, "test"):
+            assert time.time() - start > 0.5
+            with open(path) as fh:
+                assert fh.read().strip() == str(os.getpid())
+    finally:
+        holder.wait()
+    assert "Waiting for test lock" in capsys.readouterr().out
+
+
+def test_lock_reentrant(tmp_path):
+    path = str(tmp_path / "test.lock")
+    with locks.lock(path, "test"):
+        with locks.lock(path, "test"):
+            assert path in locks._held
+        assert path in locks._held
+    assert path not in locks._held
+
+
+def test_mutating_commands_lock_instances(galaxy_yml, default_config_manager, monkeypatch):
+    instance_name = os.path.basename(default_config_manager.state_dir)
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'instance_name': instance_name}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    config = default_config_manager.get_config()
+    lock_path = locks.instance_lock_path(config)
+    locked = []
+
+    def update(*args, **kwargs):
+        locked.append(lock_path in locks._held)
+
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        supervisor = pm.process_managers['supervisor']
+        monkeypatch.setattr(supervisor, 'update', update)
+        monkeypatch.setattr(supervisor, 'status', update)
+        pm.update()
+        pm.status()
+    assert locked == [True, False]
+    assert os.path.exists(lock_path)
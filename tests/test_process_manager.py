@@ -1,3 +1,4 @@
+import io
 import json
 import os
 import time
@@ -5,9 +6,13 @@ import string
 from pathlib import Path
 
 import pytest
-from gravity import process_manager
+from click import ClickException
+from gravity import compiled, config_manager, fingerprint, placement, process_manager, sd_notify
+from gravity.launch import launch_spec_path, read_launch_spec
 from gravity.process_manager.supervisor import supervisor_program_names
+from gravity.process_manager.systemd import systemd_escape
 from gravity.settings import GX_IT_PROXY_MIN_VERSION
+from gravity.state import GracefulMethod
 from yaml import safe_load
 
 
@@ -163,6 +168,23 @@ def test_update_force(galaxy_yml, default_config_manager, process_manager_name):
     assert gunicorn_conf_path.stat().st_mtime != update_time
 
 
+@pytest.mark.parametrize('process_manager_name', ['supervisor', 'systemd'])
+def test_update_undefined_template_field(galaxy_yml, default_config_manager, process_manager_name):
+    instance_name = os.path.basename(default_config_manager.state_dir)
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {'process_manager': process_manager_name,
+                                     'service_command_style': 'direct',
+                                     'instance_name': instance_name,
+                                     'celery': {'environment': {'FOO': '{settings[undefined]}'}}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with pytest.raises(ClickException, match=r"environment variable FOO: settings\[undefined\]"):
+        with process_manager.process_manager(config_manager=default_config_manager) as pm:
+            pm.update()
+    # nothing is written if any service fails to render
+    gunicorn_conf_path = service_conf_path(default_config_manager.state_dir, process_manager_name, 'gunicorn')
+    assert not gunicorn_conf_path.exists()
+
+
 @pytest.mark.parametrize('process_manager_name', ['supervisor', 'systemd'])
 def test_cleanup(galaxy_yml, default_config_manager, process_manager_name):
     test_update(galaxy_yml, default_config_manager, process_manager_name)
@@ -296,6 +318,86 @@ def test_static_handlers_direct(default_config_manager, galaxy_yml, job_conf, pr
             assert service_conf_path(state_dir, process_manager_name, handler_name, service_type='standalone').exists()
 
 
+@pytest.mark.parametrize('process_manager_name', ['supervisor', 'systemd'])
+def test_launch_command_style(default_config_manager, galaxy_yml, process_manager_name):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+    galaxy_yml.write(json.dumps({
+        'gravity': {'process_manager': process_manager_name,
+                    'service_command_style': 'launch',
+                    'instance_name': instance_name,
+                    'gunicorn': [{'bind': 'localhost:8081'}, {'bind': 'localhost:8082'}],
+                    'celery': {'environment': {'FOO': 'foo'}}},
+        'galaxy': None}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+    celery_spec_path = launch_spec_path(state_dir, instance_name, 'celery', 'celery')
+    celery_config = service_conf_path(state_dir, process_manager_name, 'celery').open().read()
+    assert f' -m gravity.launch {celery_spec_path}' in celery_config
+    assert 'FOO=foo' not in celery_config
+    celery_spec = read_launch_spec(celery_spec_path)
+    assert celery_spec['argv'][0].endswith('celery')
+    assert celery_spec['env']['FOO'] == 'foo'
+    assert celery_spec['umask'] == '022'
+    gunicorn_spec_path = launch_spec_path(state_dir, instance_name, 'gunicorn', 'gunicorn')
+    assert 'localhost:8082' in read_launch_spec(gunicorn_spec_path, instance_number=1)['argv']
+    # specs for removed services are removed
+    galaxy_yml.write(json.dumps({
+        'gravity': {'process_manager': process_manager_name,
+                    'service_command_style': 'launch',
+                    'instance_name': instance_name,
+                    'celery': {'enable': False, 'enable_beat': False}},
+        'galaxy': None}))
+    with config_manager.config_manager(state_dir=state_dir) as cm:
+        cm.load_config_file(str(galaxy_yml))
+        with process_manager.process_manager(config_manager=cm) as pm:
+            pm.update()
+    assert not os.path.exists(celery_spec_path)
+    assert os.path.exists(gunicorn_spec_path)
+
+
+@pytest.mark.parametrize('process_manager_name', ['supervisor', 'systemd'])
+def test_compile(default_config_manager, galaxy_yml, process_manager_name):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+    galaxy_yml.write(json.dumps({
+        'gravity': {'process_manager': process_manager_name,
+                    'service_command_style': 'launch',
+                    'instance_name': instance_name,
+                    'gunicorn': [{'bind': 'localhost:8081'}, {'bind': 'localhost:8082'}],
+                    'celery': {'environment': {'FOO': 'foo'}}},
+        'galaxy': None}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    out = io.StringIO()
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        compiled.dump(pm.compile(), out)
+        pm.update()
+    artifact = compiled.load(io.StringIO(out.getvalue()))
+    assert artifact['format'] == compiled.COMPILED_FORMAT
+    instance = artifact['instances'][instance_name]
+    assert instance['process_manager'] == process_manager_name
+    assert instance['config']['gravity_config_file'] == str(galaxy_yml)
+    celery = instance['services']['celery']
+    assert celery['service_type'] == 'celery'
+    assert celery['exec_specs'][0]['env']['FOO'] == 'foo'
+    gunicorn = instance['services']['gunicorn']
+    assert [s['settings']['bind'] for s in gunicorn['services']] == ['localhost:8081', 'localhost:8082']
+    assert 'localhost:8082' in gunicorn['exec_specs'][1]['argv']
+    # the compiled pm files are those written by update
+    for pm_file in instance['pm_files']:
+        assert open(pm_file['path']).read() == pm_file['contents']
+    celery_conf = service_conf_path(state_dir, process_manager_name, 'celery')
+    assert str(celery_conf) in [pm_file['path'] for pm_file in instance['pm_files']]
+    # compiling is deterministic
+    out2 = io.StringIO()
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        compiled.dump(pm.compile(), out2)
+    assert out.getvalue() == out2.getvalue()
+    with pytest.raises(ClickException, match='Unsupported compiled config format'):
+        compiled.load(io.StringIO(json.dumps({'type': 'header', 'format': 0}) + '\n'))
+
+
 @pytest.mark.parametrize('process_manager_name', ['supervisor', 'systemd'])
 def test_static_handlers_embedded_in_galaxy_yml(default_config_manager, galaxy_yml, process_manager_name):
     state_dir = default_config_manager.state_dir
@@ -333,6 +435,48 @@ def test_gxit_handler(default_config_manager, galaxy_yml, gxit_config, process_m
         assert '--proxyPathPrefix /interactivetool/ep' in gxit_config_contents
 
 
+FAKE_NPM = """#!/bin/sh
+# fake npm install --prefix PREFIX SOURCE ...
+echo "$@" >> "$(dirname "$0")/npm.log"
+while [ "$1" != "--prefix" ]; do shift; done
+mkdir -p "$2/node_modules/@galaxyproject/gx-it-proxy/lib" "$2/node_modules/.bin"
+echo '{"name": "@galaxyproject/gx-it-proxy", "version": "%s"}' > "$2/node_modules/@galaxyproject/gx-it-proxy/package.json"
+touch "$2/node_modules/@galaxyproject/gx-it-proxy/lib/main.js"
+ln -s ../@galaxyproject/gx-it-proxy/lib/main.js "$2/node_modules/.bin/gx-it-proxy"
+"""
+
+
+@pytest.mark.parametrize('process_manager_name', ['supervisor'])
+def test_gxit_install(default_config_manager, galaxy_yml, gxit_config, process_manager_name, tmp_path, monkeypatch):
+    state_dir = default_config_manager.state_dir
+    npm = tmp_path / 'npm'
+    npm.write_text(FAKE_NPM % '0.1.0')
+    npm.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{tmp_path}:{os.environ['PATH']}")
+    gxit_config['gravity']['gx_it_proxy'].update({'install': True, 'version': '0.1.0', 'npm_cache': '/srv/npm-cache'})
+    galaxy_yml.write(json.dumps(gxit_config))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+        pm.update()
+    install_dir = Path(default_config_manager.get_config().gravity_data_dir) / 'gx-it-proxy' / '0.1.0'
+    installed_bin = install_dir / 'node_modules' / '.bin' / 'gx-it-proxy'
+    assert installed_bin.is_symlink()
+    # installed once, offline from the cache
+    npm_log = (tmp_path / 'npm.log').read_text().splitlines()
+    assert len(npm_log) == 1
+    assert npm_log[0].endswith('@galaxyproject/gx-it-proxy@0.1.0 --offline --cache /srv/npm-cache')
+    gxit_config_contents = service_conf_path(state_dir, process_manager_name, 'gx-it-proxy').read_text()
+    assert f'node {installed_bin} --ip localhost' in gxit_config_contents
+    assert 'npx' not in gxit_config_contents
+    # an installed version that does not match the requested version is rejected
+    npm.write_text(FAKE_NPM % '0.0.9')
+    with pytest.raises(ClickException):
+        with process_manager.process_manager(config_manager=default_config_manager) as pm:
+            pm.update(force=True)
+    assert installed_bin.is_symlink()
+
+
 @pytest.mark.parametrize('process_manager_name', ['supervisor', 'systemd'])
 def test_gxit_handler_path_prefix(default_config_manager, galaxy_yml, gxit_config, process_manager_name):
     state_dir = default_config_manager.state_dir
@@ -381,6 +525,261 @@ def test_default_memory_limit(galaxy_yml, default_config_manager):
     assert 'MemoryLimit=2G' in handler0_config_path.open().read()
 
 
+def test_systemd_notify(galaxy_yml, default_config_manager):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+    process_manager_name = 'systemd'
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {
+            'process_manager': process_manager_name,
+            'instance_name': instance_name,
+            'systemd_notify': True}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+    gunicorn_conf = service_conf_path(state_dir, process_manager_name, 'gunicorn').open().read()
+    assert 'Type=notify\nNotifyAccess=all\n' in gunicorn_conf
+    # celery has no readiness check
+    celery_conf = service_conf_path(state_dir, process_manager_name, 'celery').open().read()
+    assert 'Type=simple\n' in celery_conf
+    assert 'NotifyAccess=' not in celery_conf
+
+
+def test_systemd_notify_exec_env(galaxy_yml, default_config_manager, monkeypatch):
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {'process_manager': 'systemd', 'systemd_notify': True}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    execs = []
+    notifiers = []
+    monkeypatch.setenv('NOTIFY_SOCKET', '/run/systemd/notify')
+    monkeypatch.setattr(os, 'chdir', lambda path: None)
+    monkeypatch.setattr(os, 'execvpe', lambda file, args, env: execs.append(env))
+    monkeypatch.setattr(sd_notify.ReadinessNotifier, 'start', lambda self: notifiers.append(self.socket_path))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.exec(instance_names=['gunicorn'])
+    assert notifiers == ['/run/systemd/notify']
+    # only the notifier reports readiness, gunicorn's own READY=1 is sent before Galaxy is loaded
+    assert 'NOTIFY_SOCKET' not in execs[0]
+
+
+def test_systemd_slices(galaxy_yml, default_config_manager):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+    process_manager_name = 'systemd'
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {
+            'process_manager': process_manager_name,
+            'instance_name': instance_name,
+            'systemd_slices': {'instance': {'memory_max': 64}, 'handlers': {'memory_max': 16, 'cpu_weight': 50}},
+            'gunicorn': {'memory_limit': 4},
+            'handlers': {'handler': {}}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+    conf_dir = service_conf_dir(state_dir, process_manager_name)
+    slice_prefix = f"galaxy-{systemd_escape(instance_name)}"
+    instance_slice = (conf_dir / f'{slice_prefix}.slice').open().read()
+    assert 'MemoryMax=64G' in instance_slice
+    handlers_slice = (conf_dir / f'{slice_prefix}-handlers.slice').open().read()
+    assert 'MemoryMax=16G' in handlers_slice
+    assert 'CPUWeight=50' in handlers_slice
+    web_slice = (conf_dir / f'{slice_prefix}-web.slice').open().read()
+    assert 'MemoryMax' not in web_slice
+    gunicorn_conf = service_conf_path(state_dir, process_manager_name, 'gunicorn').open().read()
+    assert f'Slice={slice_prefix}-web.slice' in gunicorn_conf
+    assert 'MemoryMax=4G' in gunicorn_conf
+    assert 'MemoryLimit' not in gunicorn_conf
+    handler_conf = service_conf_path(state_dir, process_manager_name, 'handler', service_type='standalone').open().read()
+    assert f'Slice={slice_prefix}-handlers.slice' in handler_conf
+    # slices are removed when disabled
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {'process_manager': process_manager_name, 'instance_name': instance_name}}))
+    with config_manager.config_manager(state_dir=state_dir) as cm:
+        cm.load_config_file(str(galaxy_yml))
+        with process_manager.process_manager(config_manager=cm) as pm:
+            pm.update()
+    assert not list(conf_dir.glob(f'{slice_prefix}*.slice'))
+    assert 'Slice=' not in service_conf_path(state_dir, process_manager_name, 'gunicorn').open().read()
+
+
+def test_systemd_escape():
+    assert systemd_escape('galaxy-main_1') == 'galaxy\\x2dmain_1'
+    assert systemd_escape('a-b') != systemd_escape('a_b')
+    assert systemd_escape('.hidden/dir') == '\\x2ehidden-dir'
+
+
+@pytest.fixture
+def numa_topology(monkeypatch):
+    monkeypatch.setattr(placement, 'numa_nodes', lambda: {0: '0-3', 1: '4-7'})
+    monkeypatch.setattr(placement, 'which', lambda name: f'/usr/bin/{name}')
+
+
+def test_placement_systemd(galaxy_yml, default_config_manager, numa_topology):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+    process_manager_name = 'systemd'
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {
+            'process_manager': process_manager_name,
+            'service_command_style': 'launch',
+            'instance_name': instance_name,
+            'gunicorn': {'numa_node': 1},
+            'handlers': {'handler': {'processes': 2, 'numa_node': 'auto'}}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+    gunicorn_conf = service_conf_path(state_dir, process_manager_name, 'gunicorn').open().read()
+    assert 'AllowedCPUs=4-7\nNUMAPolicy=bind\nNUMAMask=1\n' in gunicorn_conf
+    gunicorn_spec_path = launch_spec_path(state_dir, instance_name, 'gunicorn', 'gunicorn')
+    assert read_launch_spec(gunicorn_spec_path)['argv'][0] != '/usr/bin/numactl'
+    # handler instances share a unit template, so they are placed by their commands
+    handler_conf_path = service_conf_dir(state_dir, process_manager_name) / f'galaxy-{instance_name}-handler@.service'
+    assert 'AllowedCPUs' not in handler_conf_path.open().read()
+    handler_spec_path = launch_spec_path(state_dir, instance_name, 'standalone', 'handler')
+    for instance_number in (0, 1):
+        argv = read_launch_spec(handler_spec_path, instance_number=instance_number)['argv']
+        assert argv[:4] == ['/usr/bin/numactl', f'--membind={instance_number}', f'--cpunodebind={instance_number}', 'python']
+
+
+def test_placement_supervisor(galaxy_yml, default_config_manager, numa_topology):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+    process_manager_name = 'supervisor'
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {
+            'process_manager': process_manager_name,
+            'service_command_style': 'direct',
+            'instance_name': instance_name,
+            'gunicorn': {'cpus': '0-1'},
+            'celery': {'numa_node': 1, 'cpus': '4,5'},
+            'handlers': {'handler': {'processes': 2, 'numa_node': 'auto'}}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+    gunicorn_conf = service_conf_path(state_dir, process_manager_name, 'gunicorn').open().read()
+    assert 'command         = /usr/bin/taskset --cpu-list 0-1 ' in gunicorn_conf
+    celery_conf = service_conf_path(state_dir, process_manager_name, 'celery').open().read()
+    assert 'command         = /usr/bin/numactl --membind=1 --physcpubind=4,5 ' in celery_conf
+    for process in (0, 1):
+        handler_conf_path = service_conf_path(state_dir, process_manager_name, f'handler_{process}', service_type='standalone')
+        assert f'command         = /usr/bin/numactl --membind={process} --cpunodebind={process} ' in handler_conf_path.open().read()
+
+
+def test_placement_invalid(galaxy_yml, default_config_manager):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'handlers': {'handler': {'numa_node': 'first'}}}}))
+    with pytest.raises(ClickException, match='Invalid NUMA node'):
+        default_config_manager.load_config_file(str(galaxy_yml))
+
+
+def test_restart_policy_systemd(galaxy_yml, default_config_manager):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+    process_manager_name = 'systemd'
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {
+            'process_manager': process_manager_name,
+            'service_command_style': 'launch',
+            'instance_name': instance_name,
+            'restart': {'delay': 5},
+            'gunicorn': {'restart': {'burst': 3, 'interval': 600}}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+    gunicorn_conf = service_conf_path(state_dir, process_manager_name, 'gunicorn').open().read()
+    assert 'StartLimitIntervalSec=600\nStartLimitBurst=3\n' in gunicorn_conf
+    assert 'Restart=always\nRestartSec=5\nRestartSteps=4\nRestartMaxDelaySec=60\n' in gunicorn_conf
+    celery_conf = service_conf_path(state_dir, process_manager_name, 'celery').open().read()
+    assert 'StartLimit' not in celery_conf
+    # restarts are delayed by systemd, not the launcher
+    gunicorn_spec_path = launch_spec_path(state_dir, instance_name, 'gunicorn', 'gunicorn')
+    assert read_launch_spec(gunicorn_spec_path)['restart'] is None
+
+
+def test_restart_policy_supervisor(galaxy_yml, default_config_manager):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+    process_manager_name = 'supervisor'
+    galaxy_yml.write(json.dumps(
+        {'galaxy': None, 'gravity': {
+            'process_manager': process_manager_name,
+            'service_command_style': 'launch',
+            'instance_name': instance_name,
+            'restart': {'delay': 5},
+            'handlers': {'handler': {'processes': 2, 'restart': {'burst': 3}}}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        pm.update()
+    handler_spec_path = launch_spec_path(state_dir, instance_name, 'standalone', 'handler')
+    handler_restart = read_launch_spec(handler_spec_path, instance_number=1)['restart']
+    assert handler_restart['delay'] == 5
+    assert handler_restart['burst'] == 3
+    assert handler_restart['name'] == f'{instance_name}:handler1'
+    assert handler_restart['state_file'].endswith(os.path.join('restarts', instance_name, 'handler1.json'))
+    # parked services exit with PARK_EXIT_CODE after startsecs, which supervisor must not restart
+    assert handler_restart['park_delay'] == 20
+    handler_conf = open(service_conf_path(state_dir, process_manager_name, 'handler', service_type='standalone')).read()
+    assert 'autorestart     = unexpected\n' in handler_conf
+    assert 'exitcodes       = 75\n' in handler_conf
+    assert 'startsecs       = 20\n' in handler_conf
+
+
+def test_fingerprint_changed_services(galaxy_yml, default_config_manager):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+
+    def changed_services(gravity_config, galaxy_config=None):
+        galaxy_yml.write(json.dumps({'galaxy': galaxy_config, 'gravity': {
+            'process_manager': 'supervisor', 'instance_name': instance_name, **gravity_config}}))
+        with config_manager.config_manager(state_dir=state_dir) as cm:
+            cm.load_config_file(str(galaxy_yml))
+            config = cm.get_config()
+            renderer = process_manager.LaunchSpecRenderer(config_manager=cm)
+            if not os.path.exists(fingerprint.fingerprints_path(config)):
+                fingerprint.record(renderer, config, config.services)
+            return sorted(s.service_name for s in fingerprint.changed_services(renderer, config, config.services))
+
+    handlers = {'handler': {'processes': 2}, 'workflow_scheduler': {}}
+    assert changed_services({'handlers': handlers}) == []
+    handlers['handler']['processes'] = 3
+    assert changed_services({'handlers': handlers}) == ['handler']
+    # galaxy config changes affect all services that load it
+    assert changed_services({'handlers': handlers}, {'admin_users': 'admin@example.org'}) == [
+        'celery', 'celery-beat', 'gunicorn', 'handler', 'workflow_scheduler']
+
+
+def test_fingerprint_reloaded_services(galaxy_yml, default_config_manager):
+    state_dir = default_config_manager.state_dir
+    instance_name = os.path.basename(state_dir)
+
+    def load(gunicorn, galaxy_config=None):
+        galaxy_yml.write(json.dumps({'galaxy': galaxy_config, 'gravity': {
+            'process_manager': 'supervisor', 'instance_name': instance_name, 'gunicorn': gunicorn}}))
+        cm = config_manager.ConfigManager(state_dir=state_dir)
+        cm.load_config_file(str(galaxy_yml))
+        return cm.get_config(), process_manager.LaunchSpecRenderer(config_manager=cm)
+
+    config, renderer = load({'bind': 'localhost:8080', 'preload': False})
+    fingerprint.record(renderer, config, config.services)
+    # a galaxy config change is applied by reloading gunicorn
+    config, renderer = load({'bind': 'localhost:8080', 'preload': False}, {'admin_users': 'admin@example.org'})
+    gunicorn = config.get_service('gunicorn')
+    assert gunicorn.graceful_method == GracefulMethod.SIGHUP
+    assert fingerprint.changed_services(renderer, config, [gunicorn]) == [gunicorn]
+    assert fingerprint.record_reloaded(renderer, config, [gunicorn]) == []
+    assert fingerprint.changed_services(renderer, config, [gunicorn]) == []
+    # a reloaded gunicorn keeps its command line, so the new one is not recorded as running
+    config, renderer = load({'bind': 'localhost:8081', 'preload': False}, {'admin_users': 'admin@example.org'})
+    gunicorn = config.get_service('gunicorn')
+    assert fingerprint.record_reloaded(renderer, config, [gunicorn]) == [gunicorn]
+    assert fingerprint.changed_services(renderer, config, [gunicorn]) == [gunicorn]
+    # an unreadable fingerprint is treated as absent, so the service is not recorded as reloaded
+    with open(fingerprint.fingerprints_path(config), 'w') as fh:
+        json.dump({'gunicorn': 'abc123'}, fh)
+    assert fingerprint.read_fingerprints(config) == {}
+    assert fingerprint.record_reloaded(renderer, config, [gunicorn]) == []
+    assert fingerprint.changed_services(renderer, config, [gunicorn]) == [gunicorn]
+
+
 def test_service_memory_limit(galaxy_yml, default_config_manager):
     state_dir = default_config_manager.state_dir
     instance_name = os.path.basename(state_dir)
@@ -0,0 +1,113 @@
+import http.server
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+from click import ClickException
+
+from gravity.state import GracefulMethod
+
+
+@pytest.fixture
+def http_server():
+    server = http.server.HTTPServer(('localhost', 0), http.server.SimpleHTTPRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def handler_pool(galaxy_yml, config_manager, readiness, **settings):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'galaxy_root': str(galaxy_yml.dirpath()),
+        'handlers': {'handler': {'processes': 4, 'readiness': readiness, **settings}}}}))
+    config_manager.load_config_file(str(galaxy_yml))
+    return config_manager.get_config().get_service('handler')
+
+
+def test_heartbeat_readiness(galaxy_yml, default_config_manager):
+    pool = handler_pool(galaxy_yml, default_config_manager, {'check': 'heartbeat', 'path': 'heartbeat_{server_name}.log'})
+    assert pool.graceful_method == GracefulMethod.ROLLING
+    handler = pool.services[1]
+    heartbeat = galaxy_yml.dirpath() / 'heartbeat_handler_1.log'
+    assert not handler.is_ready()
+    heartbeat.write('')
+    assert handler.is_ready()
+    # the heartbeat of the previous process does not count after a restart
+    stale = time.time() - 5
+    os.utime(heartbeat, (stale, stale))
+    probe = handler.readiness_probe()
+    assert not probe.ready()
+    heartbeat.write('')
+    assert probe.ready()
+
+
+def test_log_readiness(galaxy_yml, default_config_manager):
+    pool = handler_pool(galaxy_yml, default_config_manager, {'check': 'log', 'path': 'handler.log', 'marker': 'ready'})
+    handler = pool.services[0]
+    log = galaxy_yml.dirpath() / 'handler.log'
+    log.write('starting\nready\n')
+    assert handler.is_ready()
+    probe = handler.readiness_probe()
+    assert not probe.ready()
+    log.write('starting\n', mode='a')
+    assert not probe.ready()
+    log.write('ready\n', mode='a')
+    assert probe.ready()
+
+
+def test_rolling_restart_batches(galaxy_yml, default_config_manager):
+    pool = handler_pool(
+        galaxy_yml, default_config_manager, {'check': 'settled', 'settle_time': 0}, rolling_restart_batch_size=3)
+    restarted = []
+    pool.rolling_restart([lambda i=i: restarted.append(i) for i in range(pool.count)])
+    assert restarted == [0, 1, 2, 3]
+
+
+def test_no_readiness(galaxy_yml, default_config_manager):
+    pool = handler_pool(galaxy_yml, default_config_manager, None)
+    handler = pool.services[0]
+    assert not handler.has_readiness_check
+    assert pool.graceful_method != GracefulMethod.ROLLING
+    assert handler.is_ready()
+    assert handler.readiness_probe().ready()
+
+
+@pytest.mark.parametrize('readiness', [{'check': 'log', 'path': 'handler.log'}, {'check': 'heartbeat'}, {'check': 'bogus'}])
+def test_invalid_readiness(galaxy_yml, default_config_manager, readiness):
+    with pytest.raises(ClickException):
+        handler_pool(galaxy_yml, default_config_manager, readiness)
+
+
+def test_tusd_rolling_restart(galaxy_yml, default_config_manager, http_server, free_port, monkeypatch, tmp_path):
+    # the test server serves the current directory, so /metrics is found once it exists
+    monkeypatch.chdir(tmp_path)
+    galaxy_yml.write(json.dumps({
+        'galaxy': {'galaxy_infrastructure_url': 'http://localhost:8080'},
+        'gravity': {'tusd': [
+            {'enable': True, 'port': http_server.server_port, 'upload_dir': '/tmp'},
+            {'enable': True, 'port': free_port, 'upload_dir': '/tmp'}]}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    tusd = default_config_manager.get_config().get_service('tusd')
+    assert tusd.graceful_method == GracefulMethod.ROLLING
+    assert not tusd.services[0].is_ready()
+    (tmp_path / 'metrics').write_text('')
+    assert tusd.services[0].is_ready()
+    assert not tusd.services[1].is_ready()
+
+
+def test_gx_it_proxy_ready(galaxy_yml, default_config_manager, free_port):
+    galaxy_yml.write(json.dumps({
+        'galaxy': {'interactivetools_enable': True},
+        'gravity': {'gx_it_proxy': {'enable': True, 'port': free_port}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    gx_it_proxy = default_config_manager.get_config().get_service('gx-it-proxy')
+    assert not gx_it_proxy.is_ready()
+    with socket.socket() as sock:
+        sock.bind(('localhost', free_port))
+        sock.listen()
+        assert gx_it_proxy.is_ready()
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from gravity import process_manager, restart
+from gravity.process_manager.supervisor import SupervisorProcessManager
+
+
+@pytest.fixture
+def policy(tmp_path):
+    return {
+        **restart.restart_policy({"delay": 2, "burst": 4}),
+        "name": "_default_:handler0",
+        "state_file": restart.restart_state_path(str(tmp_path), "_default_", "handler0"),
+    }
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(restart.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_restart_policy_merge():
+    policy = restart.restart_policy({"delay": 5, "burst": None}, {"burst": 3, "max_delay": None})
+    assert policy == {**restart.DEFAULT_RESTART_POLICY, "delay": 5, "burst": 3}
+
+
+def test_backoff_delays_and_parks(policy, sleeps):
+    for _ in range(4):
+        restart.backoff(policy)
+    assert sleeps == [2, 4, 8]
+    with pytest.raises(SystemExit) as exc_info:
+        restart.backoff(policy)
+    assert exc_info.value.code == restart.PARK_EXIT_CODE
+
+
+def test_park_delay(policy, sleeps):
+    policy.update({"burst": 1, "park_delay": 10})
+    restart.backoff(policy)
+    with pytest.raises(SystemExit) as exc_info:
+        restart.backoff(policy)
+    assert exc_info.value.code == restart.PARK_EXIT_CODE
+    assert sleeps == [10]
+
+
+def test_backoff_max_delay_and_interval(policy, sleeps, monkeypatch):
+    policy.update({"burst": 0, "max_delay": 5})
+    now = 1000.0
+    monkeypatch.setattr(restart.time, "time", lambda: now)
+    for _ in range(4):
+        restart.backoff(policy)
+    assert sleeps == [2, 4, 5]
+    # starts outside of the interval are not counted
+    now += policy["interval"] + policy["max_delay"] * 4
+    restart.backoff(policy)
+    assert sleeps == [2, 4, 5]
+
+
+def test_reset(tmp_path, policy, sleeps):
+    other = {**policy, "state_file": restart.restart_state_path(str(tmp_path), "_default_", "gunicorn")}
+    for p in (policy, other, policy, other):
+        restart.backoff(p)
+    assert sleeps == [2, 2]
+    restart.reset(str(tmp_path), "_default_", service_names=["handler0"])
+    restart.backoff(policy)
+    restart.backoff(other)
+    assert sleeps == [2, 2, 4]
+
+
+def test_systemd_restart_steps():
+    assert restart.systemd_restart_steps(restart.DEFAULT_RESTART_POLICY) == 6
+    assert restart.systemd_restart_steps({"delay": 1, "multiplier": 1, "max_delay": 60}) is None
+
+
+def test_graceful_is_not_a_restart_loop(galaxy_yml, default_config_manager, sleeps, monkeypatch):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'process_manager': 'supervisor', 'restart': {'burst': 2}, 'handlers': {'handler': {'processes': 2}}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    config = default_config_manager.get_config()
+    executor = process_manager.ProcessExecutor(config_manager=default_config_manager)
+
+    def supervisorctl(self, op, *args):
+        # supervisord execs the restarted programs, which records their starts
+        if op == 'restart':
+            for instance in config.get_service('handler').services:
+                restart.backoff(executor.exec_spec(config, instance)['restart'])
+
+    monkeypatch.setattr(SupervisorProcessManager, '_SupervisorProcessManager__supervisord_is_running', lambda self: True)
+    monkeypatch.setattr(SupervisorProcessManager, 'supervisorctl', supervisorctl)
+    with process_manager.process_manager(config_manager=default_config_manager) as pm:
+        for _ in range(4):
+            pm.graceful(instance_names=['handler'])
+    assert sleeps == []
@@ -0,0 +1,43 @@
+import socket
+
+from gravity import sd_notify
+from gravity.readiness import ReadinessProbe
+
+
+class ReadyService:
+    service_name = "gunicorn"
+    has_readiness_check = True
+
+    def __init__(self, ready_after):
+        self.settings = {"start_timeout": 0.1, "restart_timeout": 5}
+        self.checks = 0
+        self.ready_after = ready_after
+
+    def readiness_probe(self):
+        return ReadinessProbe(self)
+
+    def is_ready(self, quiet=True):
+        self.checks += 1
+        return self.checks > self.ready_after
+
+
+def test_notifier_reports_ready(tmp_path, monkeypatch):
+    monkeypatch.setattr(sd_notify, "POLL_INTERVAL", 0.05)
+    socket_path = str(tmp_path / "notify.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.bind(socket_path)
+        sock.settimeout(1)
+        service = ReadyService(ready_after=3)
+        sd_notify.ReadinessNotifier(service, socket_path)._run(main_pid=1)
+        messages = []
+        while not messages or not messages[-1].startswith("READY=1"):
+            messages.append(sock.recv(4096).decode())
+    assert service.checks == 4
+    assert messages[0].startswith("STATUS=Waiting")
+    assert "EXTEND_TIMEOUT_USEC=100000" in messages
+    assert messages[-1] == "READY=1\nSTATUS=gunicorn is ready"
+
+
+def test_notify_without_socket(monkeypatch):
+    monkeypatch.delenv("NOTIFY_SOCKET", raising=False)
+    assert sd_notify.notify("READY=1") is False
@@ -0,0 +1,83 @@
+import json
+import os
+import socket
+import sys
+import time
+
+from gravity.startup_profiler import (
+    read_history,
+    service_address,
+    ServiceStartupProfiler,
+    summarize_history,
+)
+
+
+class FakeService:
+    def __init__(self, **settings):
+        self.settings = settings
+
+
+def record(service_name, galaxy_version, ready, port_bind=None):
+    return {"service_name": service_name, "galaxy_version": galaxy_version, "ready": ready, "port_bind": port_bind}
+
+
+def test_summarize_history_flags_regressions():
+    records = [
+        record("gunicorn", "23.1", 10.0),
+        record("gunicorn", "23.1", 12.0),
+        record("gunicorn", "24.0", 20.0),
+        record("handler0", "23.1", None, port_bind=None),
+        record("handler0", "24.0", None, port_bind=None),
+    ]
+    summary = summarize_history(records)
+    assert [(s["service_name"], s["galaxy_version"], s["starts"], s["ready"], s["regression"]) for s in summary] == [
+        ("gunicorn", "23.1", 2, 11.0, False),
+        ("gunicorn", "24.0", 1, 20.0, True),
+        ("handler0", "23.1", 1, None, False),
+        ("handler0", "24.0", 1, None, False),
+    ]
+
+
+def test_service_address():
+    assert service_address(FakeService(bind="localhost:8080")) == (socket.AF_INET, ("localhost", 8080))
+    assert service_address(FakeService(bind="unix:/run/gunicorn.sock")) == (socket.AF_UNIX, "/run/gunicorn.sock")
+    assert service_address(FakeService(bind="[::1]:8080")) == (socket.AF_INET6, ("::1", 8080))
+    assert service_address(FakeService(host="0.0.0.0", port=1080)) == (socket.AF_INET, ("0.0.0.0", 1080))
+    assert service_address(FakeService(ip="localhost", port=4002)) == (socket.AF_INET, ("localhost", 4002))
+    assert service_address(FakeService(bind="fd://3")) is None
+    assert service_address(FakeService(server_name="handler0")) is None
+
+
+def test_profile_exec(galaxy_yml, default_config_manager, tmp_path):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'startup_profiler': 'timing', 'handlers': {'handler': {}}}}))
+    default_config_manager.load_config_file(str(galaxy_yml))
+    config = default_config_manager.get_config()
+    handler = config.get_service('handler').get_service_instance(0)
+    output = tmp_path / 'output'
+    # prepare and start are called by the process that execs the service, which is the forked child here
+    pid = os.fork()
+    if pid == 0:
+        try:
+            with open(output, 'wb') as fh:
+                os.dup2(fh.fileno(), 1)
+                os.dup2(fh.fileno(), 2)
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            profiler = ServiceStartupProfiler(config, handler, instance_number=0)
+            cmd, env = profiler.prepare(['echo', 'started'], dict(os.environ))
+            profiler.start()
+            os.execvpe(cmd[0], cmd, env)
+        finally:
+            os._exit(1)
+    assert os.waitpid(pid, 0)[1] == 0
+    # the record is written by the detached observer once the service's output closes
+    deadline = time.time() + 10
+    while not read_history(config) and time.time() < deadline:
+        time.sleep(0.1)
+    records = read_history(config)
+    assert len(records) == 1
+    assert records[0]['service_name'] == 'handler0'
+    assert records[0]['profiler'] == 'timing'
+    assert records[0]['first_output'] is not None
+    assert records[0]['ready'] is None
+    assert output.read_text() == 'started\n'
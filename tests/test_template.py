@@ -0,0 +1,53 @@
+import pytest
+from click import ClickException
+
+from gravity.template import compile_template
+
+
+def test_compile_template():
+    template = compile_template("{virtualenv_bin}gunicorn -b {settings[bind]} {command_arguments[preload]:>10}")
+    assert template is compile_template(template.source)
+    assert template.fields == ("virtualenv_bin", "settings[bind]", "command_arguments[preload]")
+    assert template.names == {"virtualenv_bin", "settings", "command_arguments"}
+    format_vars = {"virtualenv_bin": "", "settings": {"bind": "localhost:8080"}, "command_arguments": {"preload": "--preload"}}
+    assert template.render(format_vars) == "gunicorn -b localhost:8080  --preload"
+
+
+def test_render_undefined_fields():
+    template = compile_template("{galaxy_root} {settings[bind]} {settings[workers]}")
+    assert template.undefined_fields({"settings": {"bind": "localhost:8080"}}) == ["galaxy_root", "settings[workers]"]
+    with pytest.raises(ClickException, match=r"Undefined field\(s\) in gunicorn command: galaxy_root, settings\[workers\]"):
+        template.render({"settings": {"bind": "localhost:8080"}}, name="gunicorn command")
+
+
+def test_positional_fields_not_allowed():
+    with pytest.raises(ValueError):
+        compile_template("gunicorn {}")
+
+
+@pytest.mark.parametrize("source", [
+    "{a!r:>10} {{literal}} {b[0].real:{width}}",
+    "'quoted' \"and\" \\backslashed\\\n{a}",
+    "{settings[0]} {settings[bind]}",
+    "",
+])
+def test_render_matches_format(source):
+    format_vars = {"a": "a", "b": [3], "width": 5, "settings": {0: "zero", "bind": "localhost:8080"}}
+    assert compile_template(source).render(format_vars) == source.format_map(format_vars)
+
+
+def test_compile_time_check():
+    source = "{galaxy_root} {settings[bind]} {unknown} {unknown[key]}"
+    assert compile_template(source, names=frozenset(("galaxy_root", "settings", "unknown")))
+    with pytest.raises(ClickException, match=r"Undefined field\(s\) in gunicorn command: unknown, unknown\[key\]"):
+        compile_template(source, names=frozenset(("galaxy_root", "settings")), name="gunicorn command")
+
+
+def test_render_many():
+    template = compile_template("{server_name} {settings[bind]}")
+    format_vars_list = [{"server_name": f"gunicorn{i}", "settings": {"bind": f"localhost:{8080 + i}"}} for i in range(3)]
+    assert template.render_many(format_vars_list) == [
+        "gunicorn0 localhost:8080", "gunicorn1 localhost:8081", "gunicorn2 localhost:8082"]
+    del format_vars_list[1]["settings"]["bind"]
+    with pytest.raises(ClickException, match=r"Undefined field\(s\) in gunicorn1: settings\[bind\]"):
+        template.render_many(format_vars_list, names=["gunicorn0", "gunicorn1", "gunicorn2"])
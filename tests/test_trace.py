@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from gravity import trace
+from gravity.cli import galaxyctl
+
+
+@pytest.fixture(autouse=True)
+def reset_trace():
+    yield
+    trace.reset()
+
+
+def test_spans_nest():
+    with trace.span("before enable"):
+        pass
+    trace.enable()
+    with trace.span("outer", instance="galaxy"):
+        with trace.span("inner"):
+            pass
+        with trace.span("inner"):
+            pass
+    recorded = trace.spans()
+    assert [(s.name, s.depth) for s in recorded] == [("outer", 0), ("inner", 1), ("inner", 1)]
+    assert recorded[0].args == {"instance": "galaxy"}
+    assert recorded[0].start <= recorded[1].start and recorded[2].end <= recorded[0].end
+
+
+def test_chrome_trace(tmp_path):
+    trace.enable()
+    with trace.span("outer"):
+        with trace.span("inner", service="gunicorn"):
+            pass
+    path = tmp_path / "trace.json"
+    trace.write_chrome_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [e["name"] for e in events] == ["outer", "inner"]
+    assert all(e["ph"] == "X" for e in events)
+    assert events[0]["ts"] == 0
+    assert events[1]["args"] == {"service": "gunicorn"}
+
+
+def test_profile_option(galaxy_yml, tmp_path):
+    galaxy_yml.write(json.dumps({"galaxy": None, "gravity": {"process_manager": "supervisor"}}))
+    trace_file = tmp_path / "trace.json"
+    runner = CliRunner()
+    result = runner.invoke(galaxyctl, [
+        "--profile", "--trace-file", str(trace_file), "--config-file", str(galaxy_yml), "--state-dir", str(tmp_path),
+        "list"])
+    assert result.exit_code == 0, result.output
+    assert "Timing (ms):" in result.output
+    assert "load config file" in result.output
+    names = {e["name"] for e in json.loads(trace_file.read_text())["traceEvents"]}
+    assert {"galaxyctl", "import gravity.cli", "import command", "load config file"} <= names
+    assert not trace.enabled()
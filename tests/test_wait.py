@@ -0,0 +1,34 @@
+import threading
+import time
+
+import pytest
+
+from gravity import wait
+
+
+@pytest.fixture(params=["inotify", "poll"])
+def watch_method(request, monkeypatch):
+    if request.param == "poll":
+        monkeypatch.setattr(wait, "_libc", False)
+    elif not wait._inotify_libc():
+        pytest.skip("inotify is unavailable")
+    return request.param
+
+
+def test_wait_for_file(tmp_path, watch_method):
+    path = tmp_path / "supervisord.pid"
+    timer = threading.Timer(0.2, path.write_text, args=("1",))
+    timer.start()
+    start = time.time()
+    try:
+        assert wait.wait_for(path.exists, str(tmp_path), timeout=5)
+    finally:
+        timer.join()
+    # with inotify, waiting ends on the creation event rather than the periodic recheck
+    assert time.time() - start < (0.4 if watch_method == "inotify" else 1)
+
+
+def test_wait_for_timeout(tmp_path, watch_method):
+    start = time.time()
+    assert not wait.wait_for(lambda: False, str(tmp_path), timeout=0.2)
+    assert 0.2 <= time.time() - start < 1